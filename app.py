@@ -1,20 +1,21 @@
 import streamlit as st
-import sqlite3
-from datetime import datetime, date
-import pandas as pd
-import plotly.express as px
-
-# Import pages
-import pages.notes
-import pages.reminders
-import pages.dashboard
-import pages.teams_members
-import pages.projects_tasks
-import pages.connections
+import importlib
 import utils.database as db
+from utils import profiling, maintenance, critical_path
+from utils.scheduler import get_scheduler
 
-# Initialize the database
-db.init_db()
+# Create and migrate the database, once per process
+db.ensure_db()
+
+# Backups, statistics and archiving run in the background (once per process)
+if maintenance.MAINTENANCE_ENABLED:
+    maintenance.get_service()
+
+# Critical path schedules follow task and dependency changes in the background
+critical_path.get_refresher()
+
+# Due reminders go out to the notifiers without waiting for a page to ask
+get_scheduler()
 
 # Page configuration
 st.set_page_config(
@@ -27,20 +28,63 @@ st.set_page_config(
 st.sidebar.title("ProjectForge")
 st.sidebar.image("https://img.icons8.com/color/96/000000/project-management.png", width=100)
 
-# Main navigation
+# Main navigation. Pages are imported when first shown, so a rerun only
+# pays for the page on screen and its dependencies (pandas, plotly, ...)
 pages = {
-    "Dashboard": pages.dashboard,
-    "Teams & Members": pages.teams_members,
-    "Projects & Tasks": pages.projects_tasks,
-    "Notes": pages.notes,
-    "Reminders": pages.reminders,
-    "Manage Connections": pages.connections
+    "Dashboard": "pages.dashboard",
+    "Teams & Members": "pages.teams_members",
+    "Projects & Tasks": "pages.projects_tasks",
+    "Notes": "pages.notes",
+    "Reminders": "pages.reminders",
+    "Manage Connections": "pages.connections"
+}
+
+# Pages left out of the navigation, opened with ?page=<name>
+hidden_pages = {
+    "performance": "pages.performance"
 }
 
-selection = st.sidebar.radio("Navigate to", list(pages.keys()))
+def open_project(project_id, project_name):
+    """Jump from a search result to its project"""
+    st.session_state.nav = "Projects & Tasks"
+    st.session_state.view = "detail"
+    st.session_state.selected_project_id = project_id
+    st.session_state.selected_project_name = project_name
+    st.session_state.global_search = ""
+
+def show_search_results(text):
+    """Show the global search results above the current page"""
+    results = db.search(text)
+    st.subheader(f"Search results for: {text}")
+    if not results:
+        st.info("No matches found.")
+    for kind, id, title, snippet, project_id, project_name in results:
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            st.markdown(f"**{kind}** · {title or ''}" + (f" · _{project_name}_" if project_name else ""))
+            st.markdown(snippet)
+        with col2:
+            if project_id is not None:
+                st.button("Open project", key=f"search_open_{kind}_{id}",
+                          on_click=open_project, args=(project_id, project_name))
+    st.markdown("---")
+
+# Global search over tasks, notes, reminders and activity
+search_text = st.sidebar.text_input("🔍 Search", key="global_search", placeholder="Tasks, notes, reminders...")
+
+selection = st.sidebar.radio("Navigate to", list(pages.keys()), key="nav")
+
+page_name, page_module = selection, pages[selection]
+if st.query_params.get("page") in hidden_pages:
+    page_name = st.query_params["page"]
+    page_module = hidden_pages[page_name]
+
+# Display the selected page, timing the whole render for the Performance page
+with profiling.page_timer(page_name):
+    if search_text.strip():
+        show_search_results(search_text.strip())
 
-# Display the selected page
-pages[selection].app()
+    importlib.import_module(page_module).app()
 
 # Footer
 st.sidebar.markdown("---")
@@ -0,0 +1,262 @@
+"""
+Time ProjectForge's data-access paths against synthetic data at several scales.
+
+For every scale a fresh database is generated with generate_data.py (same
+seed, so the same rows every run) and a separate interpreter times the
+functions the pages call, bypassing the read-through cache: the
+dashboard's progress aggregation and timeline, the project list's cards
+and counts, the team rosters with their task lists, notes and search,
+and rescheduling the critical path of every project or of one.
+With --pages the pages themselves are also rendered with Streamlit's
+AppTest, first run and cached reruns.
+
+Results are written as JSON, so runs can be compared; --compare prints
+the change against an earlier result file and fails if any workload got
+slower than --threshold.
+
+Usage (from the repository root):
+
+    python benchmarks/data_access.py [--scales 100,1000,5000] [--repeat 20]
+        [--pages] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ["Dashboard", "Teams & Members", "Projects & Tasks"]
+
+def workloads(db) -> List[tuple]:
+    """(name, page, call) for every timed data-access path, with sample ids picked from the data"""
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        busiest_member = conn.execute(
+            "SELECT assigned_to FROM tasks WHERE assigned_to IS NOT NULL "
+            "GROUP BY assigned_to ORDER BY COUNT(*) DESC, assigned_to LIMIT 1").fetchone()[0]
+        team_members = [member_id for member_id, in conn.execute(
+            "SELECT id FROM team_members WHERE team_id = (SELECT team_id FROM team_members WHERE id = ?)",
+            (busiest_member,))]
+        project_id = conn.execute("SELECT id FROM projects ORDER BY id LIMIT 1 OFFSET "
+                                  "(SELECT COUNT(*) / 2 FROM projects)").fetchone()[0]
+        task_id = conn.execute("SELECT task_id FROM notes GROUP BY task_id "
+                               "ORDER BY COUNT(*) DESC, task_id LIMIT 1").fetchone()[0]
+        project_count = conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+    finally:
+        conn.close()
+    # The dashboard's default range is everything
+    bounds = [date.fromisoformat(day[:10]) for day in db.get_timeline_bounds.uncached()]
+
+    def uncached(func: Callable) -> Callable:
+        return getattr(func, "uncached", func)
+
+    from utils import critical_path
+
+    def reschedule_project():
+        # What a task edit costs: the project is queued, then rescheduled
+        db.execute_write("INSERT OR IGNORE INTO schedule_dirty (project_id) VALUES (?)", (project_id,))
+        return critical_path.refresh()
+
+    return [
+        ("timeline_bounds", "Dashboard", lambda: uncached(db.get_timeline_bounds)()),
+        ("timeline", "Dashboard", lambda: uncached(db.get_timeline)(*bounds)),
+        ("task_status_counts", "Dashboard", lambda: uncached(db.get_task_status_counts)()),
+        ("member_task_details", "Dashboard", lambda: uncached(db.get_member_task_details)([busiest_member])),
+        ("recent_activity", "Dashboard", lambda: uncached(db.get_recent_activity_logs)(limit=10)),
+        ("count_projects", "Projects & Tasks", lambda: uncached(db.count_projects)()),
+        ("project_cards_first_page", "Projects & Tasks",
+         lambda: uncached(db.get_project_summaries)(limit=20, offset=0)),
+        ("project_cards_last_page", "Projects & Tasks",
+         lambda: uncached(db.get_project_summaries)(limit=20, offset=max(0, project_count - 20))),
+        ("project_activity", "Projects & Tasks", lambda: uncached(db.get_project_activity_logs)(project_id)),
+        ("team_members", "Projects & Tasks", lambda: uncached(db.get_team_members)()),
+        ("team_rosters", "Teams & Members", lambda: uncached(db.get_team_rosters)()),
+        ("team_task_details", "Teams & Members", lambda: uncached(db.get_member_task_details)(team_members)),
+        ("task_notes_first_page", "Notes", lambda: uncached(db.get_task_notes)(task_id)),
+        ("task_search", "Notes", lambda: uncached(db.search_tasks)("api")),
+        ("global_search", "Search", lambda: uncached(db.search)("release")),
+        ("schedule_full_refresh", "Dashboard", lambda: critical_path.refresh(full=True)),
+        ("schedule_project_refresh", "Dashboard", reschedule_project),
+    ]
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    """Milliseconds statistics of some timings in seconds"""
+    ordered = sorted(times)
+    return {
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+def bench_workloads(db, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for name, page, call in workloads(db):
+        # One untimed call warms SQLite's page cache and statement cache
+        result = call()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+        rows = len(result) if hasattr(result, "__len__") else 1
+        results.append({"name": name, "page": page, "rows": rows, **summarize(times)})
+    return results
+
+def bench_pages(repeat: int) -> List[Dict[str, Any]]:
+    from streamlit.testing.v1 import AppTest
+    from utils import profiling
+
+    results = []
+    for page in PAGES:
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+        app.session_state["nav"] = page
+        start = time.perf_counter()
+        app.run()
+        first = time.perf_counter() - start
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            app.run()
+            times.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(f"{page} failed: {app.exception[0].value}")
+        stats = next((entry for entry in profiling.page_stats() if entry["page"] == page), None)
+        results.append({
+            "page": page,
+            "first_run_ms": first * 1000,
+            "queries_per_render": stats["queries"] / stats["renders"] if stats else None,
+            **{f"rerun_{key}": value for key, value in summarize(times).items()},
+        })
+    return results
+
+def run_worker(projects: int, seed: int, repeat: int, pages: bool) -> Dict[str, Any]:
+    """Generate one scale into PROJECTFORGE_DB_PATH and time it (runs in its own interpreter)"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import utils.database as db
+    from generate_data import generate
+
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH, isolation_level=None)
+    start = time.perf_counter()
+    try:
+        rows = generate(conn, projects, seed)
+    finally:
+        conn.close()
+    result = {
+        "projects": projects,
+        "rows": rows,
+        "generate_seconds": time.perf_counter() - start,
+        "database_bytes": os.path.getsize(db.DB_PATH),
+        "workloads": bench_workloads(db, repeat),
+    }
+    if pages:
+        result["pages"] = bench_pages(max(1, repeat // 4))
+    return result
+
+def run_scale(projects: int, seed: int, repeat: int, pages: bool) -> Dict[str, Any]:
+    """Run one scale in a fresh interpreter against a scratch database"""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, "PYTHONPATH": ROOT, "PROJECTFORGE_DB_PATH": os.path.join(workdir, "bench.db"),
+               # Background maintenance would skew the timings
+               "PROJECTFORGE_MAINTENANCE": "0"}
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--scales", str(projects),
+                   "--seed", str(seed), "--repeat", str(repeat)] + (["--pages"] if pages else [])
+        # The worker prints its result as the last line; the rest is logging
+        result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(f"Scale {projects} failed:\n{result.stderr}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def print_summary(report: Dict[str, Any]):
+    for scale in report["scales"]:
+        print(f"\n{scale['projects']} projects, {sum(scale['rows'].values())} rows "
+              f"(generated in {scale['generate_seconds']:.1f} s)", file=sys.stderr)
+        print(f"{'workload':<28}{'rows':>8}{'median ms':>12}{'p95 ms':>10}", file=sys.stderr)
+        for entry in scale["workloads"]:
+            print(f"{entry['name']:<28}{entry['rows']:>8}{entry['median_ms']:>12.3f}{entry['p95_ms']:>10.3f}",
+                  file=sys.stderr)
+        for entry in scale.get("pages", []):
+            print(f"page {entry['page']:<23}{'':>8}{entry['rerun_median_ms']:>12.1f}"
+                  f"  (first run {entry['first_run_ms']:.0f} ms)", file=sys.stderr)
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Print median changes against a baseline report; False if any is over the threshold"""
+    before = {(scale["projects"], entry["name"]): entry["median_ms"]
+              for scale in baseline["scales"] for entry in scale["workloads"]}
+    ok = True
+    print(f"\n{'projects':>8}  {'workload':<28}{'before ms':>11}{'after ms':>10}{'change':>9}", file=sys.stderr)
+    for scale in report["scales"]:
+        for entry in scale["workloads"]:
+            old = before.get((scale["projects"], entry["name"]))
+            if not old:
+                continue
+            change = entry["median_ms"] / old - 1
+            flag = ""
+            if change > threshold:
+                ok, flag = False, "  slower"
+            print(f"{scale['projects']:>8}  {entry['name']:<28}{old:>11.3f}{entry['median_ms']:>10.3f}"
+                  f"{change:>+9.0%}{flag}", file=sys.stderr)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="100,1000,5000", help="comma-separated project counts")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the generated data")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per workload")
+    parser.add_argument("--pages", action="store_true", help="also render the pages with AppTest")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown for --compare (0.2 = 20%%)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [int(value) for value in args.scales.split(",")]
+
+    if args.worker:
+        print(json.dumps(run_worker(scales[0], args.seed, args.repeat, args.pages)))
+        return
+
+    report = {
+        "benchmark": "data_access",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "scales": [run_scale(projects, args.seed, args.repeat, args.pages) for projects in scales],
+    }
+    print_summary(report)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Fill a ProjectForge database with synthetic, reproducible data.
+
+Everything is derived from one seeded random generator, so the same
+arguments always produce the same rows. Volumes scale with the number of
+projects; the per-project ratios below are roughly those of a busy team.
+Rows are inserted with executemany in a single transaction, with the
+schema's triggers (search index, task counts) firing as they do in use.
+Tasks get durations, and the phases of a project and some of the tasks
+within a phase are chained by dependencies, for the critical path.
+
+Usage (from the repository root; the database is PROJECTFORGE_DB_PATH,
+data/projectforge.db by default):
+
+    python benchmarks/generate_data.py --projects 1000 [--seed 42] [--append]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Rows per project (or per task for notes and reminders)
+MEMBERS_PER_TEAM = 8
+PROJECTS_PER_TEAM = 10
+SUB_PROJECTS_PER_PROJECT = 3
+TASKS_PER_SUB_PROJECT = 6
+TASKS_PER_PROJECT = 4
+NOTES_PER_TASK = 3
+REMINDERS_PER_TASK = 0.5
+ACTIVITY_PER_PROJECT = 40
+# Share of tasks in a sub-project that wait for the task before them
+TASK_DEPENDENCY_RATE = 0.5
+
+STATUSES = ["not started", "started", "in progress", "blocked", "waiting", "completed"]
+STATUS_WEIGHTS = [20, 10, 30, 5, 5, 30]
+WORDS = ("api billing cache deploy design docs export import login mobile onboarding payment "
+         "report review search security settings sync upload dashboard migration release").split()
+FIRST_NAMES = "Ada Alan Barbara Claude Dennis Edsger Frances Grace John Ken Linus Margaret Niklaus Radia".split()
+LAST_NAMES = "Hopper Kay Liskov Lovelace Perlman Ritchie Shannon Thompson Torvalds Turing Wirth".split()
+LOCATIONS = ["Berlin", "Lisbon", "Remote", "Toronto", "Singapore"]
+ACTIONS = ["create", "update", "delete"]
+ENTITIES = ["project", "subproject", "task", "note", "reminder"]
+
+EPOCH = date(2023, 1, 1)
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _span(rng: random.Random, start: date, max_days: int):
+    """A random (start, end) ISO date pair starting within max_days of start"""
+    begin = start + timedelta(days=rng.randrange(max_days))
+    return begin.isoformat(), (begin + timedelta(days=rng.randrange(7, 180))).isoformat()
+
+def generate(conn: sqlite3.Connection, projects: int, seed: int = 42) -> Dict[str, int]:
+    """
+    Insert a synthetic data set of about `projects` projects into conn
+
+    The schema must already exist. Returns the number of rows inserted per
+    table.
+    """
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    counts: Dict[str, int] = {}
+
+    def insert(table: str, columns: str, rows) -> range:
+        """Insert rows and return the ids they got"""
+        rows = list(rows)
+        placeholders = ", ".join("?" * len(columns.split(",")))
+        cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+        counts[table] = counts.get(table, 0) + len(rows)
+        # Rows inserted by one statement get consecutive ids; with
+        # AUTOINCREMENT they don't necessarily start after MAX(id)
+        last = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return range(last - len(rows) + 1, last + 1)
+
+    cursor.execute("BEGIN")
+    teams = insert("teams", "name, description, location", (
+        (f"Team {i + 1}", _phrase(rng, 6), rng.choice(LOCATIONS))
+        for i in range(max(1, projects // PROJECTS_PER_TEAM))
+    ))
+    members = insert("team_members", "first_name, last_name, email, team_id", (
+        (first, last, f"{first}.{last}.{team_id}.{i}@example.com".lower(), team_id)
+        for team_id in teams
+        for i in range(MEMBERS_PER_TEAM)
+        for first, last in [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))]
+    ))
+
+    def assignee():
+        # Some work is never assigned
+        return rng.choice(members) if rng.random() < 0.9 else None
+
+    project_rows = [
+        (f"Project {i + 1}: {_phrase(rng, 2)}", _phrase(rng, 30), *_span(rng, EPOCH, 700), assignee())
+        for i in range(projects)
+    ]
+    project_ids = insert("projects", "name, description, start_date, end_date, assigned_to", project_rows)
+    sub_rows = [
+        (project_id, f"Phase {i + 1}: {_phrase(rng, 2)}", _phrase(rng, 15), *_span(rng, EPOCH, 700), assignee())
+        for project_id in project_ids
+        for i in range(SUB_PROJECTS_PER_PROJECT)
+    ]
+    sub_ids = insert("sub_projects", "project_id, name, description, start_date, end_date, assigned_to", sub_rows)
+
+    task_rows = [
+        (project_id, sub_id, f"{_phrase(rng, 3)} {i + 1}", _phrase(rng, 20),
+         f"PF-{rng.randrange(1, 100000)}" if rng.random() < 0.3 else None,
+         rng.choices(STATUSES, STATUS_WEIGHTS)[0], assignee(), rng.randint(1, 10))
+        for sub_id, (project_id, *_) in zip(sub_ids, sub_rows)
+        for i in range(TASKS_PER_SUB_PROJECT)
+    ] + [
+        (project_id, None, f"{_phrase(rng, 3)} {i + 1}", _phrase(rng, 20), None,
+         rng.choices(STATUSES, STATUS_WEIGHTS)[0], assignee(), rng.randint(1, 10))
+        for project_id in project_ids
+        for i in range(TASKS_PER_PROJECT)
+    ]
+    task_ids = insert("tasks", "project_id, sub_project_id, name, description, jira_ticket, status, assigned_to, "
+                               "duration_days", task_rows)
+
+    # Each phase follows the one before it; tasks of a phase (consecutive
+    # rows) sometimes follow the previous task
+    insert("dependencies", "kind, predecessor_id, successor_id", [
+        ("sub_project", sub_ids[i - 1], sub_ids[i])
+        for i in range(len(sub_ids)) if i % SUB_PROJECTS_PER_PROJECT
+    ] + [
+        ("task", task_ids[i - 1], task_ids[i])
+        for i in range(len(sub_ids) * TASKS_PER_SUB_PROJECT)
+        if i % TASKS_PER_SUB_PROJECT and rng.random() < TASK_DEPENDENCY_RATE
+    ])
+
+    start = datetime.combine(EPOCH, datetime.min.time())
+    insert("notes", "task_id, note, created_at", (
+        (task_id, _phrase(rng, 25), (start + timedelta(minutes=rng.randrange(1_000_000))).isoformat())
+        for task_id in task_ids
+        for _ in range(rng.randrange(NOTES_PER_TASK * 2 + 1))
+    ))
+    insert("reminders", "task_id, reminder_date, note, followed_up", (
+        (task_id, (EPOCH + timedelta(days=rng.randrange(900))).isoformat(), _phrase(rng, 8), int(rng.random() < 0.6))
+        for task_id in task_ids
+        if rng.random() < REMINDERS_PER_TASK
+    ))
+    insert("activity_logs", "timestamp, action_type, entity_type, entity_id, entity_name, description, project_id, "
+                            "project_name", (
+        ((start + timedelta(minutes=rng.randrange(1_000_000))).isoformat(), rng.choice(ACTIONS),
+         rng.choice(ENTITIES), rng.randrange(1, len(task_ids) + 1), _phrase(rng, 3), _phrase(rng, 8),
+         project_id, project_name)
+        for project_id, (project_name, *_) in zip(project_ids, project_rows)
+        for _ in range(ACTIVITY_PER_PROJECT)
+    ))
+    cursor.execute("COMMIT")
+    conn.execute("ANALYZE")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--projects", type=int, default=1000, help="number of projects; other tables scale with it")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--append", action="store_true", help="add to a database that already has projects")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import utils.database as db
+
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH, isolation_level=None)
+    try:
+        if not args.append and conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0]:
+            sys.exit(f"{db.DB_PATH} already has projects; pass --append to add to them")
+        counts = generate(conn, args.projects, args.seed)
+    finally:
+        conn.close()
+    for table, count in counts.items():
+        print(f"{table:<16}{count:>10}")
+
+if __name__ == "__main__":
+    main()
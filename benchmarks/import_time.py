@@ -0,0 +1,118 @@
+"""
+Measure ProjectForge's cold start and per-rerun overhead.
+
+Two numbers matter for a Streamlit app: what a fresh process pays to import
+the app's modules, and what every rerun of app.py costs once they're loaded.
+
+- Import cost: each module is imported in a fresh interpreter with
+  ``-X importtime`` and its cumulative time is read from the report. The
+  "eager" row is everything app.py used to import up front.
+- Reruns: app.py is run with Streamlit's AppTest against a scratch
+  database, once and then repeatedly, for every page; plus the database
+  setup each rerun used to repeat.
+
+Usage (from the repository root):
+
+    python benchmarks/import_time.py [--repeat 5] [--reruns 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = ["Dashboard", "Teams & Members", "Projects & Tasks", "Notes", "Reminders", "Manage Connections"]
+
+MODULES = [
+    "streamlit",
+    "pandas",
+    "plotly.express",
+    "jira",
+    "utils.database",
+    "pages.dashboard",
+    "pages.teams_members",
+    "pages.projects_tasks",
+    "pages.notes",
+    "pages.reminders",
+    "pages.connections",
+]
+
+# What app.py imported before pages were loaded on demand
+EAGER = "streamlit, pandas, plotly.express, pages.notes, pages.reminders, pages.dashboard, " \
+        "pages.teams_members, pages.projects_tasks, pages.connections"
+
+def import_time(statement: str, workdir: str) -> float:
+    """Seconds a fresh interpreter spends importing the modules in statement"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {statement}"],
+        cwd=workdir, env={**os.environ, "PYTHONPATH": ROOT}, capture_output=True, text=True, check=True,
+    )
+    # Lines are "import time: self [us] | cumulative | package"; top-level
+    # imports are the unindented package names
+    total = 0
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            total += int(parts[1])
+    return total / 1e6
+
+def bench_imports(repeat: int, workdir: str):
+    print(f"{'import':<40}{'median s':>10}")
+    for label, statement in [(module, module) for module in MODULES] + [("eager app.py imports", EAGER)]:
+        times = [import_time(statement, workdir) for _ in range(repeat)]
+        print(f"{label:<40}{statistics.median(times):>10.3f}")
+
+def bench_reruns(reruns: int):
+    from streamlit.testing.v1 import AppTest
+
+    print(f"\n{'page':<24}{'first run s':>12}{'rerun median s':>16}")
+    for page in PAGES:
+        # The first run of a session includes importing the page, the
+        # first time any session shows it
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        app.session_state["nav"] = page
+        start = time.perf_counter()
+        app.run()
+        first = time.perf_counter() - start
+        times = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            app.run()
+            times.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(f"{page} failed: {app.exception[0].value}")
+        print(f"{page:<24}{first:>12.3f}{statistics.median(times):>16.3f}")
+
+def bench_init_db(reruns: int):
+    import utils.database as db
+
+    db.ensure_db()
+    for label, func in [("init_db (every rerun before)", db.init_db), ("ensure_db (every rerun now)", db.ensure_db)]:
+        times = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        print(f"{label:<40}{statistics.median(times) * 1000:>10.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--reruns", type=int, default=10, help="reruns timed per page")
+    args = parser.parse_args()
+
+    # app.py keeps its database under data/ in the working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        bench_imports(args.repeat, workdir)
+        sys.path.insert(0, ROOT)
+        os.chdir(workdir)
+        bench_reruns(args.reruns)
+        print()
+        bench_init_db(args.reruns)
+
+if __name__ == "__main__":
+    main()
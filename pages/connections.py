@@ -1,7 +1,9 @@
 import streamlit as st
 import utils.database as db
+from utils import bitbucket, jira_sync
 import json
 import os
+import requests
 
 def app():
     st.header("Manage Connections")
@@ -86,14 +88,12 @@ def app():
         if jira_url and jira_username and jira_api_token:
             if st.button("Test Jira Connection"):
                 try:
-                    # Import Jira library
-                    from jira import JIRA
-                    
-                    # Try to connect
-                    jira = JIRA(
-                        server=jira_url,
-                        basic_auth=(jira_username, jira_api_token)
-                    )
+                    # Reuses the client already connected with these settings
+                    jira = jira_sync.get_client({
+                        "url": jira_url,
+                        "username": jira_username,
+                        "api_token": jira_api_token
+                    })
                     
                     # Get current user to verify connection
                     current_user = jira.myself()
@@ -187,25 +187,18 @@ def app():
         if bitbucket_url and bitbucket_username and bitbucket_app_password and bitbucket_workspace:
             if st.button("Test Bitbucket Connection"):
                 try:
-                    # Import requests library for API calls
-                    import requests
-                    from requests.auth import HTTPBasicAuth
-                    
-                    # Construct API URL to get user info
-                    api_url = f"{bitbucket_url.rstrip('/')}/api/2.0/user"
-                    
-                    # Make API request
-                    response = requests.get(
-                        api_url,
-                        auth=HTTPBasicAuth(bitbucket_username, bitbucket_app_password)
-                    )
-                    
-                    # Check response
-                    if response.status_code == 200:
-                        user_data = response.json()
-                        st.success(f"✅ Connection successful! Connected as {user_data.get('display_name', user_data.get('username', 'Unknown'))}.")
-                    else:
-                        st.error(f"❌ Connection failed: HTTP {response.status_code} - {response.text}")
+                    # Reuses the pooled client for these settings, with timeouts and retries
+                    client = bitbucket.get_client({
+                        "url": bitbucket_url,
+                        "username": bitbucket_username,
+                        "app_password": bitbucket_app_password,
+                        "workspace": bitbucket_workspace,
+                        "repository": bitbucket_repository
+                    })
+                    user_data = client.current_user()
+                    st.success(f"✅ Connection successful! Connected as {user_data.get('display_name', user_data.get('username', 'Unknown'))}.")
+                except requests.HTTPError as e:
+                    st.error(f"❌ Connection failed: HTTP {e.response.status_code} - {e.response.text}")
                 except Exception as e:
                     st.error(f"❌ Connection failed: {str(e)}")
                     st.info("Please check your credentials and try again.")
@@ -1,25 +1,19 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from datetime import date, datetime, timedelta
 import utils.database as db
+from utils import frames
 
 def app():
     st.header("Project Dashboard")
     
     # Get date range of all projects and sub-projects
-    date_range_data = db.execute_query("""
-        SELECT MIN(start_date), MAX(end_date) FROM (
-            SELECT start_date, end_date FROM projects
-            UNION ALL
-            SELECT start_date, end_date FROM sub_projects
-        )
-    """)
+    range_start, range_end = db.get_timeline_bounds()
     
     # Set default date range based on data or fallback to current month
-    if date_range_data and date_range_data[0][0] and date_range_data[0][1]:
-        min_date = datetime.fromisoformat(date_range_data[0][0]).date()
-        max_date = datetime.fromisoformat(date_range_data[0][1]).date()
+    if range_start and range_end:
+        min_date = datetime.fromisoformat(range_start).date()
+        max_date = datetime.fromisoformat(range_end).date()
     else:
         today = date.today()
         min_date = date(today.year, today.month, 1)  # First day of current month
@@ -70,41 +64,32 @@ def app():
         with col2:
             filter_end = st.date_input("End Date", value=filter_end, key="manual_end")
     
-    # Projects & Sub-Projects within date range
-    proj_data = db.execute_query("""
-        SELECT name, start_date, end_date, assigned_to 
-        FROM projects 
-        WHERE (start_date >= ? AND start_date <= ?) 
-           OR (end_date >= ? AND end_date <= ?)
-           OR (start_date <= ? AND end_date >= ?)
-    """, (filter_start.isoformat(), filter_end.isoformat(), 
-          filter_start.isoformat(), filter_end.isoformat(),
-          filter_start.isoformat(), filter_start.isoformat()))
-    
-    subproj_data = db.execute_query("""
-        SELECT name, start_date, end_date, assigned_to 
-        FROM sub_projects 
-        WHERE (start_date >= ? AND start_date <= ?) 
-           OR (end_date >= ? AND end_date <= ?)
-           OR (start_date <= ? AND end_date >= ?)
-    """, (filter_start.isoformat(), filter_end.isoformat(), 
-          filter_start.isoformat(), filter_end.isoformat(),
-          filter_start.isoformat(), filter_start.isoformat()))
-    
+    # Projects & Sub-Projects within date range, with their assignee names
+    # and a second bar from the planned to the projected finish when late
+    # (the schedule is kept current in the background by critical_path)
     rows = []
-    for rec in proj_data + subproj_data:
-        rows.append({"Task": rec[0], "Start": rec[1], "Finish": rec[2], "Member_ID": rec[3]})
-    
-    member_map = dict(db.execute_query("SELECT id, first_name || ' ' || last_name FROM team_members"))
-    
-    for r in rows:
-        r["Member"] = member_map.get(r["Member_ID"], "Unassigned") if r["Member_ID"] else "Unassigned"
+    behind = 0
+    for name, start, finish, member_id, member_name, deviation, projected, slack in db.get_timeline(
+            filter_start, filter_end):
+        row = {"Task": name, "Start": start, "Finish": finish, "Member_ID": member_id,
+               "Member": member_name or "Unassigned", "Schedule": "Planned", "Deviation": deviation or 0,
+               "Slack": slack, "Projected finish": projected}
+        rows.append(row)
+        if deviation and projected and finish and projected > finish:
+            behind += 1
+            rows.append({**row, "Start": finish, "Finish": projected, "Schedule": "Projected delay"})
     
     if rows:
         df = pd.DataFrame(rows)
         df['Start'] = pd.to_datetime(df['Start'])
         df['Finish'] = pd.to_datetime(df['Finish'])
         
+        if behind:
+            st.warning(f"{behind} projects and sub-projects in this range are projected to finish late.")
+        
+        # Imported here so plotly only loads when there's a chart to draw
+        import plotly.express as px
+        
         # Create Gantt chart
         fig = px.timeline(
             df, 
@@ -112,6 +97,9 @@ def app():
             x_end="Finish", 
             y="Member", 
             color="Task", 
+            pattern_shape="Schedule",
+            pattern_shape_map={"Planned": "", "Projected delay": "/"},
+            hover_data=["Deviation", "Slack", "Projected finish"],
             title="Project Timeline"
         )
         
@@ -137,69 +125,25 @@ def app():
     st.subheader("Team Member Progress")
     
     # Get all team members
-    all_members = db.execute_query("SELECT id, first_name || ' ' || last_name as name FROM team_members")
+    all_members = db.get_team_members()
     member_map = {id: name for id, name in all_members}
 
-    # Get task progress data with more detailed query
-    progress_data = db.execute_query("""
-        SELECT 
-            t.assigned_to, 
-            t.status, 
-            COUNT(*) as task_count,
-            GROUP_CONCAT(t.name, ', ') as task_names
-        FROM tasks t
-        GROUP BY t.assigned_to, t.status
-    """)
+    # Task counts per member and status, kept up to date by the database
+    progress_data = db.get_task_status_counts()
 
     # Initialize progress dictionary with all members
     progress = {}
     for member_id, name in all_members:
-        progress[member_id] = {
-            "name": name, 
-            "total": 0, 
-            "completed": 0,
-            "tasks": {
-                "not started": [],
-                "started": [],
-                "in progress": [],
-                "blocked": [],
-                "waiting": [],
-                "completed": []
-            }
-        }
+        progress[member_id] = {"name": name, "total": 0, "completed": 0}
 
     # Add "Unassigned" category
-    progress[None] = {
-        "name": "Unassigned", 
-        "total": 0, 
-        "completed": 0,
-        "tasks": {
-            "not started": [],
-            "started": [],
-            "in progress": [],
-            "blocked": [],
-            "waiting": [],
-            "completed": []
-        }
-    }
+    progress[None] = {"name": "Unassigned", "total": 0, "completed": 0}
 
-    # Fill in task data
-    for member_id, status, count, task_names in progress_data:
+    # Fill in task counts
+    for member_id, status, count in progress_data:
         if member_id not in progress:
             # This shouldn't happen, but just in case
-            progress[member_id] = {
-                "name": member_map.get(member_id, "Unknown"), 
-                "total": 0, 
-                "completed": 0,
-                "tasks": {
-                    "not started": [],
-                    "started": [],
-                    "in progress": [],
-                    "blocked": [],
-                    "waiting": [],
-                    "completed": []
-                }
-            }
+            progress[member_id] = {"name": member_map.get(member_id, "Unknown"), "total": 0, "completed": 0}
         
         # Add to total count
         progress[member_id]["total"] += count
@@ -207,14 +151,22 @@ def app():
         # Add to completed count if status is completed
         if status == "completed":
             progress[member_id]["completed"] += count
-        
-        # Add task names to the appropriate status list
-        if task_names:
-            status_key = status.lower() if status else "not started"
-            if status_key not in progress[member_id]["tasks"]:
-                progress[member_id]["tasks"][status_key] = []
-            
-            progress[member_id]["tasks"][status_key].extend(task_names.split(", "))
+
+    # Task details are only loaded for members whose task list is switched
+    # on, with one query for all of them that is then split per member
+    detail_columns = {'task': 'Task', 'project': 'Project', 'sub_project': 'Sub-Project', 'status': 'Status',
+                      'jira_ticket': 'Jira', 'description': 'Description'}
+    shown_members = [member_id for member_id in progress 
+                     if st.session_state.get(f"member_tasks_{member_id}")]
+    member_task_frames = {}
+    if shown_members:
+        # Typed and shared with later reruns, so it's only read from here
+        detail_df = db.get_member_task_details(shown_members)
+        # 0 stands in for unassigned so the group keys stay integers
+        member_task_frames = {
+            member_id: group[list(detail_columns)].rename(columns=detail_columns)
+            for member_id, group in detail_df.groupby(detail_df['assigned_to'].fillna(0), sort=False)
+        }
 
     # Display progress for all members
     for member_id, data in progress.items():
@@ -232,58 +184,24 @@ def app():
                 st.progress(int(pct))
                 st.write(f"{pct:.1f}% completed")
                 
-                # Get all tasks for this member with more details
-                member_tasks = db.execute_query("""
-                    SELECT 
-                        t.name as 'Task', 
-                        p.name as 'Project',
-                        sp.name as 'Sub-Project',
-                        t.status as 'Status',
-                        t.jira_ticket as 'Jira',
-                        t.description as 'Description'
-                    FROM tasks t
-                    LEFT JOIN projects p ON t.project_id = p.id
-                    LEFT JOIN sub_projects sp ON t.sub_project_id = sp.id
-                    WHERE t.assigned_to = ?
-                    ORDER BY 
-                        CASE 
-                            WHEN t.status = 'completed' THEN 2
-                            ELSE 1
-                        END,
-                        p.name, 
-                        sp.name
-                """, (member_id,))
-                
-                if member_tasks:
-                    # Convert to DataFrame
-                    df_columns = ['Task', 'Project', 'Sub-Project', 'Status', 'Jira', 'Description']
-                    df = pd.DataFrame(member_tasks, columns=df_columns)
-                    
-                    # Replace None values with '-'
-                    df = df.fillna('-')
-                    
-                    # Truncate long descriptions
-                    df['Description'] = df['Description'].apply(lambda x: (x[:50] + '...') if len(x) > 50 else x)
-                    
-                    # Apply styling to the dataframe
-                    def highlight_status(val):
-                        if val == 'completed':
-                            return 'background-color: #e6ffe6'
-                        elif val == 'blocked':
-                            return 'background-color: #ffcccc'
-                        elif val == 'waiting':
-                            return 'background-color: #ffe6cc'
-                        elif val == 'in progress':
-                            return 'background-color: #e6f7ff'
-                        return ''
-                    
-                    # Apply the styling
-                    styled_df = df.style.applymap(highlight_status, subset=['Status'])
+                # The task table is only built once it has been asked for
+                if st.toggle("Show tasks", key=f"member_tasks_{member_id}"):
+                    member_tasks = member_task_frames.get(member_id or 0)
                     
-                    # Display the DataFrame
-                    st.dataframe(styled_df, use_container_width=True)
-                else:
-                    st.info("No detailed task information available.")
+                    if member_tasks is not None:
+                        # Replace None values with '-'
+                        df = frames.fill_missing(member_tasks, '-')
+                        
+                        # Truncate long descriptions
+                        df['Description'] = frames.truncate(df['Description'], 50)
+                        
+                        # Color the status column
+                        styled_df = frames.style_status(df)
+                        
+                        # Display the DataFrame
+                        st.dataframe(styled_df, use_container_width=True, hide_index=True)
+                    else:
+                        st.info("No detailed task information available.")
             else:
                 st.progress(0)
                 st.write("No tasks assigned")
@@ -293,6 +211,25 @@ def app():
     # Recent Activity
     st.header("Recent Activity")
     
+    # Activity trend, read from the hourly/daily rollups
+    granularity = st.radio("Activity per", ["Day (last 90 days)", "Hour (last 48 hours)"],
+                           horizontal=True, key="activity_trend_period")
+    if granularity.startswith("Day"):
+        trend = db.get_activity_trend('day', (date.today() - timedelta(days=90)).isoformat())
+    else:
+        trend = db.get_activity_trend('hour', (datetime.now() - timedelta(hours=48)).strftime('%Y-%m-%dT%H:00'))
+    
+    if trend:
+        import plotly.express as px
+        
+        trend_df = pd.DataFrame(trend, columns=["Period", "Entity", "Events"])
+        trend_df['Period'] = pd.to_datetime(trend_df['Period'])
+        fig = px.bar(trend_df, x="Period", y="Events", color="Entity")
+        fig.update_layout(height=250, margin=dict(l=10, r=10, t=10, b=10), xaxis_title=None)
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No activity in this period.")
+    
     # Get recent activity logs
     activity_logs = db.get_recent_activity_logs(limit=10)
     
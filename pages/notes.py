@@ -2,48 +2,73 @@ import streamlit as st
 from datetime import datetime
 import utils.database as db
 
+# Notes fetched per "Load more" click
+NOTES_PAGE_SIZE = 50
+
+# Task search matches offered in the task picker
+TASK_SEARCH_LIMIT = 20
+
+def load_notes_page(task_id):
+    """Fetch the next page of a task's notes into the session"""
+    state = st.session_state[f"notes_{task_id}"]
+    after = (state["rows"][-1][2], state["rows"][-1][0]) if state["rows"] else None
+    # One extra row tells whether there is another page
+    page = db.get_task_notes(task_id, after=after, limit=NOTES_PAGE_SIZE + 1)
+    state["rows"].extend(page[:NOTES_PAGE_SIZE])
+    state["has_more"] = len(page) > NOTES_PAGE_SIZE
+
 def app():
     st.header("Task Notes")
     
-    # Display notes by task
+    # Pick a task by typing the start of its name
     st.subheader("Notes by Task")
-    tasks = db.get_tasks()
+    search = st.text_input("Search Tasks", key="notes_task_search", placeholder="Start typing a task name")
+    tasks = db.search_tasks(search.strip(), limit=TASK_SEARCH_LIMIT)
     
-    if tasks:
-        task_dict = {name: id for id, name in tasks}
-        selected_task = st.selectbox("Select Task", list(task_dict.keys()), key="view_task")
-        
-        notes = db.execute_query(
-            "SELECT note, created_at FROM notes WHERE task_id = ? ORDER BY created_at DESC",
-            (task_dict[selected_task],)
-        )
-        
-        if notes:
-            for note in notes:
-                st.write(f"**{note[1]}**")
-                st.write(note[0])
-                st.markdown("---")
+    if not tasks:
+        if search.strip():
+            st.info(f"No tasks found starting with: {search}")
         else:
-            st.info(f"No notes found for task: {selected_task}")
+            st.info("No tasks available.")
+        return
+    
+    # Tasks are picked by ID so tasks with the same name stay distinct
+    task_labels = {
+        task_id: f"{name} — {project_name} (#{task_id})" if project_name else f"{name} (#{task_id})"
+        for task_id, name, project_name in tasks
+    }
+    task_id = st.selectbox("Select Task", list(task_labels), format_func=task_labels.get, key="view_task")
+    if len(tasks) == TASK_SEARCH_LIMIT:
+        st.caption(f"Showing the first {TASK_SEARCH_LIMIT} matches, keep typing to narrow them down.")
+    
+    # Notes loaded so far for this task, reloaded once notes change
+    state_key = f"notes_{task_id}"
+    version = db.table_versions('notes')
+    if st.session_state.get(state_key, {}).get("version") != version:
+        st.session_state[state_key] = {"rows": [], "has_more": False, "version": version}
+        load_notes_page(task_id)
+    state = st.session_state[state_key]
+    
+    if state["rows"]:
+        for _, note, created_at in state["rows"]:
+            st.write(f"**{created_at}**")
+            st.write(note)
+            st.markdown("---")
+        
+        if state["has_more"]:
+            st.button("Load more", key=f"more_notes_{task_id}", on_click=load_notes_page, args=(task_id,))
     else:
-        st.info("No tasks available.")
+        st.info(f"No notes found for task: {task_labels[task_id]}")
     
     # Add note form in an expander
     with st.expander("➕ Add New Note", expanded=False):
-        st.subheader("Add Note to Task")
-        tasks = db.get_tasks()
+        st.subheader(f"Add Note to {task_labels[task_id]}")
+        note = st.text_area("Note")
         
-        if tasks:
-            task_dict = {name: id for id, name in tasks}
-            task = st.selectbox("Select Task", list(task_dict.keys()))
-            note = st.text_area("Note")
-            
-            if st.button("Add Note"):
-                db.execute_query(
-                    "INSERT INTO notes (task_id, note, created_at) VALUES (?, ?, ?)",
-                    (task_dict[task], note, datetime.now().isoformat())
-                )
-                st.success("Note added successfully!")
-                st.rerun()  # Refresh the page to show the new note
-        else:
-            st.warning("Please add tasks first before adding notes.") 
\ No newline at end of file
+        if st.button("Add Note"):
+            db.execute_query(
+                "INSERT INTO notes (task_id, note, created_at) VALUES (?, ?, ?)",
+                (task_id, note, datetime.now().isoformat())
+            )
+            st.success("Note added successfully!")
+            st.rerun()  # Refresh the page to show the new note
@@ -0,0 +1,104 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+import utils.database as db
+from utils import profiling, maintenance
+
+def app():
+    st.header("Performance")
+
+    if not profiling.PROFILING_ENABLED:
+        st.info("Profiling is disabled (PROJECTFORGE_PROFILING=0).")
+        return
+
+    st.caption(f"Since the process started or the last reset. Queries slower than "
+               f"{profiling.SLOW_QUERY_MS:g} ms are counted as slow.")
+    if st.button("Reset statistics"):
+        profiling.reset()
+
+    # Page renders, timed by the dispatcher in app.py
+    st.subheader("Page Renders")
+    pages = profiling.page_stats()
+    if pages:
+        st.dataframe(pd.DataFrame([{
+            "Page": page["page"],
+            "Renders": page["renders"],
+            "Mean ms": page["seconds"] / page["renders"] * 1000,
+            "Max ms": page["max_seconds"] * 1000,
+            "Last ms": page["last_seconds"] * 1000,
+            "Queries / render": page["queries"] / page["renders"],
+            "Query ms / render": page["query_seconds"] / page["renders"] * 1000,
+        } for page in pages]), use_container_width=True, hide_index=True)
+    else:
+        st.info("No page renders recorded yet.")
+
+    # Queries aggregated by normalized SQL
+    st.subheader("Queries")
+    queries = profiling.query_stats()
+    if queries:
+        st.dataframe(pd.DataFrame([{
+            "Id": query["id"],
+            "SQL": query["sql"],
+            "Calls": query["calls"],
+            "Total ms": query["seconds"] * 1000,
+            "Mean ms": query["seconds"] / query["calls"] * 1000,
+            "Max ms": query["max_seconds"] * 1000,
+            "Rows": query["rows"],
+            "Slow": query["slow"],
+            "Call sites": ", ".join(query["call_sites"]),
+        } for query in queries]), use_container_width=True, hide_index=True)
+    else:
+        st.info("No queries recorded yet.")
+
+    st.subheader("Slow Queries")
+    slow = profiling.slow_queries()
+    if not slow:
+        st.info("No slow queries recorded.")
+    for sample in slow:
+        when = datetime.fromtimestamp(sample["time"]).strftime("%H:%M:%S")
+        with st.expander(f"{when} · {sample['seconds'] * 1000:.1f} ms · {sample['call_site']}"):
+            st.code(sample["sql"], language="sql")
+            st.write(f"**Rows:** {sample['rows']} · **Parameters:** {sample['params']}")
+            if sample["plan"]:
+                st.write("**Query plan:**")
+                st.code("\n".join(sample["plan"]))
+
+    st.subheader("Caches")
+    st.dataframe(pd.DataFrame([dict(stats, cache=name) for name, stats in db.cache_stats().items()])
+                 .set_index("cache"), use_container_width=True)
+
+    # Background maintenance (utils/maintenance.py)
+    st.subheader("Maintenance")
+    stats = maintenance.database_stats()
+    archive = maintenance.archive_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Database", f"{stats['size_bytes'] / 2**20:.1f} MB")
+    col2.metric("Free space", f"{stats['free_bytes'] / 2**20:.1f} MB")
+    col3.metric("WAL", f"{stats['wal_bytes'] / 2**20:.1f} MB")
+    col4.metric("Archived logs", f"{archive['entries']:,}")
+    if stats["auto_vacuum"] != 2:
+        st.caption("Incremental auto_vacuum is off for this database; free space is only reclaimed "
+                   "after `python -m utils.maintenance compact` (with the app stopped).")
+    runs = maintenance.last_runs()
+    st.dataframe(pd.DataFrame([{
+        "Task": task.name,
+        "Every (h)": task.interval / 3600,
+        "Last run": runs.get(task.name, {}).get("started_at"),
+        "Seconds": runs.get(task.name, {}).get("seconds"),
+        "Result": runs.get(task.name, {}).get("error") or runs.get(task.name, {}).get("details"),
+    } for task in maintenance.TASKS]), use_container_width=True, hide_index=True)
+    col1, col2 = st.columns([1, 3])
+    task = col1.selectbox("Task", [task.name for task in maintenance.TASKS], label_visibility="collapsed")
+    if col2.button("Run now"):
+        try:
+            with st.spinner(f"Running {task}..."):
+                st.success(f"{task}: {maintenance.run_task(task)}")
+        except Exception as e:
+            st.error(f"{task} failed: {e}")
+
+    # Same text as the metrics file written when PROJECTFORGE_METRICS_FILE is set
+    st.subheader("Prometheus Export")
+    metrics = profiling.prometheus_text()
+    st.download_button("Download metrics", metrics, file_name="projectforge.prom", mime="text/plain")
+    with st.expander("Show metrics"):
+        st.code(metrics)
@@ -2,6 +2,12 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import utils.database as db
+from utils.diff import EditorChanges, diff_editor_frames, frame_rows
+from utils.scheduler import get_scheduler
+from utils import bitbucket, jira_sync
+
+# Editable columns of the sub-project task tables
+SUB_TASK_EDITOR_COLUMNS = ["Name", "Description", "Jira Ticket", "Change Status", "Assigned To Name"]
 
 def app():
     st.header("Project & Task Management")
@@ -145,6 +151,8 @@ def app():
             description = st.text_area("Description")
             jira_ticket = st.text_input("Jira Ticket (optional)")
             status = st.selectbox("Status", ["not started", "started", "blocked", "waiting", "in progress", "completed"])
+            duration_days = st.number_input("Duration (days)", min_value=0, value=None, step=1,
+                                            help="Leave empty for the default duration")
             
             if members:
                 member_name = st.selectbox("Assign To", member_options)
@@ -157,9 +165,9 @@ def app():
                 if submit_button and name:  # Ensure name is not empty
                     db.execute_query(
                         """INSERT INTO tasks 
-                            (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                        (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to)
+                            (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to, duration_days)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to, duration_days)
                     )
                     st.success("Task added successfully!")
                     st.rerun()
@@ -227,6 +235,61 @@ def app():
     member_dict = {id: name for id, name in members}
     member_options = ["Unassigned"] + [name for _, name in members]
     
+    def apply_sub_task_changes(changes, sub_id, editor_key, original_df):
+        """Save a sub-project task editor's changes in one transaction, then rerun once"""
+        member_ids = {name: id for id, name in members}
+        
+        # New rows need at least a name
+        inserts = changes.inserts[changes.inserts["Name"].notna()]
+        updates = changes.updates
+        
+        # Tasks with notes or reminders can't be deleted
+        deletes = changes.deletes
+        if deletes:
+            placeholders = ','.join(['?'] * len(deletes))
+            blocked = {task_id for task_id, in db.execute_query(
+                f"""SELECT task_id FROM notes WHERE task_id IN ({placeholders})
+                    UNION SELECT task_id FROM reminders WHERE task_id IN ({placeholders})""",
+                deletes + deletes
+            )}
+            task_names = dict(zip(original_df["ID"], original_df["Name"]))
+            for task_id in blocked:
+                st.error(f"Cannot delete task '{task_names.get(task_id)}' with notes or reminders. Please delete them first.")
+            deletes = [task_id for task_id in deletes if task_id not in blocked]
+        
+        if inserts.empty and updates.empty and not deletes:
+            return
+        
+        # Map editor columns onto task columns, resolving member names to ids
+        update_rows = frame_rows(pd.DataFrame({
+            "name": updates["Name"],
+            "description": updates["Description"],
+            "jira_ticket": updates["Jira Ticket"],
+            "status": updates["Change Status"],
+            "assigned_to": updates["Assigned To Name"].map(member_ids).astype("Int64"),
+            "id": updates["ID"],
+        })) if not updates.empty else []
+        insert_rows = frame_rows(pd.DataFrame({
+            "name": inserts["Name"],
+            "description": inserts["Description"].fillna(""),
+            "jira_ticket": inserts["Jira Ticket"].fillna(""),
+            "status": inserts["Change Status"].fillna("not started"),
+            "assigned_to": inserts["Assigned To Name"].map(member_ids).astype("Int64"),
+            "project_id": project_id,
+            "sub_project_id": sub_id,
+        })) if not inserts.empty else []
+        
+        result = db.apply_changes(
+            "tasks", ["name", "description", "jira_ticket", "status", "assigned_to"],
+            inserts=insert_rows, updates=update_rows, deletes=deletes,
+            insert_columns=["name", "description", "jira_ticket", "status", "assigned_to", "project_id", "sub_project_id"]
+        )
+        st.success(f"Saved tasks: {result['inserted']} added, {result['updated']} updated, {result['deleted']} deleted")
+        
+        # The editor's pending edits refer to row positions of the old data
+        st.session_state.pop(editor_key, None)
+        st.rerun()
+    
     # LIST VIEW
     if st.session_state.view == "list":
         # Add buttons at the top for adding projects and tasks
@@ -254,34 +317,24 @@ def app():
         # Display projects list
         st.subheader("Projects")
         
-        # Get projects data
-        projects_data = db.execute_query("""
-            SELECT p.id, p.name, p.description, p.start_date, p.end_date, p.assigned_to
-            FROM projects p
-            ORDER BY p.start_date DESC
-        """)
+        # Paging controls keep render time flat as the project count grows
+        total_projects = db.count_projects()
+        page_size = st.session_state.get("projects_page_size", 20)
+        page_count = max(1, -(-total_projects // page_size))
+        page = min(st.session_state.get("projects_page", 0), page_count - 1)
+        
+        # Get one page of projects with their counts in a single query
+        projects_data = db.get_project_summaries(limit=page_size, offset=page * page_size)
         
         if projects_data:
             # Display projects as cards
-            for project_id, name, description, start_date, end_date, assigned_to in projects_data:
+            for project_id, name, description, start_date, end_date, assigned_to, assigned_name, task_count, subproject_count in projects_data:
                 # Format dates
                 start_date = start_date.split('T')[0] if 'T' in start_date else start_date
                 end_date = end_date.split('T')[0] if 'T' in end_date else end_date
                 
                 # Get assigned person name
-                assigned_name = member_dict.get(assigned_to, "Unassigned") if assigned_to else "Unassigned"
-                
-                # Get task count
-                task_count = db.execute_query(
-                    "SELECT COUNT(*) FROM tasks WHERE project_id = ? AND sub_project_id IS NULL", 
-                    (project_id,)
-                )[0][0]
-                
-                # Get sub-project count
-                subproject_count = db.execute_query(
-                    "SELECT COUNT(*) FROM sub_projects WHERE project_id = ?", 
-                    (project_id,)
-                )[0][0]
+                assigned_name = assigned_name or "Unassigned"
                 
                 # Create a card-like display for each project
                 with st.container():
@@ -297,6 +350,27 @@ def app():
                                  on_click=view_project_details, args=(project_id, name),
                                  use_container_width=True)
                     st.markdown("---")
+            
+            # Page navigation
+            col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+            with col1:
+                if st.button("← Previous", disabled=page == 0, use_container_width=True):
+                    st.session_state.projects_page = page - 1
+                    st.rerun()
+            with col2:
+                st.markdown(f"Page **{page + 1}** of **{page_count}** ({total_projects} projects)")
+            with col3:
+                if st.button("Next →", disabled=page >= page_count - 1, use_container_width=True):
+                    st.session_state.projects_page = page + 1
+                    st.rerun()
+            with col4:
+                page_sizes = [10, 20, 50, 100]
+                new_page_size = st.selectbox("Per page", page_sizes, index=page_sizes.index(page_size),
+                                             label_visibility="collapsed")
+                if new_page_size != page_size:
+                    st.session_state.projects_page_size = new_page_size
+                    st.session_state.projects_page = 0
+                    st.rerun()
         else:
             st.info("No projects added yet. Use the 'Add New Project' button to create a project.")
     
@@ -331,6 +405,28 @@ def app():
         st.markdown(f"**Timeline:** {start_date} to {end_date} | **Assigned to:** {assigned_name}")
         st.markdown(f"**Description:** {description}")
         
+        # Cached Jira status of every task in the project; the keys whose
+        # status is stale are refreshed in one batched background sync
+        jira_tickets = [ticket for ticket, in db.execute_query("""
+            SELECT DISTINCT t.jira_ticket
+            FROM tasks t
+            WHERE (t.project_id = ? OR t.sub_project_id IN (
+                SELECT sp.id FROM sub_projects sp WHERE sp.project_id = ?
+            )) AND t.jira_ticket IS NOT NULL AND t.jira_ticket != ''
+        """, (project_id, project_id))]
+        jira_syncing = jira_sync.sync_issues_in_background(jira_tickets)
+        jira_statuses = jira_sync.get_issue_statuses(jira_tickets)
+        jira_status_names = {key: status for key, (status, *_) in jira_statuses.items()}
+        if jira_statuses:
+            oldest = min(fetched_at for _, _, fetched_at in jira_statuses.values())
+            st.caption(f"Jira statuses as of {oldest[:16].replace('T', ' ')}"
+                       + (" · refreshing in the background" if jira_syncing else ""))
+        elif jira_syncing:
+            st.caption("Loading Jira statuses in the background...")
+        
+        # Pull requests and commits are linked to tasks in the background
+        bitbucket.refresh_links_in_background()
+        
         # Tabs for different sections
         tab1, tab2, tab3, tab4 = st.tabs(["Tasks", "Sub-Projects", "Notes & Reminders", "Activity Log"])
         
@@ -338,7 +434,7 @@ def app():
         with tab1:
             # Get tasks for this project
             tasks = db.execute_query("""
-                SELECT t.id, t.name, t.description, t.status, t.jira_ticket, t.assigned_to
+                SELECT t.id, t.name, t.description, t.status, t.jira_ticket, t.assigned_to, t.duration_days
                 FROM tasks t
                 WHERE t.project_id = ? AND t.sub_project_id IS NULL
                 ORDER BY 
@@ -357,6 +453,8 @@ def app():
                     task_jira = st.text_input("Jira Ticket (optional)")
                     task_status = st.selectbox("Status", ["not started", "started", "in progress", "blocked", "waiting", "completed"])
                     task_assigned = st.selectbox("Assigned To", member_options)
+                    task_duration = st.number_input("Duration (days)", min_value=0, value=None, step=1,
+                                                    help="Leave empty for the default duration")
                     
                     submitted = st.form_submit_button("Add Task")
                     if submitted and task_name:
@@ -369,13 +467,14 @@ def app():
                                     break
                         
                         # Insert the task
-                        db.execute_query(
-                            "INSERT INTO tasks (project_id, name, description, jira_ticket, status, assigned_to) VALUES (?, ?, ?, ?, ?, ?)",
-                            (project_id, task_name, task_description, task_jira, task_status, assigned_id)
+                        task_id = db.execute_query(
+                            "INSERT INTO tasks (project_id, name, description, jira_ticket, status, assigned_to, duration_days) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (project_id, task_name, task_description, task_jira, task_status, assigned_id, task_duration),
+                            fetch_last_id=True
                         )
                         
                         # Log the activity
-                        task_id = db.execute_query("SELECT last_insert_rowid()", fetch_last_id=True)
                         db.log_activity(
                             action_type="create",
                             entity_type="task",
@@ -392,11 +491,14 @@ def app():
             st.subheader("Tasks")
             
             if tasks:
+                # Linked pull requests and commits of these tasks
+                code_links = bitbucket.get_task_links([task[0] for task in tasks])
+                
                 # Create a container for tasks
                 tasks_container = st.container()
                 
                 with tasks_container:
-                    for task_id, task_name, task_description, task_status, task_jira, task_assigned_to in tasks:
+                    for task_id, task_name, task_description, task_status, task_jira, task_assigned_to, task_duration in tasks:
                         # Get assigned person name
                         assigned_name = "Unassigned"
                         if task_assigned_to:
@@ -440,9 +542,20 @@ def app():
                                     st.markdown(f"**Description:** {task_description}")
                                 
                                 if task_jira:
-                                    st.markdown(f"**Jira:** {task_jira}")
+                                    jira_status = jira_statuses.get(jira_sync.normalize_key(task_jira))
+                                    st.markdown(f"**Jira:** {task_jira}" + (f" ({jira_status[0]})" if jira_status else ""))
                                 
                                 st.markdown(f"**Assigned to:** {assigned_name}")
+                                
+                                if task_duration is not None:
+                                    st.markdown(f"**Duration:** {task_duration} days")
+                                
+                                if code_links.get(task_id):
+                                    st.markdown("**Code:** " + " · ".join(
+                                        f"[{'PR #' + ref if kind == 'pullrequest' else ref[:7]}]({url})"
+                                        + (f" {state}" if state else "")
+                                        for kind, _, ref, _, url, _, state, _ in code_links[task_id]
+                                    ))
                             
                             with col2:
                                 # Action buttons
@@ -458,6 +571,7 @@ def app():
                                         st.session_state.edit_task_jira = task_jira
                                         st.session_state.edit_task_status = task_status
                                         st.session_state.edit_task_assigned = assigned_name
+                                        st.session_state.edit_task_duration = task_duration
                                         st.rerun()
                                 
                                 # Complete/Reopen button
@@ -537,6 +651,9 @@ def app():
                                           index=["not started", "started", "in progress", "blocked", "waiting", "completed"].index(st.session_state.edit_task_status))
                 task_assigned = st.selectbox("Assigned To", member_options, 
                                             index=member_options.index(st.session_state.edit_task_assigned))
+                task_duration = st.number_input("Duration (days)", min_value=0, step=1,
+                                                value=st.session_state.get("edit_task_duration"),
+                                                help="Leave empty for the default duration")
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -559,9 +676,10 @@ def app():
                             # Update the task
                             db.execute_query(
                                 """UPDATE tasks 
-                                   SET name = ?, description = ?, jira_ticket = ?, status = ?, assigned_to = ?
+                                   SET name = ?, description = ?, jira_ticket = ?, status = ?, assigned_to = ?,
+                                       duration_days = ?
                                    WHERE id = ?""",
-                                (task_name, task_description, task_jira, task_status, assigned_id, task_id)
+                                (task_name, task_description, task_jira, task_status, assigned_id, task_duration, task_id)
                             )
                             
                             # Log the activity
@@ -666,8 +784,12 @@ def app():
                                                       columns=["ID", "Name", "Description", "Jira Ticket", "Status", "Assigned To"])
                             
                             # Add assigned person name
-                            sub_tasks_df["Assigned To Name"] = sub_tasks_df["Assigned To"].apply(
-                                lambda x: member_dict.get(x, "Unassigned") if x else "Unassigned"
+                            sub_tasks_df["Assigned To Name"] = sub_tasks_df["Assigned To"].map(member_dict).fillna("Unassigned")
+                            
+                            # Add the cached Jira status (for display only), looked up
+                            # by the normalized key of the whole column at once
+                            sub_tasks_df["Jira Status"] = (
+                                sub_tasks_df["Jira Ticket"].str.strip().str.upper().map(jira_status_names)
                             )
                             
                             # Add action buttons
@@ -682,6 +804,7 @@ def app():
                                     "Name": st.column_config.TextColumn("Name"),
                                     "Description": st.column_config.TextColumn("Description"),
                                     "Jira Ticket": st.column_config.TextColumn("Jira Ticket"),
+                                    "Jira Status": st.column_config.TextColumn("Jira Status", disabled=True),
                                     "Status": st.column_config.TextColumn("Current Status", disabled=True),
                                     "Change Status": st.column_config.SelectboxColumn(
                                         "Change Status",
@@ -713,80 +836,12 @@ def app():
                                     if st.button("🔔 Add Reminder", key=f"reminder_btn_sub_{sub_task_id}", use_container_width=True):
                                         open_reminder_modal(sub_task_id, sub_task_name)
                             
-                            # Handle sub-task deletions and updates (similar to project tasks)
-                            for index, row in edited_sub_tasks_df.iterrows():
-                                if row["Delete"] and index < len(sub_tasks_df):
-                                    # Check if task has notes or reminders
-                                    note_count = db.execute_query(
-                                        "SELECT COUNT(*) FROM notes WHERE task_id = ?", 
-                                        (row["ID"],)
-                                    )[0][0]
-                                    
-                                    reminder_count = db.execute_query(
-                                        "SELECT COUNT(*) FROM reminders WHERE task_id = ?", 
-                                        (row["ID"],)
-                                    )[0][0]
-                                    
-                                    if note_count > 0 or reminder_count > 0:
-                                        st.error(f"Cannot delete task '{row['Name']}' with notes or reminders. Please delete them first.")
-                                    else:
-                                        db.execute_query("DELETE FROM tasks WHERE id = ?", (row["ID"],))
-                                        st.success(f"Task '{row['Name']}' deleted successfully!")
-                                        st.rerun()
-                                
-                                if index < len(sub_tasks_df):  # This is an edit to existing row
-                                    # Check for status changes
-                                    if row["Status"] != row["Change Status"]:
-                                        db.execute_query(
-                                            "UPDATE tasks SET status = ? WHERE id = ?",
-                                            (row["Change Status"], row["ID"])
-                                        )
-                                        st.success(f"Updated status for task '{row['Name']}' to {row['Change Status']}")
-                                        st.rerun()
-                                    
-                                    # Check for assigned person changes
-                                    current_assigned = sub_tasks_df.iloc[index]["Assigned To Name"]
-                                    if row["Assigned To Name"] != current_assigned:
-                                        # Find member_id from name
-                                        assigned_to = None
-                                        if row["Assigned To Name"] != "Unassigned":
-                                            assigned_to = next((id for id, name in member_dict.items() if name == row["Assigned To Name"]), None)
-                                        
-                                        db.execute_query(
-                                            "UPDATE tasks SET assigned_to = ? WHERE id = ?",
-                                            (assigned_to, row["ID"])
-                                        )
-                                        st.success(f"Reassigned task '{row['Name']}' to {row['Assigned To Name']}")
-                                        st.rerun()
-                                    
-                                    # Check for other changes
-                                    if not sub_tasks_df.iloc[index][["Name", "Description", "Jira Ticket"]].equals(
-                                        row[["Name", "Description", "Jira Ticket"]]
-                                    ):
-                                        db.execute_query(
-                                            """UPDATE tasks 
-                                               SET name = ?, description = ?, jira_ticket = ?
-                                               WHERE id = ?""",
-                                            (row["Name"], row["Description"], row["Jira Ticket"], row["ID"])
-                                        )
-                                        st.success(f"Updated task: {row['Name']}")
-                                        st.rerun()
-                                else:  # This is a new row
-                                    if not pd.isna(row["Name"]):
-                                        # Find member_id from name
-                                        assigned_to = None
-                                        if not pd.isna(row["Assigned To Name"]) and row["Assigned To Name"] != "Unassigned":
-                                            assigned_to = next((id for id, name in member_dict.items() if name == row["Assigned To Name"]), None)
-                                        
-                                        db.execute_query(
-                                            """INSERT INTO tasks 
-                                               (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to)
-                                               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                            (project_id, sub_project_id, row["Name"], row["Description"] or "", row["Jira Ticket"] or "", 
-                                             row["Change Status"], assigned_to)
-                                        )
-                                        st.success(f"Added new task: {row['Name']}")
-                                        st.rerun()
+                            # Work out every insert, update and delete made in the editor
+                            changes = diff_editor_frames(
+                                sub_tasks_df, edited_sub_tasks_df, key="ID",
+                                columns=SUB_TASK_EDITOR_COLUMNS, delete_column="Delete"
+                            )
+                            apply_sub_task_changes(changes, sub_id, f"sub_tasks_df_{sub_id}", sub_tasks_df)
                         else:
                             st.info(f"No tasks for sub-project {sub_name} yet.")
                             
@@ -814,23 +869,9 @@ def app():
                                 key=f"empty_sub_tasks_df_{sub_id}"
                             )
                             
-                            # Handle new sub-task additions
-                            for _, row in edited_empty_sub_tasks_df.iterrows():
-                                if not pd.isna(row["Name"]):
-                                    # Find member_id from name
-                                    assigned_to = None
-                                    if not pd.isna(row["Assigned To Name"]) and row["Assigned To Name"] != "Unassigned":
-                                        assigned_to = next((id for id, name in member_dict.items() if name == row["Assigned To Name"]), None)
-                                    
-                                    db.execute_query(
-                                        """INSERT INTO tasks 
-                                           (project_id, sub_project_id, name, description, jira_ticket, status, assigned_to)
-                                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                        (project_id, sub_project_id, row["Name"], row["Description"] or "", row["Jira Ticket"] or "", 
-                                         row["Change Status"], assigned_to)
-                                    )
-                                    st.success(f"Added new task: {row['Name']}")
-                                    st.rerun()
+                            # Every row added here is a new task
+                            changes = EditorChanges(edited_empty_sub_tasks_df[SUB_TASK_EDITOR_COLUMNS], pd.DataFrame(), [])
+                            apply_sub_task_changes(changes, sub_id, f"empty_sub_tasks_df_{sub_id}", empty_sub_tasks_df)
             else:
                 st.info(f"No sub-projects for {project_name} yet.")
         
@@ -894,19 +935,18 @@ def app():
                     # Get today's date for highlighting
                     today = datetime.now().date().isoformat()
                     
-                    reminders = db.execute_query("""
+                    # Pending reminders first (today's, overdue, then upcoming),
+                    # served by the reminder scheduler, then followed up ones
+                    reminders = [
+                        (rem.id, rem.task_id, rem.reminder_date.isoformat(), rem.note, 0)
+                        for rem in get_scheduler().pending_for_tasks(task_ids)
+                    ]
+                    reminders += db.execute_query("""
                         SELECT r.id, r.task_id, r.reminder_date, r.note, r.followed_up
                         FROM reminders r
-                        WHERE r.task_id IN ({})
-                        ORDER BY 
-                            r.followed_up ASC,  -- Pending reminders first
-                            CASE 
-                                WHEN r.reminder_date = ? THEN 0  -- Today's reminders
-                                WHEN r.reminder_date < ? THEN 1  -- Overdue reminders
-                                ELSE 2  -- Future reminders
-                            END,
-                            r.reminder_date ASC  -- Chronological order
-                    """.format(','.join(['?'] * len(task_ids))), task_ids + [today, today])
+                        WHERE r.task_id IN ({}) AND r.followed_up = 1
+                        ORDER BY r.reminder_date ASC
+                    """.format(','.join(['?'] * len(task_ids))), task_ids)
                     
                     if reminders:
                         # Create a container for scrollable reminders list
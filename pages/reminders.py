@@ -1,6 +1,6 @@
 import streamlit as st
-from datetime import datetime, date
 import utils.database as db
+from utils.scheduler import get_scheduler
 
 def app():
     st.header("Task Reminders")
@@ -20,15 +20,11 @@ def app():
         """
         reminders = db.execute_query(query)
     else:
-        today = date.today().isoformat()
-        query = """
-            SELECT r.id, t.name, r.reminder_date, r.note, r.followed_up
-            FROM reminders r
-            JOIN tasks t ON r.task_id = t.id
-            WHERE r.reminder_date <= ? AND r.followed_up = 0
-            ORDER BY r.reminder_date
-        """
-        reminders = db.execute_query(query, (today,))
+        # Due reminders are kept in memory by the reminder scheduler
+        reminders = [
+            (rem.id, rem.task_name, rem.reminder_date.isoformat(), rem.note, 0)
+            for rem in get_scheduler().due()
+        ]
     
     if reminders:
         for rem in reminders:
@@ -37,7 +33,7 @@ def app():
                 st.write(f"**Status:** {'Followed up' if rem[4] else 'Needs attention'}")
                 
                 if not rem[4]:  # If not followed up
-                    if st.button(f"Mark as Followed Up", key=f"followup_{rem[0]}"):
+                    if st.button("Mark as Followed Up", key=f"followup_{rem[0]}"):
                         db.execute_query(
                             "UPDATE reminders SET followed_up = 1 WHERE id = ?", 
                             (rem[0],)
@@ -1,6 +1,47 @@
 import streamlit as st
 import pandas as pd
 import utils.database as db
+from utils.diff import EditorChanges, diff_editor_frames, frame_rows
+
+# Editable columns of the team member tables
+MEMBER_EDITOR_COLUMNS = ["First Name", "Last Name", "Email"]
+
+def apply_member_changes(changes, team_id, editor_key, original_df):
+    """Save a member editor's changes in one transaction, then rerun once"""
+    # New rows need both names
+    inserts = changes.inserts[changes.inserts["First Name"].notna() & changes.inserts["Last Name"].notna()]
+    updates = changes.updates
+    
+    # Members with assigned tasks can't be deleted
+    deletes = changes.deletes
+    if deletes:
+        blocked = {member_id for member_id, in db.execute_query(
+            "SELECT DISTINCT assigned_to FROM tasks WHERE assigned_to IN ({})".format(','.join(['?'] * len(deletes))),
+            deletes
+        )}
+        member_names = dict(zip(original_df["ID"], original_df["First Name"] + " " + original_df["Last Name"]))
+        for member_id in blocked:
+            st.error(f"Cannot delete member '{member_names.get(member_id)}' with assigned tasks. Please reassign tasks first.")
+        deletes = [member_id for member_id in deletes if member_id not in blocked]
+    
+    if inserts.empty and updates.empty and not deletes:
+        return
+    
+    update_rows = frame_rows(updates[["First Name", "Last Name", "Email", "ID"]]) if not updates.empty else []
+    insert_rows = frame_rows(inserts.assign(**{"Email": inserts["Email"].fillna(""), "Team ID": team_id})[
+        ["First Name", "Last Name", "Email", "Team ID"]
+    ]) if not inserts.empty else []
+    
+    result = db.apply_changes(
+        "team_members", ["first_name", "last_name", "email"],
+        inserts=insert_rows, updates=update_rows, deletes=deletes,
+        insert_columns=["first_name", "last_name", "email", "team_id"]
+    )
+    st.success(f"Saved team members: {result['inserted']} added, {result['updated']} updated, {result['deleted']} deleted")
+    
+    # The editor's pending edits refer to row positions of the old data
+    st.session_state.pop(editor_key, None)
+    st.rerun()
 
 def app():
     st.header("Team Management")
@@ -53,11 +94,11 @@ def app():
                 st.warning("Please add a team first before adding team members.")
                 st.form_submit_button("Add Team Member", disabled=True)
     
-    # Display teams and their members
-    teams_data = db.execute_query("SELECT id, name, description, location FROM teams")
+    # Display teams and their members, all loaded in one query
+    rosters = db.get_team_rosters()
     
-    if teams_data:
-        for team_id, team_name, description, location in teams_data:
+    if rosters:
+        for (team_id, team_name, description, location), members in rosters:
             st.subheader(f"Team: {team_name}")
             
             # Team details in an expander
@@ -88,12 +129,7 @@ def app():
                 # Handle team deletion
                 if edited_team_df.iloc[0]["Delete"]:
                     # Check if team has members
-                    member_count = db.execute_query(
-                        "SELECT COUNT(*) FROM team_members WHERE team_id = ?", 
-                        (team_id,)
-                    )[0][0]
-                    
-                    if member_count > 0:
+                    if members:
                         st.error(f"Cannot delete team '{team_name}' with members. Please delete members first.")
                     else:
                         db.execute_query("DELETE FROM teams WHERE id = ?", (team_id,))
@@ -112,30 +148,11 @@ def app():
                     st.success(f"Updated team: {row['Name']}")
                     st.rerun()
             
-            # Get team members
-            members = db.execute_query("""
-                SELECT tm.id, tm.first_name, tm.last_name, tm.email, tm.team_id 
-                FROM team_members tm
-                WHERE tm.team_id = ?
-            """, (team_id,))
-            
             if members:
-                # Convert to DataFrame for the editable table
-                members_df = pd.DataFrame(members, columns=["ID", "First Name", "Last Name", "Email", "Team ID"])
-                
-                # Add a column for assigned tasks (for display only)
-                assigned_tasks = {}
-                for member_id, _, _, _, _ in members:
-                    tasks = db.execute_query(
-                        "SELECT name FROM tasks WHERE assigned_to = ?", 
-                        (member_id,)
-                    )
-                    if tasks:
-                        assigned_tasks[member_id] = ", ".join([task[0] for task in tasks])
-                    else:
-                        assigned_tasks[member_id] = "None"
-                
-                members_df["Tasks"] = members_df["ID"].apply(lambda x: assigned_tasks.get(x, "None"))
+                # Convert to DataFrame for the editable table, with the
+                # assigned tasks for display only
+                members_df = pd.DataFrame(members, columns=["ID", "First Name", "Last Name", "Email", "Team ID", "Tasks"])
+                members_df["Tasks"] = members_df["Tasks"].fillna("None")
                 
                 # Add a delete button column
                 members_df["Delete"] = False
@@ -153,51 +170,16 @@ def app():
                         "Delete": st.column_config.CheckboxColumn("Delete?", help="Select to delete this member")
                     },
                     hide_index=True,
-                    num_rows="dynamic"
+                    num_rows="dynamic",
+                    key=f"members_df_{team_id}"
                 )
                 
-                # Handle member deletions
-                for index, row in edited_members_df.iterrows():
-                    if row["Delete"] and index < len(members_df):
-                        # Check if member has tasks
-                        task_count = db.execute_query(
-                            "SELECT COUNT(*) FROM tasks WHERE assigned_to = ?", 
-                            (row["ID"],)
-                        )[0][0]
-                        
-                        if task_count > 0:
-                            st.error(f"Cannot delete member '{row['First Name']} {row['Last Name']}' with assigned tasks. Please reassign tasks first.")
-                        else:
-                            db.execute_query("DELETE FROM team_members WHERE id = ?", (row["ID"],))
-                            st.success(f"Team member '{row['First Name']} {row['Last Name']}' deleted successfully!")
-                            st.rerun()
-                
-                # Check for changes and update database
-                if not members_df[["ID", "First Name", "Last Name", "Email"]].equals(
-                    edited_members_df[["ID", "First Name", "Last Name", "Email"]]
-                ):
-                    for index, row in edited_members_df.iterrows():
-                        if index < len(members_df):  # This is an edit to existing row
-                            if not members_df.iloc[index][["First Name", "Last Name", "Email"]].equals(
-                                row[["First Name", "Last Name", "Email"]]
-                            ):
-                                db.execute_query(
-                                    """UPDATE team_members 
-                                       SET first_name = ?, last_name = ?, email = ? 
-                                       WHERE id = ?""",
-                                    (row["First Name"], row["Last Name"], row["Email"], row["ID"])
-                                )
-                                st.success(f"Updated team member: {row['First Name']} {row['Last Name']}")
-                        else:  # This is a new row
-                            if not pd.isna(row["First Name"]) and not pd.isna(row["Last Name"]):
-                                db.execute_query(
-                                    """INSERT INTO team_members 
-                                       (first_name, last_name, email, team_id) 
-                                       VALUES (?, ?, ?, ?)""",
-                                    (row["First Name"], row["Last Name"], row["Email"] or "", team_id)
-                                )
-                                st.success(f"Added new team member: {row['First Name']} {row['Last Name']}")
-                                st.rerun()
+                # Work out every insert, update and delete made in the editor
+                changes = diff_editor_frames(
+                    members_df, edited_members_df, key="ID",
+                    columns=MEMBER_EDITOR_COLUMNS, delete_column="Delete"
+                )
+                apply_member_changes(changes, team_id, f"members_df_{team_id}", members_df)
             else:
                 st.info(f"No members in team {team_name} yet.")
                 
@@ -206,19 +188,12 @@ def app():
                 edited_empty_df = st.data_editor(
                     empty_members_df,
                     num_rows="dynamic",
-                    hide_index=True
+                    hide_index=True,
+                    key=f"empty_members_df_{team_id}"
                 )
                 
-                # Handle new member additions
-                for _, row in edited_empty_df.iterrows():
-                    if not pd.isna(row["First Name"]) and not pd.isna(row["Last Name"]):
-                        db.execute_query(
-                            """INSERT INTO team_members 
-                               (first_name, last_name, email, team_id) 
-                               VALUES (?, ?, ?, ?)""",
-                            (row["First Name"], row["Last Name"], row["Email"] or "", team_id)
-                        )
-                        st.success(f"Added new team member: {row['First Name']} {row['Last Name']}")
-                        st.rerun()
+                # Every row added here is a new member
+                changes = EditorChanges(edited_empty_df[MEMBER_EDITOR_COLUMNS], pd.DataFrame(), [])
+                apply_member_changes(changes, team_id, f"empty_members_df_{team_id}", empty_members_df)
     else:
         st.info("No teams added yet. Use the 'Add New Team' button to create a team.") 
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""
+Shared test setup.
+
+utils.database reads its settings when imported, so the environment is
+pointed at a scratch database before any test module imports it. Every
+test in the session shares that database and creates the rows it needs.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="projectforge-tests-")
+os.environ["PROJECTFORGE_DB_PATH"] = os.path.join(_DB_DIR, "projectforge.db")
+os.environ["PROJECTFORGE_MAINTENANCE"] = "0"
+os.environ["PROJECTFORGE_BITBUCKET_CACHE_DIR"] = os.path.join(_DB_DIR, "bitbucket_cache")
+
+import utils.database as db  # noqa: E402
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def database():
+    """The migrated scratch database (the utils.database module)"""
+    db.ensure_db()
+    return db
+
+def wait_for(condition, timeout: float = 5.0, interval: float = 0.02) -> bool:
+    """Poll condition until it's true or timeout passes; returns its last result"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils import bitbucket
+
+class BitbucketStandIn:
+    """
+    A local HTTP server answering like Bitbucket Cloud's REST API
+
+    pages maps a path (without /api/2.0) to the pages of its listing;
+    page N is requested with ?page=N through the "next" links. Responses
+    carry an ETag of their body and answer If-None-Match with a 304.
+    throttle maps a path to the number of 429s to send first.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.throttle = {}
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path[len("/api/2.0"):]
+                page = int(parse_qs(url.query).get("page", ["1"])[0])
+                stand_in.requests.append((path, page, self.headers.get("If-None-Match")))
+                if stand_in.throttle.get(path):
+                    stand_in.throttle[path] -= 1
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                pages = stand_in.pages.get(path)
+                if pages is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = {"values": pages[page - 1]}
+                if page < len(pages):
+                    body["next"] = f"{stand_in.url}/api/2.0{path}?page={page + 1}"
+                data = json.dumps(body).encode()
+                etag = '"{}"'.format(hashlib.sha256(data).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stand_in():
+    server = BitbucketStandIn()
+    yield server
+    server.close()
+
+@pytest.fixture
+def settings(stand_in):
+    return {"enabled": True, "url": stand_in.url, "username": "ada", "app_password": "secret",
+            "workspace": "forge", "repository": "app"}
+
+def pull_request(id, title, branch="main"):
+    return {"id": id, "title": title, "description": "", "state": "OPEN", "updated_on": "2026-10-01T10:00:00",
+            "source": {"branch": {"name": branch}}, "links": {"html": {"href": f"https://bitbucket.example/pr/{id}"}},
+            "author": {"display_name": "Ada"}}
+
+def commit(hash, message):
+    return {"hash": hash, "message": message, "date": "2026-10-01T09:00:00", "author": {"raw": "Ada <ada@example.com>"},
+            "links": {"html": {"href": f"https://bitbucket.example/commits/{hash}"}}}
+
+def test_paginate_follows_next_links(stand_in, settings, tmp_path):
+    stand_in.pages["/repositories/forge/app/commits"] = [[commit("a", "one")], [commit("b", "two")], [commit("c", "three")]]
+    client = bitbucket.BitbucketClient(settings, cache_dir=str(tmp_path))
+    assert [c["hash"] for c in client.commits("app")] == ["a", "b", "c"]
+    assert [page for path, page, _ in stand_in.requests] == [1, 2, 3]
+
+def test_paginate_stops_at_max_pages(stand_in, settings):
+    stand_in.pages["/repositories/forge/app/commits"] = [[commit(str(i), "x")] for i in range(5)]
+    client = bitbucket.BitbucketClient(settings, cache_dir=None)
+    assert len(list(client.paginate("/repositories/forge/app/commits", max_pages=2))) == 2
+
+def test_rate_limited_requests_are_retried(stand_in, settings):
+    stand_in.pages["/user"] = [[]]
+    stand_in.throttle["/user"] = 2
+    client = bitbucket.BitbucketClient(settings, cache_dir=None)
+    assert client.current_user() == {"values": []}
+    assert len(stand_in.requests) == 3
+
+def test_unchanged_responses_are_revalidated_from_the_disk_cache(stand_in, settings, tmp_path):
+    stand_in.pages["/user"] = [[{"nickname": "ada"}]]
+    client = bitbucket.BitbucketClient(settings, cache_dir=str(tmp_path))
+    first = client.current_user()
+    assert client.current_user() == first
+    # The second request was conditional and answered with a 304
+    assert stand_in.requests[0][2] is None and stand_in.requests[1][2] is not None
+
+def test_link_tasks_replaces_stale_links(database, stand_in, settings):
+    database.execute_write("DELETE FROM task_code_links")
+    first = database.execute_write("INSERT INTO tasks (name, jira_ticket) VALUES ('Login', 'pf-101')").lastrowid
+    second = database.execute_write("INSERT INTO tasks (name, jira_ticket) VALUES ('Export', 'PF-102')").lastrowid
+    stand_in.pages["/repositories/forge/app/pullrequests"] = [
+        [pull_request(1, "PF-101 login form")],
+        [pull_request(2, "Export button", branch="feature/PF-102-export")],
+    ]
+    stand_in.pages["/repositories/forge/app/commits"] = [[commit("abc123", "PF-101: validate email")]]
+
+    def links():
+        return sorted(database.execute_query("SELECT task_id, kind, ref FROM task_code_links"))
+
+    assert bitbucket.link_tasks(settings) == 3
+    assert links() == sorted([(first, "commit", "abc123"), (first, "pullrequest", "1"), (second, "pullrequest", "2")])
+
+    # The first task's ticket is cleared and the pull request renamed
+    database.execute_write("UPDATE tasks SET jira_ticket = NULL WHERE id = ?", (first,))
+    stand_in.pages["/repositories/forge/app/pullrequests"][1] = [pull_request(2, "Export button")]
+    assert bitbucket.link_tasks(settings) == 0
+    assert links() == []
+
+def test_failed_listing_keeps_the_links(database, stand_in, settings):
+    database.execute_write("DELETE FROM task_code_links")
+    task_id = database.execute_write("INSERT INTO tasks (name, jira_ticket) VALUES ('Sync', 'PF-103')").lastrowid
+    stand_in.pages["/repositories/forge/app/pullrequests"] = [[pull_request(3, "PF-103 sync")]]
+    stand_in.pages["/repositories/forge/app/commits"] = [[]]
+    assert bitbucket.link_tasks(settings) == 1
+
+    del stand_in.pages["/repositories/forge/app/commits"]
+    with pytest.raises(Exception):
+        bitbucket.link_tasks(settings)
+    assert database.execute_query("SELECT task_id FROM task_code_links") == [(task_id,)]
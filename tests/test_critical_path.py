@@ -0,0 +1,80 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from utils import critical_path
+
+@pytest.fixture(autouse=True)
+def no_background_refresh():
+    """Stop the refresher app.py starts, so only the test reschedules"""
+    critical_path._refresher.stop(timeout=5)
+
+@pytest.fixture
+def phased_project(database):
+    """A project whose phase A comes before phase B, with task t1 before t2, both in A"""
+    project_id = database.execute_write(
+        "INSERT INTO projects (name, start_date, end_date) VALUES ('Relaunch', '2026-01-05', '2026-03-01')").lastrowid
+    phases = [database.execute_write(
+        "INSERT INTO sub_projects (project_id, name, start_date, end_date) VALUES (?, ?, '2026-01-05', '2026-02-01')",
+        (project_id, name)).lastrowid for name in ("Phase A", "Phase B")]
+    tasks = [database.execute_write(
+        "INSERT INTO tasks (project_id, sub_project_id, name, status, duration_days) VALUES (?, ?, ?, 'not started', 3)",
+        (project_id, phases[0], name)).lastrowid for name in ("t1", "t2")]
+    critical_path.add_dependency('sub_project', *phases)
+    critical_path.add_dependency('task', *tasks)
+    critical_path.refresh()
+    return project_id, phases, tasks
+
+def schedule_rows(database, project_id):
+    return database.execute_query("SELECT kind, id FROM schedule WHERE project_id = ?", (project_id,))
+
+def test_dependency_closing_a_cycle_is_refused(database, phased_project):
+    _, phases, _ = phased_project
+    with pytest.raises(ValueError):
+        critical_path.add_dependency('sub_project', phases[1], phases[0])
+    assert critical_path.get_dependencies.uncached('sub_project', phases[0]) == []
+
+def test_moving_a_task_into_a_cycle_leaves_the_project_unscheduled(database, phased_project):
+    project_id, phases, tasks = phased_project
+    assert len(schedule_rows(database, project_id)) == 5
+
+    # t1 now belongs to phase B, which waits for phase A, which holds t2, which waits for t1
+    database.execute_write("UPDATE tasks SET sub_project_id = ? WHERE id = ?", (phases[1], tasks[0]))
+    result = critical_path.refresh()
+    assert result["unscheduled"] == 1
+    assert schedule_rows(database, project_id) == []
+    assert database.execute_query("SELECT 1 FROM schedule_dirty WHERE project_id = ?", (project_id,)) == []
+
+    at = AppTest.from_file("../app.py", default_timeout=60)
+    at.run()
+    assert not at.exception
+    assert at.subheader[0].value == "Project Timeline"
+
+    # Breaking the cycle schedules the project again
+    database.execute_write("UPDATE tasks SET sub_project_id = ? WHERE id = ?", (phases[0], tasks[0]))
+    assert critical_path.refresh()["unscheduled"] == 0
+    assert len(schedule_rows(database, project_id)) == 5
+
+def test_other_projects_are_still_scheduled_next_to_a_cycle(database, phased_project):
+    project_id, phases, tasks = phased_project
+    other = database.execute_write(
+        "INSERT INTO projects (name, start_date, end_date) VALUES ('Other', '2026-01-05', '2026-02-01')").lastrowid
+    database.execute_write("INSERT INTO tasks (project_id, name, status) VALUES (?, 'Solo', 'started')", (other,))
+    database.execute_write("UPDATE tasks SET sub_project_id = ? WHERE id = ?", (phases[1], tasks[0]))
+    critical_path.refresh(full=True)
+    assert schedule_rows(database, project_id) == []
+    assert len(schedule_rows(database, other)) == 2
+
+def test_refresh_without_changes_keeps_cached_reads(database, phased_project):
+    project_id, _, tasks = phased_project
+    critical_path.refresh(full=True)
+    written = []
+    database.on_tables_changed(written.append)
+
+    critical_path.refresh(full=True)
+    assert written == []
+
+    # A longer task moves the projected finish, and with it the deviations
+    database.execute_write("UPDATE tasks SET duration_days = 4 WHERE id = ?", (tasks[1],))
+    written.clear()
+    critical_path.refresh()
+    assert written == [{'schedule', 'schedule_dirty', 'projects', 'sub_projects'}]
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from tests.conftest import wait_for
+from utils import jira_sync
+
+class JiraStandIn:
+    """
+    A local HTTP server answering like Jira Server's REST API
+
+    issues maps an issue key to its status; a POST search for
+    "key in (...)" returns the known ones, at most page_size per page
+    whatever maxResults asks for. With fail set every request gets a 401.
+    """
+
+    def __init__(self):
+        self.issues = {}
+        self.page_size = 50
+        self.fail = False
+        self.searches = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_json(self, body, status=200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if stand_in.fail:
+                    return self.send_json({"errorMessages": ["Unauthorized"]}, 401)
+                if self.path.startswith("/rest/api/2/field"):
+                    return self.send_json([])
+                self.send_json({}, 404)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if stand_in.fail:
+                    return self.send_json({"errorMessages": ["Unauthorized"]}, 401)
+                keys = request["jql"][len("key in ("):-1].split(", ")
+                start, limit = request["startAt"], min(request["maxResults"], stand_in.page_size)
+                stand_in.searches.append((keys, start))
+                found = [key for key in keys if key in stand_in.issues]
+                self.send_json({"startAt": start, "total": len(found), "issues": [
+                    {"key": key, "fields": {"status": {"name": stand_in.issues[key]}, "summary": key,
+                                            "updated": "2026-10-01T10:00:00.000+0000"}}
+                    for key in found[start:start + limit]]})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stand_in():
+    server = JiraStandIn()
+    yield server
+    server.close()
+
+@pytest.fixture
+def settings(database, stand_in):
+    """Jira settings pointing at the stand-in, saved as the app's connection"""
+    settings = {"enabled": True, "url": stand_in.url, "username": "ada", "api_token": "secret"}
+    database.execute_write(
+        "INSERT INTO connections (name, settings) VALUES ('jira', ?) "
+        "ON CONFLICT (name) DO UPDATE SET settings = excluded.settings", (json.dumps(settings),))
+    yield settings
+    database.execute_write("DELETE FROM connections WHERE name = 'jira'")
+    jira_sync._last_failure = float("-inf")
+
+def cached_issues(database, keys):
+    return database.execute_query(
+        "SELECT issue_key, status FROM jira_issues WHERE issue_key IN ({}) ORDER BY issue_key".format(
+            ','.join(['?'] * len(keys))), keys)
+
+def test_search_follows_pages_past_the_server_cap(database, stand_in, settings):
+    keys = [f"PAGE-{i}" for i in range(1, 6)]
+    stand_in.issues.update({key: "Done" for key in keys})
+    stand_in.page_size = 2
+    assert jira_sync.sync_issues(keys, settings) == 5
+    assert [start for _, start in stand_in.searches] == [0, 2, 4]
+    assert cached_issues(database, keys) == [(key, "Done") for key in keys]
+
+def test_keys_are_searched_in_chunks(database, stand_in, settings, monkeypatch):
+    monkeypatch.setattr(jira_sync, "JIRA_SYNC_CHUNK_SIZE", 2)
+    keys = [f"CHUNK-{i}" for i in range(1, 6)]
+    stand_in.issues.update({key: "In Progress" for key in keys})
+    jira_sync.sync_issues(keys, settings)
+    assert sorted(len(searched) for searched, _ in stand_in.searches) == [1, 2, 2]
+    assert sorted(key for searched, _ in stand_in.searches for key in searched) == keys
+    assert len(cached_issues(database, keys)) == 5
+
+def test_sync_upserts_the_cache(database, stand_in, settings):
+    stand_in.issues.update({"UPSERT-1": "To Do"})
+    # Lower-case and duplicate tickets are one key; unknown keys are cached without a status
+    assert jira_sync.sync_issues(["upsert-1", " UPSERT-1", "UPSERT-2", "not a key"], settings) == 2
+    assert cached_issues(database, ["UPSERT-1", "UPSERT-2"]) == [("UPSERT-1", "To Do"), ("UPSERT-2", None)]
+    assert set(jira_sync.get_issue_statuses(["UPSERT-1", "UPSERT-2"])) == {"UPSERT-1"}
+
+    # Fresh keys aren't fetched again until forced
+    stand_in.issues["UPSERT-1"] = "Done"
+    assert jira_sync.sync_issues(["UPSERT-1"], settings) == 0
+    assert len(stand_in.searches) == 1
+    jira_sync.sync_issues(["UPSERT-1"], settings, force=True)
+    assert cached_issues(database, ["UPSERT-1"]) == [("UPSERT-1", "Done")]
+    assert jira_sync.get_issue_statuses(["UPSERT-1"])["UPSERT-1"][0] == "Done"
+
+def test_failed_sync_leaves_the_page_usable(database, stand_in, settings):
+    project_id = database.execute_write(
+        "INSERT INTO projects (name, start_date, end_date) VALUES ('Jira down', '2026-10-01', '2026-11-01')").lastrowid
+    database.execute_write("INSERT INTO tasks (project_id, name, status, jira_ticket) VALUES (?, 'Cached', 'started', "
+                           "'DOWN-1'), (?, 'Unknown', 'started', 'DOWN-2')", (project_id, project_id))
+    # DOWN-1 was fetched a day ago, so it is stale but still shown
+    database.execute_write("INSERT INTO jira_issues (issue_key, status, fetched_at) VALUES ('DOWN-1', 'Review', ?)",
+                           ("2026-10-17T09:00:00",))
+    stand_in.fail = True
+
+    started = time.monotonic()
+    assert jira_sync.sync_issues_in_background(["DOWN-1", "DOWN-2"])
+    assert time.monotonic() - started < 1
+    assert wait_for(lambda: jira_sync._last_failure > float("-inf"), timeout=30)
+    # No new sync is started within the retry delay
+    assert not jira_sync.sync_issues_in_background(["DOWN-1", "DOWN-2"])
+
+    at = AppTest.from_file("../app.py", default_timeout=60)
+    at.session_state["nav"] = "Projects & Tasks"
+    at.session_state["view"] = "detail"
+    at.session_state["selected_project_id"] = project_id
+    at.session_state["selected_project_name"] = "Jira down"
+    at.run()
+    assert not at.exception
+    assert [caption.value for caption in at.caption if "Jira" in caption.value] == [
+        "Jira statuses as of 2026-10-17 09:00"]
+    assert cached_issues(database, ["DOWN-1", "DOWN-2"]) == [("DOWN-1", "Review")]
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+import pytest
+
+from tests.conftest import wait_for
+from utils import scheduler
+from utils.scheduler import ReminderScheduler
+
+@pytest.fixture(autouse=True)
+def no_app_scheduler():
+    """Stop the process-wide scheduler app.py starts, so only the test's own one announces"""
+    scheduler._scheduler.stop(timeout=5)
+
+@pytest.fixture
+def due_reminder(database):
+    """A reminder that fell due yesterday, on a task of its own"""
+    task_id = database.execute_write(
+        "INSERT INTO tasks (name, status) VALUES ('Send the invoice', 'not started')").lastrowid
+    reminder_id = database.execute_write(
+        "INSERT INTO reminders (task_id, reminder_date, note, followed_up) VALUES (?, ?, 'Chase it', 0)",
+        (task_id, (date.today() - timedelta(days=1)).isoformat())).lastrowid
+    return reminder_id
+
+def run_scheduler(sent: list, settle: float = 0.3) -> ReminderScheduler:
+    """Start a scheduler recording what it sends, let it announce, and stop it"""
+    scheduler = ReminderScheduler(notifiers=[sent.append], max_sleep=0.1)
+    scheduler.start()
+    try:
+        scheduler.due()
+        wait_for(lambda: False, timeout=settle)
+    finally:
+        scheduler.stop(timeout=5)
+    return scheduler
+
+def announcements(sent: list, reminder_id: int) -> int:
+    return sum(1 for reminder in sent if reminder.id == reminder_id)
+
+def test_restart_does_not_announce_again(database, due_reminder):
+    sent = []
+    run_scheduler(sent)
+    assert announcements(sent, due_reminder) == 1
+    assert database.execute_query("SELECT announced_at IS NOT NULL FROM reminders WHERE id = ?",
+                                  (due_reminder,)) == [(1,)]
+
+    # A new process starts with an empty scheduler
+    run_scheduler(sent)
+    assert announcements(sent, due_reminder) == 1
+
+def test_pending_again_is_announced_again(database, due_reminder):
+    sent = []
+    run_scheduler(sent)
+    database.execute_write("UPDATE reminders SET followed_up = 1 WHERE id = ?", (due_reminder,))
+    database.execute_write("UPDATE reminders SET followed_up = 0 WHERE id = ?", (due_reminder,))
+    run_scheduler(sent)
+    assert announcements(sent, due_reminder) == 2
+
+def test_announced_reminders_stay_listed_as_due(database, due_reminder):
+    sent = []
+    scheduler = run_scheduler(sent)
+    assert due_reminder in [reminder.id for reminder in scheduler.due()]
@@ -0,0 +1,353 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import utils.database as db
+from utils.jira_sync import normalize_key
+
+logger = logging.getLogger(__name__)
+
+# Concurrent listings per link refresh, and pooled HTTP connections per client
+BITBUCKET_WORKERS = int(os.environ.get('PROJECTFORGE_BITBUCKET_WORKERS', '4'))
+
+# Connect and read timeouts of a single request (seconds)
+BITBUCKET_CONNECT_TIMEOUT = float(os.environ.get('PROJECTFORGE_BITBUCKET_CONNECT_TIMEOUT', '5'))
+BITBUCKET_TIMEOUT = float(os.environ.get('PROJECTFORGE_BITBUCKET_TIMEOUT', '15'))
+
+# Retries of rate limited or unavailable requests, with exponential backoff
+# from BITBUCKET_BACKOFF_BASE up to BITBUCKET_MAX_BACKOFF seconds unless the
+# response says how long to wait
+BITBUCKET_MAX_RETRIES = int(os.environ.get('PROJECTFORGE_BITBUCKET_MAX_RETRIES', '5'))
+BITBUCKET_BACKOFF_BASE = float(os.environ.get('PROJECTFORGE_BITBUCKET_BACKOFF_BASE', '1'))
+BITBUCKET_MAX_BACKOFF = float(os.environ.get('PROJECTFORGE_BITBUCKET_MAX_BACKOFF', '60'))
+
+# Pages read per listing of pull requests or commits
+BITBUCKET_MAX_PAGES = int(os.environ.get('PROJECTFORGE_BITBUCKET_MAX_PAGES', '10'))
+
+# Responses kept on disk for conditional requests
+BITBUCKET_CACHE_DIR = os.environ.get('PROJECTFORGE_BITBUCKET_CACHE_DIR', 'data/bitbucket_cache')
+
+# Minimum time between background link refreshes (seconds)
+BITBUCKET_REFRESH_INTERVAL = float(os.environ.get('PROJECTFORGE_BITBUCKET_REFRESH_INTERVAL', '600'))
+
+# Statuses worth retrying
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Jira keys as written in titles, branch names and commit messages
+MENTIONED_KEY_RE = re.compile(r'\b[A-Za-z][A-Za-z0-9_]*-[1-9][0-9]*\b')
+
+UPSERT_LINK = """
+    INSERT INTO task_code_links (task_id, kind, repository, ref, title, url, author, state, updated_on)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (task_id, kind, repository, ref) DO UPDATE SET
+        title = excluded.title,
+        url = excluded.url,
+        author = excluded.author,
+        state = excluded.state,
+        updated_on = excluded.updated_on
+"""
+
+class BitbucketClient:
+    """
+    Bitbucket Cloud REST client.
+
+    One pooled keep-alive session per client, timeouts on every request,
+    and retries with backoff on rate limiting (honouring Retry-After and
+    X-RateLimit-Reset) or temporary unavailability. Responses that carry
+    an ETag or Last-Modified are kept on disk and revalidated with
+    conditional requests, so unchanged pages cost a 304.
+    """
+
+    def __init__(self, settings: Dict[str, Any], cache_dir: Optional[str] = BITBUCKET_CACHE_DIR):
+        self.base_url = settings["url"].rstrip("/") + "/api/2.0"
+        self.workspace = settings.get("workspace", "")
+        self.repository = settings.get("repository", "")
+        self.cache_dir = cache_dir
+        self.session = requests.Session()
+        self.session.auth = (settings["username"], settings["app_password"])
+        self.session.headers["Accept"] = "application/json"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BITBUCKET_WORKERS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _url(self, path: str) -> str:
+        return path if path.startswith(("http://", "https://")) else self.base_url + path
+
+    def _cache_file(self, url: str, params: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        identity = json.dumps([self.session.auth[0], url, params], sort_keys=True, default=str)
+        return os.path.join(self.cache_dir, hashlib.sha256(identity.encode()).hexdigest() + ".json")
+
+    def _read_cache(self, path: Optional[str]) -> Optional[Dict[str, Any]]:
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, path: Optional[str], entry: Dict[str, Any]):
+        if path is None:
+            return
+        # Written aside and renamed, so readers never see a partial file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    def _backoff(self, response: requests.Response, attempt: int) -> float:
+        """Seconds to wait before retrying a response"""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            return min(max(delay, 0.0), BITBUCKET_MAX_BACKOFF)
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset:
+            delay = float(reset)
+            # Either an epoch timestamp or seconds from now
+            if delay > 1e9:
+                delay -= time.time()
+            return min(max(delay, 0.0), BITBUCKET_MAX_BACKOFF)
+        delay = BITBUCKET_BACKOFF_BASE * 2 ** attempt
+        return min(delay * random.uniform(0.5, 1.0), BITBUCKET_MAX_BACKOFF)
+
+    def get_json(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET a resource, revalidating a cached copy and retrying when rate limited"""
+        url = self._url(path)
+        cache_file = self._cache_file(url, params)
+        cached = self._read_cache(cache_file)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(BITBUCKET_MAX_RETRIES + 1):
+            response = self.session.get(url, params=params, headers=headers,
+                                        timeout=(BITBUCKET_CONNECT_TIMEOUT, BITBUCKET_TIMEOUT))
+            if response.status_code == 304 and cached:
+                return cached["body"]
+            if response.status_code in RETRY_STATUSES and attempt < BITBUCKET_MAX_RETRIES:
+                delay = self._backoff(response, attempt)
+                logger.info("Bitbucket returned %s for %s, retrying in %.1fs", response.status_code, url, delay)
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            body = response.json()
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self._write_cache(cache_file, {"etag": etag, "last_modified": last_modified, "body": body})
+            return body
+
+    def paginate(self, path: str, params: Optional[Dict[str, Any]] = None,
+                 max_pages: int = BITBUCKET_MAX_PAGES) -> Iterator[Dict[str, Any]]:
+        """Yield the values of a paged listing, following its next links"""
+        page = self.get_json(path, params)
+        for _ in range(max_pages):
+            yield from page.get("values", [])
+            if not page.get("next"):
+                return
+            page = self.get_json(page["next"])
+
+    def current_user(self) -> Dict[str, Any]:
+        """Get the authenticated user"""
+        return self.get_json("/user")
+
+    def repositories(self) -> List[str]:
+        """Get the configured repository, or every repository of the workspace"""
+        if self.repository:
+            return [self.repository]
+        return [repo["slug"] for repo in self.paginate(f"/repositories/{self.workspace}", {"pagelen": 100})]
+
+    def pull_requests(self, repository: str) -> Iterator[Dict[str, Any]]:
+        """Yield the pull requests of a repository in any state, most recently updated first"""
+        return self.paginate(f"/repositories/{self.workspace}/{repository}/pullrequests", {
+            "state": ["OPEN", "MERGED", "DECLINED", "SUPERSEDED"],
+            "sort": "-updated_on",
+            "pagelen": 50,
+        })
+
+    def commits(self, repository: str) -> Iterator[Dict[str, Any]]:
+        """Yield the commits of a repository, newest first"""
+        return self.paginate(f"/repositories/{self.workspace}/{repository}/commits", {"pagelen": 100})
+
+# Clients by settings hash, so sessions and their connections are reused
+_clients: Dict[str, BitbucketClient] = {}
+_clients_lock = threading.Lock()
+
+@db.cached('connections')
+def load_settings() -> Dict[str, Any]:
+    """Get the saved Bitbucket connection settings ({} if there are none)"""
+    rows = db.execute_query("SELECT settings FROM connections WHERE name = 'bitbucket'")
+    if not rows or not rows[0][0]:
+        return {}
+    try:
+        return json.loads(rows[0][0])
+    except json.JSONDecodeError:
+        return {}
+
+def is_configured(settings: Dict[str, Any]) -> bool:
+    """Check that the settings enable Bitbucket and have everything needed to connect"""
+    return bool(settings.get("enabled") and settings.get("url") and settings.get("username")
+                and settings.get("app_password") and settings.get("workspace"))
+
+def get_client(settings: Dict[str, Any]) -> BitbucketClient:
+    """Get the client for some settings, creating it on first use"""
+    identity = {name: settings.get(name) for name in ("url", "username", "app_password", "workspace", "repository")}
+    key = hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = BitbucketClient(settings)
+        return client
+
+def _mentioned_keys(*texts: Optional[str]) -> set:
+    return {match.upper() for text in texts if text for match in MENTIONED_KEY_RE.findall(text)}
+
+def _pull_request_links(client: BitbucketClient, repository: str, tasks_by_key: Dict[str, List[int]]) -> List[tuple]:
+    rows = []
+    for pr in client.pull_requests(repository):
+        branch = ((pr.get("source") or {}).get("branch") or {}).get("name")
+        for key in _mentioned_keys(pr.get("title"), pr.get("description"), branch) & tasks_by_key.keys():
+            for task_id in tasks_by_key[key]:
+                rows.append((
+                    task_id, "pullrequest", repository, str(pr["id"]), pr.get("title"),
+                    ((pr.get("links") or {}).get("html") or {}).get("href"),
+                    (pr.get("author") or {}).get("display_name"), pr.get("state"), pr.get("updated_on"),
+                ))
+    return rows
+
+def _commit_links(client: BitbucketClient, repository: str, tasks_by_key: Dict[str, List[int]]) -> List[tuple]:
+    rows = []
+    for commit in client.commits(repository):
+        message = commit.get("message") or ""
+        for key in _mentioned_keys(message) & tasks_by_key.keys():
+            author = commit.get("author") or {}
+            for task_id in tasks_by_key[key]:
+                rows.append((
+                    task_id, "commit", repository, commit["hash"], message.strip().split("\n")[0],
+                    ((commit.get("links") or {}).get("html") or {}).get("href"),
+                    (author.get("user") or {}).get("display_name") or author.get("raw"), None, commit.get("date"),
+                ))
+    return rows
+
+def link_tasks(settings: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Link tasks to the pull requests and commits that mention their Jira keys
+
+    Pull requests and commits of every repository are listed concurrently
+    and matched against the tasks' jira_ticket keys. Each pass replaces
+    the links: those found are upserted into task_code_links and the rest
+    deleted, in one write, so a changed or cleared jira_ticket or a pull
+    request that no longer mentions a key drops its link. Nothing is
+    written if a listing fails. Returns the number of links found; 0 if
+    Bitbucket isn't configured.
+    """
+    settings = load_settings() if settings is None else settings
+    if not is_configured(settings):
+        return 0
+
+    tasks_by_key: Dict[str, List[int]] = defaultdict(list)
+    for task_id, jira_ticket in db.execute_query(
+        "SELECT id, jira_ticket FROM tasks WHERE jira_ticket IS NOT NULL AND jira_ticket != ''"
+    ):
+        key = normalize_key(jira_ticket)
+        if key:
+            tasks_by_key[key].append(task_id)
+
+    rows = []
+    if tasks_by_key:
+        client = get_client(settings)
+        jobs = [(fetch, repository) for repository in client.repositories()
+                for fetch in (_pull_request_links, _commit_links)]
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(BITBUCKET_WORKERS, len(jobs)),
+                                    thread_name_prefix="projectforge-bitbucket") as pool:
+                results = pool.map(lambda job: job[0](client, job[1], tasks_by_key), jobs)
+                rows = [row for job_rows in results for row in job_rows]
+
+    def replace_links(cursor):
+        db._execute(cursor, UPSERT_LINK, rows, many=True)
+        db._execute(cursor, """
+            DELETE FROM task_code_links
+            WHERE (task_id, kind, repository, ref) NOT IN (
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'),
+                       json_extract(value, '$[2]'), json_extract(value, '$[3]')
+                FROM json_each(?)
+            )
+        """, (json.dumps([row[:4] for row in rows]),))
+    db.run_write(replace_links, ('task_code_links',))
+    return len(rows)
+
+# Link refreshes run one at a time, off the page render
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="projectforge-bitbucket-links")
+_refresh_lock = threading.Lock()
+_refresh_future: Optional[Future] = None
+_last_refresh = float("-inf")
+
+def _refresh_links():
+    try:
+        count = link_tasks()
+        logger.info("Linked %s Bitbucket pull requests and commits to tasks", count)
+    except Exception:
+        logger.exception("Linking Bitbucket pull requests and commits failed")
+
+def refresh_links_in_background(force: bool = False) -> bool:
+    """
+    Start a link refresh on a background thread and return immediately
+
+    Nothing is started while a refresh is running, within
+    BITBUCKET_REFRESH_INTERVAL of the last one (unless forced), or if
+    Bitbucket isn't configured. Returns whether a refresh was started.
+    """
+    global _refresh_future, _last_refresh
+    with _refresh_lock:
+        if _refresh_future is not None and not _refresh_future.done():
+            return False
+        if not force and time.monotonic() - _last_refresh < BITBUCKET_REFRESH_INTERVAL:
+            return False
+        if not is_configured(load_settings()):
+            return False
+        _last_refresh = time.monotonic()
+        _refresh_future = _refresh_executor.submit(_refresh_links)
+        return True
+
+@db.cached('task_code_links')
+def get_task_links(task_ids: Iterable[int]) -> Dict[int, List[tuple]]:
+    """
+    Get the linked pull requests and commits of some tasks
+
+    Returns {task_id: [(kind, repository, ref, title, url, author, state,
+    updated_on), ...]}, pull requests first and newest first within a kind.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return {}
+    links = defaultdict(list)
+    for task_id, *link in db.execute_query("""
+        SELECT task_id, kind, repository, ref, title, url, author, state, updated_on
+        FROM task_code_links
+        WHERE task_id IN ({})
+        ORDER BY task_id, kind DESC, updated_on DESC
+    """.format(','.join(['?'] * len(task_ids))), task_ids):
+        links[task_id].append(tuple(link))
+    return dict(links)
@@ -0,0 +1,473 @@
+"""
+Bulk import and export of teams, members, projects, sub-projects and tasks.
+
+Rows are streamed from CSV, JSONL or Parquet in chunks. Each chunk is
+resolved, validated and inserted before the next one is read, so memory
+use stays flat however large the file is. Foreign keys can be given by
+name (team, project, sub_project, assignee or assignee_email) instead of
+by id, and are resolved through hash maps loaded once per import. Exports
+stream out the same way, with the same columns, so an export can be
+imported again.
+
+Usage (from the repository root):
+
+    python -m utils.bulk import tasks backlog.csv
+    python -m utils.bulk export projects projects.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+from collections import namedtuple
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+import utils.database as db
+from utils.models import Project, SubProject, Task, Team, TeamMember
+
+# Rows read, validated and inserted per transaction
+BULK_CHUNK_SIZE = int(os.environ.get('PROJECTFORGE_BULK_CHUNK_SIZE', '5000'))
+
+# Row errors kept in an import result; the rest are only counted
+BULK_MAX_ERRORS = int(os.environ.get('PROJECTFORGE_BULK_MAX_ERRORS', '1000'))
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Outcome of an import: rows read, rows inserted, and (row number, message)
+# for the first BULK_MAX_ERRORS rows that were skipped
+ImportResult = namedtuple('ImportResult', ['read', 'inserted', 'failed', 'errors'])
+
+Source = Union[str, os.PathLike, BinaryIO]
+
+# Marks a name shared by several rows, which can't be resolved
+_AMBIGUOUS = object()
+
+class _Lookups:
+    """Name-to-id hash maps for resolving foreign keys, loaded on first use"""
+
+    # name: (query, key of a row, id of a row)
+    QUERIES: Dict[str, Tuple[str, Callable, Callable]] = {
+        'team': ("SELECT id, name FROM teams", lambda row: _key(row[1]), lambda row: row[0]),
+        'member_email': ("SELECT id, email FROM team_members", lambda row: _key(row[1]), lambda row: row[0]),
+        'member_name': ("SELECT id, first_name || ' ' || last_name FROM team_members",
+                        lambda row: _key(row[1]), lambda row: row[0]),
+        'project': ("SELECT id, name FROM projects", lambda row: _key(row[1]), lambda row: row[0]),
+        'sub_project': ("SELECT id, project_id, name FROM sub_projects",
+                        lambda row: (row[1], _key(row[2])), lambda row: row[0]),
+    }
+
+    # Tables whose ids may be given directly
+    ID_TABLES = {'team_id': 'teams', 'assigned_to': 'team_members', 'project_id': 'projects',
+                 'sub_project_id': 'sub_projects'}
+
+    def __init__(self):
+        self._maps: Dict[str, Dict[Any, Any]] = {}
+        self._ids: Dict[str, set] = {}
+
+    def map(self, name: str) -> Dict[Any, Any]:
+        if name not in self._maps:
+            query, key_of, id_of = self.QUERIES[name]
+            self._maps[name] = {}
+            for row in db.execute_query(query):
+                self.add(name, key_of(row), id_of(row))
+        return self._maps[name]
+
+    def add(self, name: str, key: Any, id: int):
+        """Register a row, marking keys that are already taken as ambiguous"""
+        mapping = self._maps.get(name)
+        if mapping is None or key is None or (isinstance(key, tuple) and key[-1] is None):
+            return
+        mapping[key] = _AMBIGUOUS if key in mapping and mapping[key] != id else id
+
+    def ids(self, column: str) -> set:
+        table = self.ID_TABLES[column]
+        if table not in self._ids:
+            self._ids[table] = {id for id, in db.execute_query(f"SELECT id FROM {table}")}
+        return self._ids[table]
+
+    def add_id(self, column: str, id: int):
+        table = self.ID_TABLES[column]
+        if table in self._ids:
+            self._ids[table].add(id)
+
+    def resolve(self, row: Dict[str, Any], column: str, lookup: str, value: Any, label: str) -> None:
+        """Set row[column] from an id or a name, raising ValueError if it doesn't resolve"""
+        if column in row:
+            try:
+                id = int(row[column])
+            except (TypeError, ValueError):
+                raise ValueError(f"{column} {row[column]!r} is not an id")
+            if id not in self.ids(column):
+                raise ValueError(f"{column} {id} does not exist")
+            row[column] = id
+            return
+        if value is None:
+            return
+        key = (*value[:-1], _key(value[-1])) if isinstance(value, tuple) else _key(value)
+        id = self.map(lookup).get(key)
+        if id is None:
+            raise ValueError(f"Unknown {label} {_describe(value)}")
+        if id is _AMBIGUOUS:
+            raise ValueError(f"{_describe(value)} matches several {label}s; give {column} instead")
+        row[column] = id
+
+def _key(value: Any) -> Optional[str]:
+    """Normalize a name for matching: trimmed, case-insensitive"""
+    if value is None:
+        return None
+    text = str(value).strip().casefold()
+    return text or None
+
+def _describe(value: Any) -> str:
+    return repr(value[-1] if isinstance(value, tuple) else value)
+
+def _clean(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop empty values (blank CSV cells, nulls, NaN) so model defaults apply"""
+    row = {}
+    for name, value in raw.items():
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        row[name.strip()] = value
+    return row
+
+# Resolvers turn a cleaned input row into model fields in place
+
+def _resolve_team(row: Dict[str, Any], lookups: _Lookups):
+    pass
+
+def _resolve_member(row: Dict[str, Any], lookups: _Lookups):
+    lookups.resolve(row, 'team_id', 'team', row.pop('team', None), "team")
+
+def _resolve_assignee(row: Dict[str, Any], lookups: _Lookups):
+    email, name = row.pop('assignee_email', None), row.pop('assignee', None)
+    if email is not None and 'assigned_to' not in row:
+        lookups.resolve(row, 'assigned_to', 'member_email', email, "member email")
+    else:
+        lookups.resolve(row, 'assigned_to', 'member_name', name, "member")
+
+def _resolve_project(row: Dict[str, Any], lookups: _Lookups):
+    _resolve_assignee(row, lookups)
+
+def _resolve_sub_project(row: Dict[str, Any], lookups: _Lookups):
+    lookups.resolve(row, 'project_id', 'project', row.pop('project', None), "project")
+    _resolve_assignee(row, lookups)
+
+def _resolve_task(row: Dict[str, Any], lookups: _Lookups):
+    lookups.resolve(row, 'project_id', 'project', row.pop('project', None), "project")
+    sub_project = row.pop('sub_project', None)
+    if sub_project is not None and 'sub_project_id' not in row:
+        if 'project_id' not in row:
+            raise ValueError("sub_project needs a project")
+        sub_project = (row['project_id'], sub_project)
+    lookups.resolve(row, 'sub_project_id', 'sub_project', sub_project, "sub-project")
+    _resolve_assignee(row, lookups)
+
+class BulkEntity(namedtuple('BulkEntity', [
+        'name', 'model', 'table', 'resolve', 'registers', 'export_query', 'export_columns'])):
+    """
+    How one kind of row is imported and exported
+
+    registers maps lookups to the function giving a new row's key, so rows
+    inserted by an import can be referred to by later rows. export_query
+    selects the export columns for ids after ? in id order, LIMIT ?.
+    """
+
+ENTITIES: Dict[str, BulkEntity] = {entity.name: entity for entity in [
+    BulkEntity(
+        'teams', Team, 'teams', _resolve_team,
+        {'team': lambda model: _key(model.name)},
+        """SELECT id, name, description, location FROM teams WHERE id > ? ORDER BY id LIMIT ?""",
+        [('id', int), ('name', str), ('description', str), ('location', str)],
+    ),
+    BulkEntity(
+        'members', TeamMember, 'team_members', _resolve_member,
+        {'member_email': lambda model: _key(model.email), 'member_name': lambda model: _key(model.full_name)},
+        """SELECT m.id, m.first_name, m.last_name, m.email, t.name
+           FROM team_members m
+           LEFT JOIN teams t ON t.id = m.team_id
+           WHERE m.id > ? ORDER BY m.id LIMIT ?""",
+        [('id', int), ('first_name', str), ('last_name', str), ('email', str), ('team', str)],
+    ),
+    BulkEntity(
+        'projects', Project, 'projects', _resolve_project,
+        {'project': lambda model: _key(model.name)},
+        """SELECT p.id, p.name, p.description, p.start_date, p.end_date, p.deviation,
+                  tm.first_name || ' ' || tm.last_name, tm.email
+           FROM projects p
+           LEFT JOIN team_members tm ON tm.id = p.assigned_to
+           WHERE p.id > ? ORDER BY p.id LIMIT ?""",
+        [('id', int), ('name', str), ('description', str), ('start_date', str), ('end_date', str),
+         ('deviation', int), ('assignee', str), ('assignee_email', str)],
+    ),
+    BulkEntity(
+        'sub_projects', SubProject, 'sub_projects', _resolve_sub_project,
+        {'sub_project': lambda model: (model.project_id, _key(model.name))},
+        """SELECT sp.id, p.name, sp.name, sp.description, sp.start_date, sp.end_date, sp.deviation,
+                  tm.first_name || ' ' || tm.last_name, tm.email
+           FROM sub_projects sp
+           LEFT JOIN projects p ON p.id = sp.project_id
+           LEFT JOIN team_members tm ON tm.id = sp.assigned_to
+           WHERE sp.id > ? ORDER BY sp.id LIMIT ?""",
+        [('id', int), ('project', str), ('name', str), ('description', str), ('start_date', str),
+         ('end_date', str), ('deviation', int), ('assignee', str), ('assignee_email', str)],
+    ),
+    BulkEntity(
+        'tasks', Task, 'tasks', _resolve_task,
+        {},
+        """SELECT t.id, p.name, sp.name, t.name, t.description, t.jira_ticket, t.status, t.duration_days,
+                  tm.first_name || ' ' || tm.last_name, tm.email
+           FROM tasks t
+           LEFT JOIN projects p ON p.id = t.project_id
+           LEFT JOIN sub_projects sp ON sp.id = t.sub_project_id
+           LEFT JOIN team_members tm ON tm.id = t.assigned_to
+           WHERE t.id > ? ORDER BY t.id LIMIT ?""",
+        [('id', int), ('project', str), ('sub_project', str), ('name', str), ('description', str),
+         ('jira_ticket', str), ('status', str), ('duration_days', int), ('assignee', str), ('assignee_email', str)],
+    ),
+]}
+
+# Singular entity types used in the activity log
+_ACTIVITY_TYPES = {'teams': 'team', 'members': 'member', 'projects': 'project', 'sub_projects': 'subproject',
+                   'tasks': 'task'}
+
+def get_entity(name: str) -> BulkEntity:
+    """Get an entity by name, raising ValueError for unknown names"""
+    try:
+        return ENTITIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown entity {name!r}; expected one of {', '.join(ENTITIES)}")
+
+def detect_format(path: Union[str, os.PathLike], fmt: Optional[str] = None) -> str:
+    """Get the file format, from fmt or else the file extension"""
+    fmt = (fmt or os.path.splitext(os.fspath(path))[1].lstrip('.')).lower()
+    fmt = {'ndjson': 'jsonl', 'pq': 'parquet'}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    return fmt
+
+def _open_text(source: Source) -> io.TextIOBase:
+    if isinstance(source, (str, os.PathLike)):
+        # utf-8-sig drops the BOM spreadsheet programs like to add
+        return open(source, encoding='utf-8-sig', newline='')
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def read_chunks(source: Source, fmt: str, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Stream the rows of a file as lists of up to chunk_size dicts"""
+    if fmt == 'parquet':
+        # Optional dependency, only needed for Parquet files
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    stream = _open_text(source)
+    try:
+        if fmt == 'csv':
+            yield from _chunks(csv.DictReader(stream), chunk_size)
+        else:
+            yield from _chunks((json.loads(line) for line in stream if line.strip()), chunk_size)
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+        else:
+            # Leave the caller's file open
+            stream.detach()
+
+def _validate(adapter: TypeAdapter, model: Type[BaseModel], rows: List[Dict[str, Any]]) -> List[Any]:
+    """Validate a batch in one call; on errors, find which rows failed"""
+    try:
+        return adapter.validate_python(rows)
+    except ValidationError:
+        pass
+    # Only failing batches pay for validating rows one by one
+    results = []
+    for row in rows:
+        try:
+            results.append(model.model_validate(row))
+        except ValidationError as e:
+            results.append(e)
+    return results
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" if detail['loc'] else detail['msg']
+        for detail in error.errors()
+    )
+
+def import_rows(entity_name: str, chunks: Iterable[List[Dict[str, Any]]],
+                on_progress: Optional[Callable[[int, int], None]] = None) -> ImportResult:
+    """
+    Import chunks of rows, one transaction per chunk
+
+    Every row is resolved and validated on its own terms: rows that fail
+    are skipped and reported with their 1-based row number, the others are
+    inserted. Input ids are ignored; rows always get new ids. on_progress
+    is called with (rows read, rows inserted) after each chunk.
+    """
+    entity = get_entity(entity_name)
+    adapter = TypeAdapter(List[entity.model])
+    lookups = _Lookups()
+    columns = [name for name in entity.model.model_fields if name != 'id']
+    read = inserted = failed = 0
+    errors: List[Tuple[int, str]] = []
+
+    def fail(row_number: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_ERRORS:
+            errors.append((row_number, message))
+
+    for chunk in chunks:
+        # Resolve names to ids first: the models only know ids
+        resolved, numbers = [], []
+        for offset, raw in enumerate(chunk, start=read + 1):
+            row = _clean(raw)
+            row.pop('id', None)
+            try:
+                entity.resolve(row, lookups)
+            except ValueError as e:
+                fail(offset, str(e))
+                continue
+            resolved.append(row)
+            numbers.append(offset)
+        read += len(chunk)
+
+        values, models = [], []
+        for number, result in zip(numbers, _validate(adapter, entity.model, resolved)):
+            if isinstance(result, ValidationError):
+                fail(number, _error_message(result))
+                continue
+            stored = result.to_dict()
+            values.append(tuple(stored[column] for column in columns))
+            models.append(result)
+
+        if values:
+            new_ids = db.run_write(
+                lambda cursor, values=values: db.bulk_insert(cursor, entity.table, columns, values),
+                (entity.table,)
+            )
+            for new_id, model in zip(new_ids, models):
+                for lookup, key_of in entity.registers.items():
+                    lookups.add(lookup, key_of(model), new_id)
+                for column, table in _Lookups.ID_TABLES.items():
+                    if table == entity.table:
+                        lookups.add_id(column, new_id)
+            inserted += len(values)
+
+        if on_progress:
+            on_progress(read, inserted)
+
+    if inserted:
+        db.log_activity(
+            action_type="create",
+            entity_type=_ACTIVITY_TYPES[entity.name],
+            entity_id=None,
+            entity_name=None,
+            description=f"Imported {inserted} {entity.name}"
+        )
+    return ImportResult(read, inserted, failed, sorted(errors))
+
+def import_file(entity_name: str, source: Source, fmt: Optional[str] = None,
+                chunk_size: int = BULK_CHUNK_SIZE,
+                on_progress: Optional[Callable[[int, int], None]] = None) -> ImportResult:
+    """Import a CSV, JSONL or Parquet file (a path, or a binary file object with fmt)"""
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', None)
+    if fmt is None and not name:
+        raise ValueError("fmt is needed for file objects without a name")
+    fmt = detect_format(name or '', fmt)
+    return import_rows(entity_name, read_chunks(source, fmt, chunk_size), on_progress)
+
+def iter_export(entity_name: str, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Stream every row of an entity in id order, as lists of up to chunk_size dicts"""
+    entity = get_entity(entity_name)
+    names = [name for name, _ in entity.export_columns]
+    last_id = 0
+    while True:
+        # Keyset pagination: each page is an index range scan
+        rows = db.execute_query(entity.export_query, (last_id, chunk_size))
+        if not rows:
+            return
+        yield [dict(zip(names, row)) for row in rows]
+        last_id = rows[-1][0]
+
+def export_file(entity_name: str, path: Union[str, os.PathLike], fmt: Optional[str] = None,
+                chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Export an entity to a CSV, JSONL or Parquet file; returns the number of rows written"""
+    entity = get_entity(entity_name)
+    fmt = detect_format(path, fmt)
+    names = [name for name, _ in entity.export_columns]
+    written = 0
+
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(name, pa.int64() if kind is int else pa.string())
+                            for name, kind in entity.export_columns])
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in iter_export(entity_name, chunk_size):
+                writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+                written += len(chunk)
+        return written
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=names)
+            writer.writeheader()
+        for chunk in iter_export(entity_name, chunk_size):
+            if fmt == 'csv':
+                writer.writerows(chunk)
+            else:
+                f.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in chunk)
+            written += len(chunk)
+    return written
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m utils.bulk", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("entity", choices=list(ENTITIES))
+    parser.add_argument("path", help="CSV, JSONL or Parquet file")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="rows per transaction")
+    args = parser.parse_args(argv)
+
+    db.ensure_db()
+    if args.action == "export":
+        count = export_file(args.entity, args.path, args.format, args.chunk_size)
+        print(f"Exported {count} {args.entity} to {args.path}")
+        return
+
+    def progress(read: int, inserted: int):
+        print(f"\r{read} read, {inserted} inserted", end="", file=sys.stderr, flush=True)
+
+    result = import_file(args.entity, args.path, args.format, args.chunk_size, progress)
+    db.flush_activity_log()
+    print(file=sys.stderr)
+    for row_number, message in result.errors:
+        print(f"row {row_number}: {message}", file=sys.stderr)
+    if result.failed > len(result.errors):
+        print(f"... and {result.failed - len(result.errors)} more errors", file=sys.stderr)
+    print(f"Imported {result.inserted} of {result.read} {args.entity}")
+    if result.failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+class TableVersions:
+    """
+    Generation counter per table.
+
+    Every committed write bumps the generations of the tables it touched.
+    Cached results remember the generations they were loaded under and are
+    discarded as soon as any of them moves on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._listeners: List[Callable[[Set[str]], None]] = []
+
+    def bump(self, tables: Iterable[str]):
+        """Mark tables as changed and tell the listeners"""
+        tables = set(tables)
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(tables)
+
+    def subscribe(self, listener: Callable[[Set[str]], None]):
+        """Call listener with the set of changed tables after every bump; it must return quickly"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """Get the current generations of tables"""
+        versions = self._versions
+        return tuple(versions.get(table, 0) for table in tables)
+
+class QueryCache:
+    """
+    Thread-safe read-through cache with LRU and TTL bounds.
+
+    Entries are validated against the table generations they depend on, so
+    a write through utils.database invalidates them immediately; the TTL
+    only bounds staleness for changes made outside this process.
+    """
+
+    def __init__(self, versions: TableVersions, max_entries: int = 512, ttl: float = 300.0):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, tables: Tuple[str, ...], loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, loading and storing it on a miss"""
+        # Taken before loading: a write that lands while we load leaves the
+        # entry with an old snapshot, so it's reloaded on the next lookup
+        snapshot = self.versions.snapshot(tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == snapshot:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = loader()
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, snapshot, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Get hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
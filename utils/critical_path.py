@@ -0,0 +1,524 @@
+"""
+Critical path scheduling of projects, sub-projects and tasks.
+
+Tasks take tasks.duration_days calendar days (DEFAULT_TASK_DURATION_DAYS
+when unset, none once completed) and the dependencies table links tasks
+or sub-projects finish-to-start. Every project and sub-project adds a
+start and a finish milestone to the graph: its start comes before its
+tasks and sub-projects and its finish after them, and a sub-project
+dependency runs from the predecessor's finish to the successor's start.
+
+One pass over the graph in topological order (Kahn's algorithm) gives
+each node its earliest start and finish, one in reverse its latest
+finish, so a schedule costs O(V + E). Unfinished work is never scheduled
+before today, which makes the finishes projections. A node's slack is
+how many days it can slip without moving its project's projected finish;
+the critical path is the work without slack. The deviation of a project
+or sub-project, written back to its deviation column, is the number of
+days its projected finish is past its planned end date.
+
+Triggers queue the projects a write affects in schedule_dirty. refresh()
+reschedules only those, together with the projects linked to them by
+dependencies, and ScheduleRefresher calls it in the background after
+writes. add_dependency() refuses links that close a cycle, but moving
+work can still close one; the projects caught in it stay unscheduled
+until it's broken.
+
+Usage (from the repository root):
+
+    python -m utils.critical_path refresh [--full]
+    python -m utils.critical_path depend task|sub_project PREDECESSOR_ID SUCCESSOR_ID
+    python -m utils.critical_path undepend task|sub_project PREDECESSOR_ID SUCCESSOR_ID
+    python -m utils.critical_path show PROJECT_ID
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import utils.database as db
+
+logger = logging.getLogger(__name__)
+
+# Calendar days of a task without a duration
+DEFAULT_TASK_DURATION_DAYS = int(os.environ.get('PROJECTFORGE_DEFAULT_TASK_DURATION_DAYS', '1'))
+
+# Wait after a write before rescheduling, so a burst of edits is handled
+# in one pass (seconds)
+SCHEDULE_REFRESH_DELAY = float(os.environ.get('PROJECTFORGE_SCHEDULE_REFRESH_DELAY', '1'))
+
+# Longest the refresher sleeps without checking whether the day changed
+SCHEDULE_MAX_SLEEP = 3600.0
+
+# Writes to these tables can change a schedule
+SCHEDULE_INPUT_TABLES = frozenset({'projects', 'sub_projects', 'tasks', 'dependencies'})
+
+DEPENDENCY_KINDS = ('task', 'sub_project')
+
+# Scheduled dates of one task, sub-project or project; start and finish
+# are date ordinals, critical means no slack
+ScheduledNode = namedtuple('ScheduledNode', ['kind', 'id', 'project_id', 'start', 'finish', 'slack', 'critical'])
+
+# Projects linked to a set of projects (json_each of ?1) by a dependency,
+# in either direction, as (predecessor's project, successor's project)
+_LINKED_PROJECTS = """
+    SELECT p.project_id, s.project_id FROM {table} s
+    JOIN dependencies d ON d.kind = '{kind}' AND d.successor_id = s.id
+    JOIN {table} p ON p.id = d.predecessor_id
+    WHERE s.project_id IN (SELECT value FROM json_each(?1)) AND p.project_id IS NOT s.project_id
+    UNION
+    SELECT p.project_id, s.project_id FROM {table} p
+    JOIN dependencies d ON d.kind = '{kind}' AND d.predecessor_id = p.id
+    JOIN {table} s ON s.id = d.successor_id
+    WHERE p.project_id IN (SELECT value FROM json_each(?1)) AND p.project_id IS NOT s.project_id
+"""
+
+def _day(value: Optional[str]) -> Optional[int]:
+    """Date ordinal of an ISO date(-time) string, None if it doesn't parse"""
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def _linked_projects(cursor: sqlite3.Cursor, project_ids: Set[int]) -> Set[int]:
+    """Extend a set of projects with every project connected to it by dependencies"""
+    projects = set(project_ids)
+    frontier = list(project_ids)
+    query = " UNION ".join(_LINKED_PROJECTS.format(table=table, kind=kind)
+                           for table, kind in [('tasks', 'task'), ('sub_projects', 'sub_project')])
+    while frontier:
+        found = set()
+        for predecessor, successor in db._execute(cursor, query, (json.dumps(frontier),)):
+            found.update(project for project in (predecessor, successor) if project is not None)
+        frontier = list(found - projects)
+        projects |= found
+    return projects
+
+class ScheduleGraph:
+    """
+    The scheduling graph of a set of projects, loaded from the database
+
+    Nodes are numbered: tasks and the start and finish milestones of
+    projects and sub-projects. Dependencies on work outside the loaded
+    projects are left out, so load whole components (see refresh).
+    """
+
+    def __init__(self):
+        self.nodes: List[tuple] = []             # (kind, id, project_id) of task nodes and milestones
+        self.duration: List[int] = []
+        self.release: List[Optional[int]] = []   # day before which the node can't start
+        self.successors: List[List[int]] = []
+        self.tasks: Dict[int, int] = {}
+        self.starts: Dict[tuple, int] = {}       # (kind, id) -> start milestone
+        self.finishes: Dict[tuple, int] = {}     # (kind, id) -> finish milestone
+        self.planned_end: Dict[tuple, Optional[int]] = {}
+        self.deviation: Dict[tuple, Optional[int]] = {}
+        self.cyclic_projects: Set[int] = set()   # projects schedule() couldn't schedule
+
+    def _add(self, node: tuple, duration: int = 0, release: Optional[int] = None) -> int:
+        self.nodes.append(node)
+        self.duration.append(duration)
+        self.release.append(release)
+        self.successors.append([])
+        return len(self.nodes) - 1
+
+    def _add_container(self, kind: str, id: int, project_id: int, release: Optional[int], end_date, deviation):
+        key = (kind, id)
+        start = self.starts[key] = self._add((kind, id, project_id), release=release)
+        finish = self.finishes[key] = self._add((kind, id, project_id))
+        self.successors[start].append(finish)
+        self.planned_end[key] = _day(end_date)
+        self.deviation[key] = deviation
+        return start, finish
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor, project_ids: Optional[Iterable[int]] = None,
+             today: Optional[date] = None) -> 'ScheduleGraph':
+        """Load the graph of some projects, or of all of them"""
+        graph = cls()
+        today = (today or date.today()).toordinal()
+        if project_ids is None:
+            where, params = "", ()
+        else:
+            where, params = "WHERE {} IN (SELECT value FROM json_each(?))", (json.dumps(sorted(project_ids)),)
+
+        for project_id, start_date, end_date, deviation in db._execute(
+                cursor, "SELECT id, start_date, end_date, deviation FROM projects " + where.format('id'), params):
+            # A project without a start date starts today
+            release = _day(start_date)
+            graph._add_container('project', project_id, project_id, today if release is None else release,
+                                 end_date, deviation)
+
+        for sub_id, project_id, start_date, end_date, deviation in db._execute(
+                cursor, "SELECT id, project_id, start_date, end_date, deviation FROM sub_projects "
+                        + where.format('project_id'), params):
+            parent = ('project', project_id)
+            if parent not in graph.starts:
+                continue
+            start, finish = graph._add_container('sub_project', sub_id, project_id, _day(start_date), end_date,
+                                                 deviation)
+            graph.successors[graph.starts[parent]].append(start)
+            graph.successors[finish].append(graph.finishes[parent])
+
+        for task_id, project_id, sub_id, status, duration in db._execute(
+                cursor, "SELECT id, project_id, sub_project_id, status, duration_days FROM tasks "
+                        + where.format('project_id'), params):
+            container = ('sub_project', sub_id) if ('sub_project', sub_id) in graph.starts else ('project', project_id)
+            if container not in graph.starts:
+                continue
+            if status == 'completed':
+                node = graph._add(('task', task_id, project_id))
+            else:
+                # Remaining work can't happen in the past
+                duration = DEFAULT_TASK_DURATION_DAYS if duration is None else max(duration, 0)
+                node = graph._add(('task', task_id, project_id), duration, today)
+            graph.tasks[task_id] = node
+            graph.successors[graph.starts[container]].append(node)
+            graph.successors[node].append(graph.finishes[container])
+
+        dependencies = db._execute(cursor, """
+            SELECT d.kind, d.predecessor_id, d.successor_id FROM dependencies d
+            JOIN tasks s ON d.kind = 'task' AND s.id = d.successor_id
+            {}
+            UNION ALL
+            SELECT d.kind, d.predecessor_id, d.successor_id FROM dependencies d
+            JOIN sub_projects s ON d.kind = 'sub_project' AND s.id = d.successor_id
+            {}
+        """.format(*[where.format('s.project_id')] * 2), params * 2)
+        for kind, predecessor, successor in dependencies:
+            if kind == 'task':
+                source, target = graph.tasks.get(predecessor), graph.tasks.get(successor)
+            else:
+                source, target = graph.finishes.get((kind, predecessor)), graph.starts.get((kind, successor))
+            if source is not None and target is not None:
+                graph.successors[source].append(target)
+        return graph
+
+    def topological_order(self) -> List[int]:
+        """Order the nodes so every node comes after its predecessors; nodes on or behind a cycle are left out"""
+        indegree = [0] * len(self.nodes)
+        for successors in self.successors:
+            for node in successors:
+                indegree[node] += 1
+        ready = deque(node for node, count in enumerate(indegree) if count == 0)
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for successor in self.successors[node]:
+                indegree[successor] -= 1
+                if indegree[successor] == 0:
+                    ready.append(successor)
+        return order
+
+    def schedule(self) -> List[ScheduledNode]:
+        """
+        Compute the earliest dates and slack of every task, sub-project and project
+
+        A project with work on or behind a dependency cycle can't be
+        scheduled: it's left out of the results and added to
+        cyclic_projects. The others are scheduled as usual, the slack of
+        work ahead of a cycle counting only the work that can be scheduled.
+        """
+        order = self.topological_order()
+        duration, successors = self.duration, self.successors
+        if len(order) < len(self.nodes):
+            ordered = [False] * len(self.nodes)
+            for node in order:
+                ordered[node] = True
+            self.cyclic_projects = {self.nodes[node][2] for node, done in enumerate(ordered) if not done}
+            successors = [[successor for successor in node_successors if ordered[successor]]
+                          for node_successors in successors]
+
+        # Forward pass: earliest start and finish
+        start = [release if release is not None else 0 for release in self.release]
+        finish = [0] * len(self.nodes)
+        for node in order:
+            finish[node] = start[node] + duration[node]
+            for successor in successors[node]:
+                if finish[node] > start[successor]:
+                    start[successor] = finish[node]
+        # Backward pass: latest finish, with each project's finish as its deadline
+        latest = finish[:]
+        for node in reversed(order):
+            if successors[node]:
+                latest[node] = min([latest[successor] - duration[successor] for successor in successors[node]])
+
+        results = []
+        skip = self.cyclic_projects
+        for task_id, node in self.tasks.items():
+            if skip and self.nodes[node][2] in skip:
+                continue
+            slack = latest[node] - finish[node]
+            results.append(ScheduledNode('task', task_id, self.nodes[node][2], start[node], finish[node], slack,
+                                         slack == 0 and duration[node] > 0))
+        for key, first in self.starts.items():
+            if skip and self.nodes[first][2] in skip:
+                continue
+            last = self.finishes[key]
+            slack = latest[last] - finish[last]
+            results.append(ScheduledNode(key[0], key[1], self.nodes[first][2], start[first], finish[last], slack,
+                                         slack == 0))
+        return results
+
+    def deviations(self, scheduled: List[ScheduledNode]) -> Dict[tuple, int]:
+        """Days each project and sub-project is projected to finish after its planned end (0 if on time)"""
+        return {
+            (node.kind, node.id): max(0, node.finish - self.planned_end[(node.kind, node.id)])
+            if self.planned_end[(node.kind, node.id)] is not None else 0
+            for node in scheduled if node.kind != 'task'
+        }
+
+def _refresh_job(cursor: sqlite3.Cursor, full: bool, today: date) -> db.WrittenTables:
+    """
+    Reschedule the dirty projects (or all) and write the results, in one write transaction
+
+    Projects caught in a dependency cycle are logged and left without
+    schedule rows (unscheduled) until the cycle is removed. Only rows
+    whose values changed are written, and only the tables actually
+    changed are reported, so an idle refresh keeps cached reads valid.
+    """
+    empty = {"projects": 0, "tasks": 0, "deviations": 0, "unscheduled": 0}
+    if full:
+        project_ids = None
+    else:
+        dirty = {project_id for project_id, in db._execute(cursor, "SELECT project_id FROM schedule_dirty")}
+        if not dirty:
+            return db.WrittenTables(empty, ())
+        project_ids = _linked_projects(cursor, dirty)
+
+    graph = ScheduleGraph.load(cursor, project_ids, today)
+    scheduled = graph.schedule()
+    deviations = graph.deviations(scheduled)
+    if graph.cyclic_projects:
+        logger.warning("Dependency cycle: projects %s left unscheduled",
+                       ", ".join(map(str, sorted(graph.cyclic_projects))))
+
+    written = set()
+    if project_ids is None:
+        in_projects, ids = "1", ()
+    else:
+        in_projects, ids = "project_id IN (SELECT value FROM json_each(?))", (json.dumps(sorted(project_ids)),)
+    db._execute(cursor, f"DELETE FROM schedule_dirty WHERE {in_projects}", ids)
+    if cursor.rowcount > 0:
+        written.add('schedule_dirty')
+
+    conn = cursor.connection
+    changes = conn.total_changes
+    # Rows of work that's gone or can't be scheduled any more
+    db._execute(cursor, f"""
+        DELETE FROM schedule WHERE {in_projects} AND (kind, id) NOT IN (
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+        )
+    """, ids + (json.dumps([(node.kind, node.id) for node in scheduled]),))
+    # Few distinct days: format each once
+    days = {day: date.fromordinal(day).isoformat()
+            for day in {node.start for node in scheduled} | {node.finish for node in scheduled}}
+    db._execute(cursor, """
+        INSERT INTO schedule VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (kind, id) DO UPDATE SET
+            project_id = excluded.project_id, start_date = excluded.start_date,
+            finish_date = excluded.finish_date, slack_days = excluded.slack_days, critical = excluded.critical
+        WHERE (project_id, start_date, finish_date, slack_days, critical)
+              IS NOT (excluded.project_id, excluded.start_date, excluded.finish_date,
+                      excluded.slack_days, excluded.critical)
+    """, [
+        (node.kind, node.id, node.project_id, days[node.start], days[node.finish], node.slack, int(node.critical))
+        for node in scheduled
+    ], many=True)
+    if conn.total_changes != changes:
+        written.add('schedule')
+
+    # Only changed deviations are written
+    changed = {kind: [(value, id) for (row_kind, id), value in deviations.items()
+                      if row_kind == kind and value != graph.deviation[(row_kind, id)]]
+               for kind in ('project', 'sub_project')}
+    for kind, table in [('project', 'projects'), ('sub_project', 'sub_projects')]:
+        if changed[kind]:
+            db._execute(cursor, f"UPDATE {table} SET deviation = ? WHERE id = ?", changed[kind], many=True)
+            written.add(table)
+    return db.WrittenTables({"projects": sum(1 for kind, _ in deviations if kind == 'project'),
+                             "tasks": sum(1 for node in scheduled if node.kind == 'task'),
+                             "deviations": len(changed['project']) + len(changed['sub_project']),
+                             "unscheduled": len(graph.cyclic_projects)}, written)
+
+_last_full_refresh: Optional[date] = None
+_refresh_lock = threading.Lock()
+
+def refresh(full: bool = False) -> Dict[str, Any]:
+    """
+    Bring the schedule and the deviation columns up to date
+
+    Reschedules the projects queued in schedule_dirty and everything
+    linked to them; everything once a day, as unfinished work moves along
+    with today. Reading, scheduling and writing happen in one write
+    transaction, so no change slips in between. Returns the number of
+    projects and tasks scheduled, of changed deviations and of projects
+    left unscheduled by a dependency cycle, and the time taken.
+    """
+    global _last_full_refresh
+    today = date.today()
+    with _refresh_lock:
+        full = full or _last_full_refresh != today
+        if not full and not db.execute_query("SELECT EXISTS (SELECT 1 FROM schedule_dirty)")[0][0]:
+            return {"projects": 0, "tasks": 0, "deviations": 0, "unscheduled": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        # The job reports the tables it actually changed
+        result = db.run_write(lambda cursor: _refresh_job(cursor, full, today))
+        if full:
+            _last_full_refresh = today
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def add_dependency(kind: str, predecessor_id: int, successor_id: int):
+    """
+    Make successor wait for predecessor to finish (both tasks or both sub-projects)
+
+    Raises ValueError if that would close a cycle, including one through
+    the sub-projects and projects the two belong to.
+    """
+    if kind not in DEPENDENCY_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(DEPENDENCY_KINDS)}")
+    if predecessor_id == successor_id:
+        raise ValueError("Work can't depend on itself")
+    table = 'tasks' if kind == 'task' else 'sub_projects'
+
+    def job(cursor: sqlite3.Cursor):
+        projects = {project_id for project_id, in db._execute(
+            cursor, f"SELECT project_id FROM {table} WHERE id IN (?, ?) AND project_id IS NOT NULL",
+            (predecessor_id, successor_id))}
+        db._execute(cursor, "INSERT OR IGNORE INTO dependencies (kind, predecessor_id, successor_id) VALUES (?, ?, ?)",
+                    (kind, predecessor_id, successor_id))
+        # A cycle fails the job, which rolls the insert back
+        graph = ScheduleGraph.load(cursor, _linked_projects(cursor, projects))
+        if len(graph.topological_order()) < len(graph.nodes):
+            raise ValueError(f"{kind} {successor_id} already comes before {kind} {predecessor_id}")
+    db.run_write(job, ('dependencies', 'schedule_dirty'))
+
+def remove_dependency(kind: str, predecessor_id: int, successor_id: int) -> bool:
+    """Remove a dependency; False if there was none"""
+    return db.execute_write(
+        "DELETE FROM dependencies WHERE kind = ? AND predecessor_id = ? AND successor_id = ?",
+        (kind, predecessor_id, successor_id)
+    ).rowcount > 0
+
+@db.cached('dependencies')
+def get_dependencies(kind: str, successor_id: int) -> List[int]:
+    """Get the ids of the tasks or sub-projects a task or sub-project waits for"""
+    return [predecessor for predecessor, in db.execute_query(
+        "SELECT predecessor_id FROM dependencies WHERE kind = ? AND successor_id = ? ORDER BY predecessor_id",
+        (kind, successor_id))]
+
+@db.cached('schedule')
+def get_project_schedule(project_id: int):
+    """
+    Get the computed schedule of one project
+
+    Rows are (kind, id, start_date, finish_date, slack_days, critical),
+    the project itself first, then sub-projects and tasks by start date.
+    """
+    return db.execute_query("""
+        SELECT kind, id, start_date, finish_date, slack_days, critical FROM schedule
+        WHERE project_id = ?
+        ORDER BY kind != 'project', kind != 'sub_project', start_date, finish_date, id
+    """, (project_id,))
+
+class ScheduleRefresher:
+    """
+    Keeps the schedule current in the background.
+
+    Writes to the scheduling inputs wake a thread, which waits
+    SCHEDULE_REFRESH_DELAY for the burst to end and then calls refresh();
+    it also wakes at least hourly, so the schedule moves on with the date.
+    """
+
+    def __init__(self, delay: float = SCHEDULE_REFRESH_DELAY):
+        self.delay = delay
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._subscribed = False
+
+    def start(self):
+        """Start the refresher thread if it isn't running yet"""
+        with self._lock:
+            if not self._subscribed:
+                db.on_tables_changed(self._on_tables_changed)
+                self._subscribed = True
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="projectforge-schedule", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the refresher thread"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _on_tables_changed(self, tables: set):
+        # Called on the writer thread: only signal
+        if SCHEDULE_INPUT_TABLES.intersection(tables):
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                result = refresh()
+                if result["projects"]:
+                    logger.info("Rescheduled %(projects)d projects, %(tasks)d tasks in %(seconds).3f s", result)
+            except Exception:
+                logger.exception("Rescheduling failed")
+            self._wake.wait(SCHEDULE_MAX_SLEEP)
+            self._wake.clear()
+            # Let a burst of writes finish first
+            self._stop.wait(self.delay)
+
+# Rescheduling shared by every session, started on first use
+_refresher = ScheduleRefresher()
+atexit.register(_refresher.stop)
+
+def get_refresher() -> ScheduleRefresher:
+    """Get the process-wide schedule refresher, starting it if needed"""
+    _refresher.start()
+    return _refresher
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m utils.critical_path", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    refresh_command = commands.add_parser("refresh", help="reschedule out-of-date projects")
+    refresh_command.add_argument("--full", action="store_true", help="reschedule every project")
+    for name, help in [("depend", "make SUCCESSOR wait for PREDECESSOR"), ("undepend", "remove a dependency")]:
+        command = commands.add_parser(name, help=help)
+        command.add_argument("kind", choices=DEPENDENCY_KINDS)
+        command.add_argument("predecessor", type=int)
+        command.add_argument("successor", type=int)
+    show = commands.add_parser("show", help="print a project's schedule")
+    show.add_argument("project", type=int)
+    args = parser.parse_args(argv)
+
+    db.ensure_db()
+    if args.command == "depend":
+        add_dependency(args.kind, args.predecessor, args.successor)
+    elif args.command == "undepend":
+        if not remove_dependency(args.kind, args.predecessor, args.successor):
+            parser.exit(1, "No such dependency\n")
+    if args.command == "show":
+        refresh()
+        for kind, id, start, finish, slack, critical in get_project_schedule.uncached(args.project):
+            print(f"{kind:<12}{id:>8}  {start}  {finish}  slack {slack:>4}{'  critical' if critical else ''}")
+    else:
+        print(json.dumps(refresh(full=args.command == "refresh" and args.full)))
+
+if __name__ == "__main__":
+    main()
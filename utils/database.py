@@ -1,127 +1,1112 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, date
 import os
+import re
+import atexit
+import logging
+import functools
+import queue
+import threading
+import time
+from collections import namedtuple
+from itertools import groupby
+from concurrent.futures import Future
+from contextlib import contextmanager
 import streamlit as st
-from typing import List, Dict, Any, Optional, Union, TypeVar, Type
-from utils.models import Project, SubProject, Task, Team, TeamMember, Note, Reminder
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from typing import List, Dict, Any, Optional, Union, TypeVar, Type, Iterator, Callable, Iterable
+from utils.models import Project, SubProject, Task, Team, TeamMember, Note, Reminder, from_db_rows, TASK_STATUSES
+from utils.cache import QueryCache, TableVersions
+from utils import profiling
+
+logger = logging.getLogger(__name__)
 
 # Type variable for generic model functions
 T = TypeVar('T', Project, SubProject, Task, Team, TeamMember, Note, Reminder)
 
+# Use a path that will be mounted as a volume; PROJECTFORGE_DB_PATH points
+# elsewhere, e.g. at a scratch database for the benchmarks
+DB_PATH = os.environ.get('PROJECTFORGE_DB_PATH', 'data/projectforge.db')
+
 # Ensure data directory exists
-os.makedirs('data', exist_ok=True)
+os.makedirs(os.path.dirname(DB_PATH) or '.', exist_ok=True)
+
+# Maximum number of connections handed out at the same time
+POOL_SIZE = int(os.environ.get('PROJECTFORGE_DB_POOL_SIZE', '8'))
+
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get('PROJECTFORGE_DB_POOL_TIMEOUT', '30'))
+
+# PRAGMAs applied once to every connection when it is opened. The database
+# itself is switched to WAL in init_db, so readers never wait on the writer
+# and NORMAL sync is durable enough (only a power loss can drop the last
+# commits, never corrupt the file).
+CONNECTION_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,           # ms to retry on a locked database
+    'cache_size': -16000,           # 16 MB page cache per connection
+    'mmap_size': 268435456,         # 256 MB of memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
+# Maximum number of queued writes committed together in one transaction
+WRITE_BATCH_SIZE = int(os.environ.get('PROJECTFORGE_DB_WRITE_BATCH_SIZE', '64'))
+
+# Batches at least this large are inserted by bulk_insert with set-based
+# upkeep of derived tables instead of per-row triggers
+BULK_INSERT_MIN_ROWS = int(os.environ.get('PROJECTFORGE_BULK_INSERT_MIN_ROWS', '500'))
+
+# Statements that are routed through the writer thread by execute_query
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE'}
+
+# Outcome of a write executed on the writer thread
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount', 'rows'])
+
+# Returned by a write job that only knows which tables it wrote once it
+# ran: tables replaces the ones it was submitted with, result goes to the
+# caller
+WrittenTables = namedtuple('WrittenTables', ['result', 'tables'])
+
+# Table named by an INSERT/REPLACE/UPDATE/DELETE statement
+_WRITE_TABLE_RE = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE
+)
+
+# Activity log buffering: queue bound, what to do when it is full ('block'
+# waits up to the timeout, 'drop' discards the new entry) and how many
+# entries at most go into one INSERT batch
+ACTIVITY_LOG_QUEUE_SIZE = int(os.environ.get('PROJECTFORGE_ACTIVITY_LOG_QUEUE_SIZE', '10000'))
+ACTIVITY_LOG_BACKPRESSURE = os.environ.get('PROJECTFORGE_ACTIVITY_LOG_BACKPRESSURE', 'block')
+ACTIVITY_LOG_BLOCK_TIMEOUT = float(os.environ.get('PROJECTFORGE_ACTIVITY_LOG_BLOCK_TIMEOUT', '5'))
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get('PROJECTFORGE_ACTIVITY_LOG_BATCH_SIZE', '500'))
+
+# Rows per DataFrame yielded by iter_query_df
+QUERY_DF_CHUNK_SIZE = int(os.environ.get('PROJECTFORGE_QUERY_DF_CHUNK_SIZE', '10000'))
+
+# Read-through cache bounds, for the process-wide and the per-session caches
+CACHE_TTL = float(os.environ.get('PROJECTFORGE_CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('PROJECTFORGE_CACHE_MAX_ENTRIES', '512'))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('PROJECTFORGE_SESSION_CACHE_MAX_ENTRIES', '64'))
+
+def _apply_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, Any]):
+    """Apply PRAGMA settings to a freshly opened connection"""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable SQLite connections.
+
+    A thread checks out one connection for its outermost ``connection()``
+    block and nested blocks on the same thread share it (and its
+    transaction). When the outermost block exits the transaction is
+    committed, or rolled back on error, and the connection goes back to the
+    pool so later reruns reuse it instead of reconnecting.
+    """
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 pragmas: Optional[Dict[str, Any]] = None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection and apply the configured PRAGMAs"""
+        # Connections move between threads as they are checked in and out,
+        # but only ever one thread uses a connection at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        _apply_pragmas(conn, self.pragmas)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection for the duration of the block"""
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            # Nested use on the same thread shares the outer connection
+            yield local.conn
+            return
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._open()
+
+            local.conn = conn
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                local.conn = None
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection in the pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+class DatabaseWriter:
+    """
+    Background thread that owns the single write connection.
+
+    Write jobs from every session are queued and applied in order. Whatever
+    is waiting when the thread wakes up is committed as one transaction,
+    with a savepoint around each job so a failing write only undoes itself.
+    A job is a callable that receives the writer's cursor; its return value
+    (or exception) is delivered through the Future returned by ``submit``
+    once the batch has been committed. ``on_commit`` is called with the
+    tables written by the successful jobs before any Future is resolved;
+    a job returning WrittenTables names its tables itself.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path: str, batch_size: int = WRITE_BATCH_SIZE,
+                 pragmas: Optional[Dict[str, Any]] = None,
+                 on_commit: Optional[Callable[[set], None]] = None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self.on_commit = on_commit
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the writer thread if it isn't running yet"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="projectforge-db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Apply every queued write, then stop the thread"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def submit(self, job: Callable[[sqlite3.Cursor], Any], tables: Iterable[str] = ()) -> Future:
+        """Queue a write job that touches tables and return a Future for its result"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Write jobs cannot wait on other writes from the writer thread")
+        self.start()
+        future: Future = Future()
+        self._queue.put((job, future, tuple(tables)))
+        return future
 
-# Use a path that will be mounted as a volume
-DB_PATH = 'data/projectforge.db'
+    def _run(self):
+        # Autocommit mode: transactions are managed explicitly below
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        _apply_pragmas(conn, self.pragmas)
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                batch = [item]
+                # Group whatever else is already waiting into the same commit
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._apply(conn, batch)
+        finally:
+            conn.close()
 
-# Database connection
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
+    def _apply(self, conn: sqlite3.Connection, batch):
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for job, future, tables in batch:
+                cursor.execute("SAVEPOINT write_job")
+                try:
+                    result = job(cursor)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_job")
+                    cursor.execute("RELEASE write_job")
+                    outcomes.append((future, None, e, ()))
+                else:
+                    cursor.execute("RELEASE write_job")
+                    if isinstance(result, WrittenTables):
+                        result, tables = result.result, tuple(result.tables)
+                    outcomes.append((future, result, None, tables))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # The batch as a whole failed (e.g. the database stayed locked)
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        if self.on_commit is not None:
+            written = {table for _, _, error, tables in outcomes if error is None for table in tables}
+            if written:
+                self.on_commit(written)
+
+        for future, result, error, _ in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+# Shared connection pool for the whole process
+_pool = ConnectionPool(DB_PATH)
+atexit.register(_pool.close_all)
+
+# Per-table write generations and the process-wide read cache
+_table_versions = TableVersions()
+_global_cache = QueryCache(_table_versions, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+
+# Single writer shared by every session
+_writer = DatabaseWriter(DB_PATH, on_commit=_table_versions.bump)
+atexit.register(_writer.stop)
+
+def connection():
+    """
+    Context manager that yields a pooled connection
+
+    Usage:
+        with db.connection() as conn:
+            conn.execute(...)
+    """
+    return _pool.connection()
+
+def submit_write(job: Callable[[sqlite3.Cursor], Any], tables: Iterable[str] = ()) -> Future:
+    """
+    Queue a write job on the writer thread without waiting for it
+
+    The job receives a cursor and runs inside the writer's transaction, so
+    several statements issued by one job are applied atomically. List the
+    tables the job writes so cached reads of them are invalidated, or have
+    the job return WrittenTables if that depends on what it finds.
+    """
+    return _writer.submit(job, tables)
+
+def run_write(job: Callable[[sqlite3.Cursor], Any], tables: Iterable[str] = ()) -> Any:
+    """Run a write job on the writer thread and wait for its result"""
+    return submit_write(job, tables).result()
+
+def written_table(query: str) -> Optional[str]:
+    """Get the table an INSERT/REPLACE/UPDATE/DELETE statement writes to"""
+    match = _WRITE_TABLE_RE.match(query)
+    return match.group(1).lower() if match else None
+
+def _execute(cursor: sqlite3.Cursor, query: str, params=None, many: bool = False) -> list:
+    """
+    Execute a statement and fetch its rows, recording it with the profiler
+
+    The recorded time covers execution and fetching; the row count is the
+    rows returned, or for writes the rows changed.
+    """
+    start = time.perf_counter()
+    if many:
+        cursor.executemany(query, params or [])
+    else:
+        cursor.execute(query, params or ())
+    rows = cursor.fetchall()
+    profiling.record_query(
+        query, None if many else params, time.perf_counter() - start,
+        len(rows) or max(cursor.rowcount, 0), None if many else cursor.connection
+    )
+    return rows
+
+def execute_write(query: str, params=None, many: bool = False) -> WriteResult:
+    """Execute a single write statement on the writer thread and wait for it"""
+    def job(cursor: sqlite3.Cursor) -> WriteResult:
+        rows = _execute(cursor, query, params, many)
+        return WriteResult(cursor.lastrowid, cursor.rowcount, rows)
+    table = written_table(query)
+    return run_write(job, (table,) if table else ())
+
+def _typed_frame(rows: list, columns: List[str], dates: Iterable[str] = (),
+                 categories: Optional[Dict[str, List[str]]] = None, dtypes: Optional[Dict[str, Any]] = None):
+    """Build a DataFrame from fetched rows and convert its columns, each in one vectorized pass"""
+    # Imported here so pandas only loads for the pages that use it
+    import pandas as pd
+    
+    frame = pd.DataFrame.from_records(rows, columns=columns, coerce_float=False)
+    for column in dates:
+        # ISO dates and datetimes; anything else becomes NaT
+        frame[column] = pd.to_datetime(frame[column], format='ISO8601', errors='coerce')
+    for column, values in (categories or {}).items():
+        # Values outside the categories become NaN
+        frame[column] = pd.Categorical(frame[column], categories=values)
+    if dtypes:
+        frame = frame.astype(dtypes)
+    return frame
+
+def query_df(query: str, params=None, columns: Optional[List[str]] = None, dates: Iterable[str] = (),
+             categories: Optional[Dict[str, List[str]]] = None, dtypes: Optional[Dict[str, Any]] = None):
+    """
+    Run a read query and return the result as a pandas DataFrame
+    
+    Columns are named after the query's result columns unless columns is
+    given. dates are parsed into datetime64 columns, categories maps
+    columns to their categorical values (e.g. TASK_STATUSES) and dtypes
+    to any other pandas dtype, such as 'Int64' for ids that can be NULL.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        rows = _execute(cursor, query, params)
+        names = columns or [column[0] for column in cursor.description]
+    return _typed_frame(rows, names, dates, categories, dtypes)
+
+def iter_query_df(query: str, params=None, chunk_size: int = QUERY_DF_CHUNK_SIZE, **types):
+    """
+    Run a read query and yield its result as DataFrames of up to chunk_size rows
+    
+    Takes the same column options as query_df. The chunks come from one
+    read transaction, so they're consistent with each other; the pooled
+    connection is held until the iteration ends or is abandoned.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        cursor.execute(query, params or ())
+        names = types.pop('columns', None) or [column[0] for column in cursor.description]
+        # Only the time spent reading is recorded, not the caller's
+        seconds, total = time.perf_counter() - start, 0
+        try:
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(chunk_size)
+                seconds += time.perf_counter() - start
+                if not rows:
+                    break
+                total += len(rows)
+                yield _typed_frame(rows, names, **types)
+        finally:
+            cursor.close()
+            profiling.record_query(query, params, seconds, total, conn)
+
+def bulk_insert(cursor: sqlite3.Cursor, table: str, columns: List[str], rows: List[tuple]) -> range:
+    """
+    Insert many rows from a write job and return the ids they got
+    
+    For large batches, the per-row triggers that keep derived tables in
+    sync (search index, timeline, task counts; see BULK_INSERT_TRIGGERS)
+    are dropped for the insert and their work is done once for all new
+    rows, which is several times faster. It all happens inside the job's
+    transaction, so no other connection ever sees the triggers missing.
+    """
+    if not rows:
+        return range(0)
+    triggers = BULK_INSERT_TRIGGERS.get(table, []) if len(rows) >= BULK_INSERT_MIN_ROWS else []
+    definitions = dict(cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({})".format(
+            ','.join(['?'] * len(triggers))),
+        [name for name, _ in triggers]
+    ).fetchall()) if triggers else {}
+    for name in definitions:
+        cursor.execute(f"DROP TRIGGER {name}")
+    
+    placeholders = ', '.join(['?'] * len(columns))
+    _execute(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows, many=True)
+    # Rows inserted by one statement get consecutive ids, above any existing one
+    last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    first_id = last_id - len(rows) + 1
+    
+    for name, statement in triggers:
+        if name in definitions:
+            _execute(cursor, statement, (first_id,))
+    for sql in definitions.values():
+        cursor.execute(sql)
+    return range(first_id, last_id + 1)
+
+def apply_changes(table: str, columns: List[str], inserts=(), updates=(), deletes=(),
+                  insert_columns: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Apply a batch of inserts, updates and deletes to a table atomically
+    
+    updates are value tuples for columns followed by the row id, inserts are
+    value tuples for insert_columns (defaults to columns) and deletes are
+    row ids. Each kind is sent with one executemany, all in a single writer
+    transaction.
+    """
+    inserts, updates, deletes = list(inserts), list(updates), list(deletes)
+    insert_columns = insert_columns or columns
+    
+    def job(cursor: sqlite3.Cursor) -> Dict[str, int]:
+        if deletes:
+            _execute(cursor, f"DELETE FROM {table} WHERE id = ?", [(id,) for id in deletes], many=True)
+        if updates:
+            set_clause = ', '.join(f"{column} = ?" for column in columns)
+            _execute(cursor, f"UPDATE {table} SET {set_clause} WHERE id = ?", updates, many=True)
+        if inserts:
+            placeholders = ', '.join(['?'] * len(insert_columns))
+            _execute(cursor, f"INSERT INTO {table} ({', '.join(insert_columns)}) VALUES ({placeholders})",
+                     inserts, many=True)
+        return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes)}
+    
+    return run_write(job, (table,))
+
+def _session_cache() -> QueryCache:
+    """Get the calling session's cache, or the global one outside a session"""
+    if get_script_run_ctx() is None:
+        return _global_cache
+    cache = st.session_state.get('_query_cache')
+    if cache is None:
+        cache = QueryCache(_table_versions, max_entries=SESSION_CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+        st.session_state['_query_cache'] = cache
+    return cache
+
+def _freeze(value):
+    """Turn lists and dicts in call arguments into hashable equivalents"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+def cached(*tables: str, scope: str = 'global'):
+    """
+    Cache a read helper's result until one of tables is written
+    
+    scope='global' shares results between every session in the process;
+    scope='session' keeps them in the calling session's state. Cached
+    results are shared, so callers must not modify them.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = _session_cache() if scope == 'session' else _global_cache
+            key = (func.__module__, func.__qualname__, _freeze(args), _freeze(kwargs))
+            return cache.get_or_load(key, tables, lambda: func(*args, **kwargs))
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Get hit/miss counters for the global cache and the calling session's cache"""
+    stats = {"global": _global_cache.stats()}
+    session_cache = _session_cache()
+    if session_cache is not _global_cache:
+        stats["session"] = session_cache.stats()
+    return stats
+
+def table_versions(*tables: str) -> tuple:
+    """Get the write generations of tables; a change means data read from them is stale"""
+    return _table_versions.snapshot(tables)
+
+def on_tables_changed(listener: Callable[[set], None]):
+    """Call listener with the set of written tables after every committed write"""
+    _table_versions.subscribe(listener)
+
+def _is_write(query: str) -> bool:
+    """Check whether a statement modifies data"""
+    words = query.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in WRITE_STATEMENTS
 
 def init_db():
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS teams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            description TEXT,
-            location TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS team_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            first_name TEXT,
-            last_name TEXT,
-            email TEXT,
-            team_id INTEGER,
-            FOREIGN KEY (team_id) REFERENCES teams(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            description TEXT,
-            start_date TEXT,
-            end_date TEXT,
-            deviation INTEGER DEFAULT 0,
-            assigned_to INTEGER,
-            FOREIGN KEY (assigned_to) REFERENCES team_members(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sub_projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project_id INTEGER,
-            name TEXT,
-            description TEXT,
-            start_date TEXT,
-            end_date TEXT,
-            deviation INTEGER DEFAULT 0,
-            assigned_to INTEGER,
-            FOREIGN KEY (project_id) REFERENCES projects(id),
-            FOREIGN KEY (assigned_to) REFERENCES team_members(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project_id INTEGER,
-            sub_project_id INTEGER,
-            name TEXT,
-            description TEXT,
-            jira_ticket TEXT,
+    with connection() as conn:
+        # Lets maintenance give freed pages back with incremental_vacuum.
+        # Only takes effect on a new database (or with the next VACUUM), so
+        # it has to come before anything is written, journal mode included
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL lets readers keep going while a write is in progress; the
+        # journal mode is stored in the database file so this sticks
+        conn.execute("PRAGMA journal_mode = WAL")
+        
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS teams (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                description TEXT,
+                location TEXT
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS team_members (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_name TEXT,
+                last_name TEXT,
+                email TEXT,
+                team_id INTEGER,
+                FOREIGN KEY (team_id) REFERENCES teams(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                description TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                deviation INTEGER DEFAULT 0,
+                assigned_to INTEGER,
+                FOREIGN KEY (assigned_to) REFERENCES team_members(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS sub_projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER,
+                name TEXT,
+                description TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                deviation INTEGER DEFAULT 0,
+                assigned_to INTEGER,
+                FOREIGN KEY (project_id) REFERENCES projects(id),
+                FOREIGN KEY (assigned_to) REFERENCES team_members(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id INTEGER,
+                sub_project_id INTEGER,
+                name TEXT,
+                description TEXT,
+                jira_ticket TEXT,
+                status TEXT,
+                assigned_to INTEGER,
+                FOREIGN KEY (project_id) REFERENCES projects(id),
+                FOREIGN KEY (sub_project_id) REFERENCES sub_projects(id),
+                FOREIGN KEY (assigned_to) REFERENCES team_members(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER,
+                note TEXT,
+                created_at TEXT,
+                FOREIGN KEY (task_id) REFERENCES tasks(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER,
+                reminder_date TEXT,
+                note TEXT,
+                followed_up INTEGER DEFAULT 0,
+                FOREIGN KEY (task_id) REFERENCES tasks(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS activity_logs (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                user_id INTEGER,
+                action_type TEXT NOT NULL,
+                entity_type TEXT NOT NULL,
+                entity_id INTEGER,
+                entity_name TEXT,
+                description TEXT,
+                project_id INTEGER,
+                FOREIGN KEY (project_id) REFERENCES projects(id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS connections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                settings TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Bring the schema up to date
+        migrate(conn)
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+def ensure_db():
+    """Run init_db once per process; later calls (e.g. every rerun) return immediately"""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
+
+def _day_number(column: str) -> str:
+    """SQL expression turning an ISO date(-time) column into days since 1970-01-01"""
+    return f"CAST(julianday(date({column})) - 2440587.5 AS INTEGER)"
+
+def _timeline_index_statements(table: str) -> List[str]:
+    """
+    Build an R*Tree over the date ranges of a table, kept in sync by triggers
+    
+    Rows whose dates don't parse are left out of the index, and a reversed
+    range is stored as its normalized interval instead of failing the write.
+    """
+    index = f"{table}_timeline"
+    start, end = _day_number('{row}.start_date'), _day_number('{row}.end_date')
+    interval = f"MIN({start}, {end}), MAX({start}, {end})"
+    valid = "julianday({row}.start_date) IS NOT NULL AND julianday({row}.end_date) IS NOT NULL"
+    insert_new = (f"INSERT INTO {index} (id, start_day, end_day) "
+                  f"SELECT NEW.id, {interval} WHERE {valid};").format(row='NEW')
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING rtree_i32(id, start_day, end_day)",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN
+                {insert_new}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF start_date, end_date ON {table} BEGIN
+                DELETE FROM {index} WHERE id = OLD.id;
+                {insert_new}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM {index} WHERE id = OLD.id;
+            END""",
+        # Backfill existing rows
+        (f"INSERT INTO {index} (id, start_day, end_day) "
+         f"SELECT {{row}}.id, {interval} FROM {table} {{row}} WHERE {valid}").format(row='src'),
+    ]
+
+def _search_index_statements(table: str, columns: Dict[str, float]) -> List[str]:
+    """
+    Build an external-content FTS5 index over text columns of a table, kept
+    in sync by triggers
+    
+    columns maps each column to its bm25 weight. The weights are stored as
+    the index's default rank, so ORDER BY rank stays on FTS5's fast path.
+    """
+    index = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    weights = ", ".join(str(weight) for weight in columns.values())
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+            {names}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        f"INSERT INTO {index}({index}, rank) VALUES ('rank', 'bm25({weights})')",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+        END""",
+        # Only edits to indexed columns touch the index
+        f"""CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {names} ON {table} BEGIN
+            INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new_values});
+        END""",
+        # Index the rows that already exist
+        f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+    ]
+
+def _search_index_catch_up(table: str, columns: List[str]) -> str:
+    """Index the rows of a table from id ? on, as the _search_index_statements insert trigger would"""
+    names = ", ".join(columns)
+    return f"INSERT INTO {table}_fts(rowid, {names}) SELECT id, {names} FROM {table} WHERE id >= ?"
+
+def _timeline_index_catch_up(table: str) -> str:
+    """Index the rows of a table from id ? on, as the _timeline_index_statements insert trigger would"""
+    start, end = _day_number('src.start_date'), _day_number('src.end_date')
+    return (f"INSERT INTO {table}_timeline (id, start_day, end_day) "
+            f"SELECT src.id, MIN({start}, {end}), MAX({start}, {end}) FROM {table} src "
+            f"WHERE src.id >= ? AND julianday(src.start_date) IS NOT NULL AND julianday(src.end_date) IS NOT NULL")
+
+# Bucket of an activity log timestamp per rollup period, as an SQL
+# expression of {ts}; buckets sort in time order as text
+ACTIVITY_ROLLUP_BUCKETS = {
+    'hour': "replace(substr({ts}, 1, 13), ' ', 'T') || ':00'",
+    'day': "substr({ts}, 1, 10)",
+}
+
+# project_id of the activity_rollups rows counting every project, so trends
+# across all projects don't add up one row per project (0 is no project)
+ACTIVITY_ROLLUP_ALL_PROJECTS = -1
+
+def _activity_rollup_statements(period: str) -> List[Any]:
+    """
+    Count activity log entries per period, project and entity type in activity_rollups
+    
+    Each entry is counted for its project and for all projects. Only
+    inserts are counted: entries archived out of activity_logs stay in the
+    rollups, so trends reach back further than the log itself.
+    """
+    bucket = ACTIVITY_ROLLUP_BUCKETS[period].format(ts='NEW.timestamp')
+    upsert = (f"INSERT INTO activity_rollups (period, project_id, bucket, entity_type, event_count) "
+              f"VALUES ('{period}', {{project}}, {bucket}, NEW.entity_type, 1) "
+              f"ON CONFLICT (period, project_id, bucket, entity_type) DO UPDATE SET event_count = event_count + 1;")
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS activity_rollups_{period}_ai AFTER INSERT ON activity_logs BEGIN
+            {upsert.format(project='COALESCE(NEW.project_id, 0)')}
+            {upsert.format(project=ACTIVITY_ROLLUP_ALL_PROJECTS)}
+        END""",
+        # Count the rows that already exist
+        lambda cursor: cursor.execute(_activity_rollup_catch_up(period), (0,)),
+    ]
+
+def _activity_rollup_catch_up(period: str) -> str:
+    """Count the activity log entries from id ? on, as the _activity_rollup_statements trigger would"""
+    bucket = ACTIVITY_ROLLUP_BUCKETS[period].format(ts='timestamp')
+    return (f"INSERT INTO activity_rollups (period, project_id, bucket, entity_type, event_count) "
+            f"SELECT '{period}', CASE WHEN scope.total THEN {ACTIVITY_ROLLUP_ALL_PROJECTS} "
+            f"ELSE COALESCE(project_id, 0) END, {bucket}, entity_type, COUNT(*) "
+            f"FROM activity_logs CROSS JOIN (SELECT 0 AS total UNION ALL SELECT 1) AS scope "
+            f"WHERE id >= ? GROUP BY 2, 3, 4 "
+            f"ON CONFLICT (period, project_id, bucket, entity_type) "
+            f"DO UPDATE SET event_count = event_count + excluded.event_count")
+
+def _mark_schedule_dirty(project_id: str) -> str:
+    """Trigger statement queueing a project (an SQL expression) for rescheduling"""
+    return (f"INSERT OR IGNORE INTO schedule_dirty (project_id) "
+            f"SELECT {project_id} WHERE {project_id} IS NOT NULL;")
+
+def _schedule_dirty_statements() -> List[str]:
+    """
+    Triggers queueing the projects whose schedule a write changes in schedule_dirty
+    
+    Deleting a task or sub-project also drops its dependencies and its
+    schedule entry; the dependency triggers then queue the projects on the
+    other side of them.
+    """
+    endpoint_projects = """INSERT OR IGNORE INTO schedule_dirty (project_id)
+            SELECT project_id FROM tasks
+            WHERE {row}.kind = 'task' AND id IN ({row}.predecessor_id, {row}.successor_id) AND project_id IS NOT NULL
+            UNION
+            SELECT project_id FROM sub_projects
+            WHERE {row}.kind = 'sub_project' AND id IN ({row}.predecessor_id, {row}.successor_id)
+              AND project_id IS NOT NULL;"""
+    statements = []
+    for table, kind, columns in [('tasks', 'task', 'status, duration_days, project_id, sub_project_id'),
+                                 ('sub_projects', 'sub_project', 'start_date, end_date, project_id')]:
+        statements += [
+            f"""CREATE TRIGGER IF NOT EXISTS schedule_{table}_ai AFTER INSERT ON {table} BEGIN
+                {_mark_schedule_dirty('NEW.project_id')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS schedule_{table}_au AFTER UPDATE OF {columns} ON {table} BEGIN
+                {_mark_schedule_dirty('OLD.project_id')}
+                {_mark_schedule_dirty('NEW.project_id')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS schedule_{table}_ad AFTER DELETE ON {table} BEGIN
+                {_mark_schedule_dirty('OLD.project_id')}
+                DELETE FROM dependencies
+                WHERE kind = '{kind}' AND (predecessor_id = OLD.id OR successor_id = OLD.id);
+                DELETE FROM schedule WHERE kind = '{kind}' AND id = OLD.id;
+            END""",
+        ]
+    return statements + [
+        f"""CREATE TRIGGER IF NOT EXISTS schedule_projects_ai AFTER INSERT ON projects BEGIN
+            {_mark_schedule_dirty('NEW.id')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS schedule_projects_au AFTER UPDATE OF start_date, end_date ON projects BEGIN
+            {_mark_schedule_dirty('NEW.id')}
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS schedule_projects_ad AFTER DELETE ON projects BEGIN
+            DELETE FROM schedule WHERE project_id = OLD.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS schedule_dependencies_ai AFTER INSERT ON dependencies BEGIN
+            {endpoint_projects.format(row='NEW')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS schedule_dependencies_ad AFTER DELETE ON dependencies BEGIN
+            {endpoint_projects.format(row='OLD')}
+        END""",
+    ]
+
+# Ordered schema migrations, applied by migrate() on top of the tables
+# created in init_db. Each entry is (version, description, statements); a
+# statement is either SQL or a callable that receives the cursor. Never
+# change a migration once it has shipped, append a new one instead.
+MIGRATIONS = [
+    (1, "Index hot lookup columns", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_project_id ON tasks(project_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_sub_project_id ON tasks(sub_project_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_assigned_to ON tasks(assigned_to)",
+        "CREATE INDEX IF NOT EXISTS idx_notes_task_id ON notes(task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reminders_task_id ON reminders(task_id)",
+        # Equality column first so "due and not followed up" is a single range scan
+        "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(followed_up, reminder_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sub_projects_project_id ON sub_projects(project_id)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_project_time ON activity_logs(project_id, timestamp)",
+    ]),
+    (2, "Cover project task counts and project list ordering", [
+        # Superset of idx_tasks_project_id that also answers "sub_project_id IS NULL"
+        "CREATE INDEX IF NOT EXISTS idx_tasks_project_sub_project ON tasks(project_id, sub_project_id)",
+        "DROP INDEX IF EXISTS idx_tasks_project_id",
+        "CREATE INDEX IF NOT EXISTS idx_projects_start_date ON projects(start_date)",
+    ]),
+    (3, "Interval index for the dashboard timeline", [
+        *_timeline_index_statements('projects'),
+        *_timeline_index_statements('sub_projects'),
+        # Let MIN/MAX of the timeline bounds read one index entry each
+        "CREATE INDEX IF NOT EXISTS idx_projects_end_date ON projects(end_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sub_projects_start_date ON sub_projects(start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sub_projects_end_date ON sub_projects(end_date)",
+    ]),
+    (4, "Task name typeahead and keyset paging of notes", [
+        # NOCASE so case-insensitive LIKE 'prefix%' becomes an index range
+        "CREATE INDEX IF NOT EXISTS idx_tasks_name_nocase ON tasks(name COLLATE NOCASE)",
+        # Superset of idx_notes_task_id in the order notes are paged in
+        "CREATE INDEX IF NOT EXISTS idx_notes_task_created ON notes(task_id, created_at, id)",
+        "DROP INDEX IF EXISTS idx_notes_task_id",
+    ]),
+    (5, "Full-text search", [
+        *_search_index_statements('tasks', {'name': 10.0, 'description': 1.0}),
+        *_search_index_statements('notes', {'note': 1.0}),
+        *_search_index_statements('reminders', {'note': 1.0}),
+        *_search_index_statements('activity_logs', {'description': 1.0}),
+    ]),
+    (6, "Materialized task counts per member and status", [
+        # member_id 0 is unassigned and status '' is no status, so the key
+        # never holds NULLs (NULLs would never conflict in the upsert)
+        """CREATE TABLE IF NOT EXISTS task_status_counts (
+            member_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            task_count INTEGER NOT NULL,
+            PRIMARY KEY (member_id, status)
+        ) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS task_status_counts_ai AFTER INSERT ON tasks BEGIN
+            INSERT INTO task_status_counts (member_id, status, task_count)
+            VALUES (COALESCE(new.assigned_to, 0), COALESCE(new.status, ''), 1)
+            ON CONFLICT (member_id, status) DO UPDATE SET task_count = task_count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS task_status_counts_ad AFTER DELETE ON tasks BEGIN
+            UPDATE task_status_counts SET task_count = task_count - 1
+            WHERE member_id = COALESCE(old.assigned_to, 0) AND status = COALESCE(old.status, '');
+            DELETE FROM task_status_counts
+            WHERE member_id = COALESCE(old.assigned_to, 0) AND status = COALESCE(old.status, '')
+              AND task_count <= 0;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS task_status_counts_au AFTER UPDATE OF assigned_to, status ON tasks
+        WHEN old.assigned_to IS NOT new.assigned_to OR old.status IS NOT new.status BEGIN
+            UPDATE task_status_counts SET task_count = task_count - 1
+            WHERE member_id = COALESCE(old.assigned_to, 0) AND status = COALESCE(old.status, '');
+            DELETE FROM task_status_counts
+            WHERE member_id = COALESCE(old.assigned_to, 0) AND status = COALESCE(old.status, '')
+              AND task_count <= 0;
+            INSERT INTO task_status_counts (member_id, status, task_count)
+            VALUES (COALESCE(new.assigned_to, 0), COALESCE(new.status, ''), 1)
+            ON CONFLICT (member_id, status) DO UPDATE SET task_count = task_count + 1;
+        END""",
+        """INSERT INTO task_status_counts (member_id, status, task_count)
+        SELECT COALESCE(assigned_to, 0), COALESCE(status, ''), COUNT(*)
+        FROM tasks GROUP BY 1, 2""",
+    ]),
+    (7, "Local cache of Jira issues", [
+        # status is NULL for keys Jira didn't return, so they aren't
+        # looked up again until the entry is stale
+        """CREATE TABLE IF NOT EXISTS jira_issues (
+            issue_key TEXT PRIMARY KEY,
             status TEXT,
-            assigned_to INTEGER,
-            FOREIGN KEY (project_id) REFERENCES projects(id),
-            FOREIGN KEY (sub_project_id) REFERENCES sub_projects(id),
-            FOREIGN KEY (assigned_to) REFERENCES team_members(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            note TEXT,
-            created_at TEXT,
-            FOREIGN KEY (task_id) REFERENCES tasks(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER,
-            reminder_date TEXT,
-            note TEXT,
-            followed_up INTEGER DEFAULT 0,
-            FOREIGN KEY (task_id) REFERENCES tasks(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS activity_logs (
-            id INTEGER PRIMARY KEY,
-            timestamp TEXT NOT NULL,
-            user_id INTEGER,
-            action_type TEXT NOT NULL,
+            summary TEXT,
+            updated TEXT,
+            fetched_at TEXT NOT NULL
+        ) WITHOUT ROWID""",
+    ]),
+    (8, "Links from tasks to Bitbucket pull requests and commits", [
+        """CREATE TABLE IF NOT EXISTS task_code_links (
+            task_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            repository TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            title TEXT,
+            url TEXT,
+            author TEXT,
+            state TEXT,
+            updated_on TEXT,
+            PRIMARY KEY (task_id, kind, repository, ref)
+        ) WITHOUT ROWID""",
+    ]),
+    (9, "Last runs of the maintenance tasks", [
+        """CREATE TABLE IF NOT EXISTS maintenance_runs (
+            task TEXT PRIMARY KEY,
+            started_at TEXT NOT NULL,
+            seconds REAL,
+            details TEXT,
+            error TEXT
+        )""",
+    ]),
+    (10, "Activity log project names, time index and rollups", [
+        # The project's name when the entry was written, so reading the log
+        # needs no join and entries of deleted projects keep their name
+        "ALTER TABLE activity_logs ADD COLUMN project_name TEXT",
+        """UPDATE activity_logs SET project_name = (SELECT name FROM projects WHERE id = activity_logs.project_id)
+        WHERE project_id IS NOT NULL""",
+        # "Latest N entries" reads N index entries from the end
+        "CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp ON activity_logs(timestamp)",
+        # project_id 0 is activity outside any project (no NULLs in the
+        # key), ACTIVITY_ROLLUP_ALL_PROJECTS the total over all of them
+        """CREATE TABLE IF NOT EXISTS activity_rollups (
+            period TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
             entity_type TEXT NOT NULL,
-            entity_id INTEGER,
-            entity_name TEXT,
+            event_count INTEGER NOT NULL,
+            PRIMARY KEY (period, project_id, bucket, entity_type)
+        ) WITHOUT ROWID""",
+        *_activity_rollup_statements('hour'),
+        *_activity_rollup_statements('day'),
+    ]),
+    (11, "Task durations, dependencies and the computed schedule", [
+        # NULL uses the scheduler's default duration
+        "ALTER TABLE tasks ADD COLUMN duration_days INTEGER",
+        # Finish-to-start links between two tasks or two sub-projects:
+        # the successor can't start before the predecessor is finished
+        """CREATE TABLE IF NOT EXISTS dependencies (
+            kind TEXT NOT NULL CHECK (kind IN ('task', 'sub_project')),
+            predecessor_id INTEGER NOT NULL,
+            successor_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, successor_id, predecessor_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_dependencies_predecessor ON dependencies(kind, predecessor_id)",
+        # Result of the last scheduling pass for each task, sub-project and
+        # project (kind); see utils/critical_path.py
+        """CREATE TABLE IF NOT EXISTS schedule (
+            kind TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            finish_date TEXT NOT NULL,
+            slack_days INTEGER NOT NULL,
+            critical INTEGER NOT NULL,
+            PRIMARY KEY (kind, id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_schedule_project ON schedule(project_id)",
+        # Projects whose schedule is out of date
+        "CREATE TABLE IF NOT EXISTS schedule_dirty (project_id INTEGER PRIMARY KEY)",
+        *_schedule_dirty_statements(),
+        "INSERT OR IGNORE INTO schedule_dirty (project_id) SELECT id FROM projects",
+    ]),
+    (12, "Remember which reminders were announced", [
+        # Set by the reminder scheduler when it claims a due reminder, so a
+        # restart doesn't announce it again
+        "ALTER TABLE reminders ADD COLUMN announced_at TEXT",
+        # A reminder that is pending again, or moved, is announced again
+        """CREATE TRIGGER IF NOT EXISTS reminders_announce_again AFTER UPDATE OF reminder_date, followed_up
+            ON reminders
+            WHEN NEW.followed_up = 0 AND NEW.announced_at IS NOT NULL
+                 AND (OLD.followed_up != 0 OR OLD.reminder_date IS NOT NEW.reminder_date)
+            BEGIN
+                UPDATE reminders SET announced_at = NULL WHERE id = NEW.id;
+            END""",
+        # Reminders already overdue were announced by every earlier start
+        """UPDATE reminders SET announced_at = strftime('%Y-%m-%dT%H:%M:%S', 'now')
+           WHERE followed_up = 0 AND reminder_date < date('now', 'localtime')""",
+    ]),
+]
+
+# Per-row AFTER INSERT triggers by table, each with the statement doing its
+# work for all rows from id ? on; see bulk_insert
+BULK_INSERT_TRIGGERS: Dict[str, List[tuple]] = {
+    'projects': [
+        ('projects_timeline_ai', _timeline_index_catch_up('projects')),
+        ('schedule_projects_ai', "INSERT OR IGNORE INTO schedule_dirty (project_id) SELECT id FROM projects WHERE id >= ?"),
+    ],
+    'sub_projects': [
+        ('sub_projects_timeline_ai', _timeline_index_catch_up('sub_projects')),
+        ('schedule_sub_projects_ai', "INSERT OR IGNORE INTO schedule_dirty (project_id) "
+                                     "SELECT DISTINCT project_id FROM sub_projects WHERE id >= ? AND project_id IS NOT NULL"),
+    ],
+    'tasks': [
+        ('schedule_tasks_ai', "INSERT OR IGNORE INTO schedule_dirty (project_id) "
+                              "SELECT DISTINCT project_id FROM tasks WHERE id >= ? AND project_id IS NOT NULL"),
+        ('tasks_fts_ai', _search_index_catch_up('tasks', ['name', 'description'])),
+        ('task_status_counts_ai', """INSERT INTO task_status_counts (member_id, status, task_count)
+            SELECT COALESCE(assigned_to, 0), COALESCE(status, ''), COUNT(*)
+            FROM tasks WHERE id >= ? GROUP BY 1, 2
+            ON CONFLICT (member_id, status) DO UPDATE SET task_count = task_count + excluded.task_count"""),
+    ],
+    'notes': [('notes_fts_ai', _search_index_catch_up('notes', ['note']))],
+    'reminders': [('reminders_fts_ai', _search_index_catch_up('reminders', ['note']))],
+    'activity_logs': [
+        ('activity_logs_fts_ai', _search_index_catch_up('activity_logs', ['description'])),
+        ('activity_rollups_hour_ai', _activity_rollup_catch_up('hour')),
+        ('activity_rollups_day_ai', _activity_rollup_catch_up('day')),
+    ],
+}
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Get the version of the last applied migration (0 if none)"""
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply pending migrations in order and return the schema version
+
+    Safe to call on every startup: when the schema is current this is one
+    indexed lookup. Pending migrations run in a single IMMEDIATE transaction,
+    so concurrent processes starting up at the same time apply them once.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
             description TEXT,
-            project_id INTEGER,
-            FOREIGN KEY (project_id) REFERENCES projects(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS connections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            settings TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            applied_at TEXT NOT NULL
         )
     ''')
+    latest = MIGRATIONS[-1][0]
+    if get_schema_version(conn) >= latest:
+        return latest
+    
     conn.commit()
-    # conn.close()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have migrated while we waited for the lock
+        current = get_schema_version(conn)
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            current = version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    return current
+
+# Table backing each model class
+MODEL_TABLES = {
+    Project: 'projects',
+    SubProject: 'sub_projects',
+    Task: 'tasks',
+    Team: 'teams',
+    TeamMember: 'team_members',
+    Note: 'notes',
+    Reminder: 'reminders',
+}
+
+def get_table_name(model_class: Type[T]) -> str:
+    """Get the table a model class is stored in"""
+    return MODEL_TABLES[model_class]
 
 # Generic CRUD operations for models
 def create_model(model: T) -> int:
@@ -132,10 +1117,8 @@ def create_model(model: T) -> int:
     if model_dict.get('id') is None:
         del model_dict['id']
     
-    # Get the table name from the model class name
-    table_name = model.__class__.__name__.lower() + 's'
-    if table_name == 'teams':
-        table_name = 'teams'  # Special case for team (already plural)
+    # Get the table name for the model class
+    table_name = get_table_name(model.__class__)
     
     # Build the SQL query
     columns = ', '.join(model_dict.keys())
@@ -144,51 +1127,36 @@ def create_model(model: T) -> int:
     
     query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
     
-    # Execute the query
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(query, values)
-    
-    # Get the ID of the new record
-    cursor.execute("SELECT last_insert_rowid()")
-    new_id = cursor.fetchone()[0]
-    
-    conn.commit()
-    conn.close()
+    # Execute the query and get the ID of the new record
+    new_id = execute_write(query, values).lastrowid
     
     return new_id
 
-def get_model_by_id(model_class: Type[T], id: int) -> Optional[T]:
-    """Get a model by ID"""
-    # Get the table name from the model class name
-    table_name = model_class.__name__.lower() + 's'
-    if table_name == 'teams':
-        table_name = 'teams'  # Special case for team (already plural)
+def get_model_by_id(model_class: Type[T], id: int, validate: bool = False) -> Optional[T]:
+    """
+    Get a model by ID
     
-    query = f"SELECT * FROM {table_name} WHERE id = ?"
+    Rows are trusted and hydrated without validation unless validate is set.
+    """
+    # Get the table name for the model class
+    table_name = get_table_name(model_class)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(query, (id,))
+    query = f"SELECT * FROM {table_name} WHERE id = ?"
     
-    row = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        rows = _execute(cursor, query, (id,))
+        
+        # Get column names
+        columns = [column[0] for column in cursor.description]
     
-    if not row:
+    if not rows:
         return None
     
-    # Get column names
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [info[1] for info in cursor.fetchall()]
-    conn.close()
-    
-    # Create a dictionary from the row
-    data = {columns[i]: row[i] for i in range(len(columns))}
-    
     # Create and return the model
-    return model_class.from_dict(data)
+    if validate:
+        return model_class.from_dict(dict(zip(columns, rows[0])))
+    return from_db_rows(model_class, columns, rows)[0]
 
 def update_model(model: T) -> bool:
     """Update a model in the database"""
@@ -197,10 +1165,8 @@ def update_model(model: T) -> bool:
     
     model_dict = model.to_dict()
     
-    # Get the table name from the model class name
-    table_name = model.__class__.__name__.lower() + 's'
-    if table_name == 'teams':
-        table_name = 'teams'  # Special case for team (already plural)
+    # Get the table name for the model class
+    table_name = get_table_name(model.__class__)
     
     # Build the SQL query
     set_clause = ', '.join([f"{key} = ?" for key in model_dict.keys() if key != 'id'])
@@ -209,110 +1175,474 @@ def update_model(model: T) -> bool:
     
     query = f"UPDATE {table_name} SET {set_clause} WHERE id = ?"
     
-    # Execute the query
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(query, values)
-    
-    # Check if the update was successful
-    success = cursor.rowcount > 0
-    
-    conn.commit()
-    conn.close()
+    # Execute the query and check if the update was successful
+    success = execute_write(query, values).rowcount > 0
     
     return success
 
 def delete_model(model_class: Type[T], id: int) -> bool:
     """Delete a model from the database by ID"""
-    # Get the table name from the model class name
-    table_name = model_class.__name__.lower() + 's'
-    if table_name == 'teams':
-        table_name = 'teams'  # Special case for team (already plural)
+    # Get the table name for the model class
+    table_name = get_table_name(model_class)
     
     query = f"DELETE FROM {table_name} WHERE id = ?"
     
-    # Execute the query
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(query, (id,))
-    
-    # Check if the delete was successful
-    success = cursor.rowcount > 0
-    
-    conn.commit()
-    conn.close()
+    # Execute the query and check if the delete was successful
+    success = execute_write(query, (id,)).rowcount > 0
     
     return success
 
-def get_all_models(model_class: Type[T]) -> List[T]:
-    """Get all models of a specific type"""
-    # Get the table name from the model class name
-    table_name = model_class.__name__.lower() + 's'
-    if table_name == 'teams':
-        table_name = 'teams'  # Special case for team (already plural)
-    
-    query = f"SELECT * FROM {table_name}"
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(query)
+def get_all_models(model_class: Type[T], validate: bool = False) -> List[T]:
+    """
+    Get all models of a specific type
     
-    rows = cursor.fetchall()
+    Rows are trusted and hydrated without validation unless validate is set.
+    """
+    # Get the table name for the model class
+    table_name = get_table_name(model_class)
     
-    # Get column names
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [info[1] for info in cursor.fetchall()]
+    query = f"SELECT * FROM {table_name}"
     
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        rows = _execute(cursor, query)
+        
+        # Get column names
+        columns = [column[0] for column in cursor.description]
     
     # Create models from rows
-    models = []
-    for row in rows:
-        data = {columns[i]: row[i] for i in range(len(columns))}
-        models.append(model_class.from_dict(data))
-    
-    return models
+    if validate:
+        return [model_class.from_dict(dict(zip(columns, row))) for row in rows]
+    return from_db_rows(model_class, columns, rows)
 
 # Keep the existing helper functions for backward compatibility
+@cached('teams')
 def get_teams():
-    c.execute("SELECT id, name FROM teams")
-    return c.fetchall()
+    return execute_query("SELECT id, name FROM teams")
 
+@cached('team_members')
 def get_team_members():
-    c.execute("SELECT id, first_name || ' ' || last_name as name FROM team_members")
-    return c.fetchall()
+    return execute_query("SELECT id, first_name || ' ' || last_name as name FROM team_members")
 
+@cached('projects')
 def get_projects():
-    c.execute("SELECT id, name FROM projects")
-    return c.fetchall()
+    return execute_query("SELECT id, name FROM projects")
 
+@cached('sub_projects')
 def get_sub_projects():
-    c.execute("SELECT id, name FROM sub_projects")
-    return c.fetchall()
+    return execute_query("SELECT id, name FROM sub_projects")
 
+@cached('tasks')
 def get_tasks():
-    c.execute("SELECT id, name FROM tasks")
-    return c.fetchall()
+    return execute_query("SELECT id, name FROM tasks")
 
-def execute_query(query, params=None, fetch_last_id=False):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+@cached('projects')
+def count_projects() -> int:
+    """Get the total number of projects"""
+    return execute_query("SELECT COUNT(*) FROM projects")[0][0]
+
+@cached('projects', 'tasks', 'sub_projects', 'team_members')
+def get_project_summaries(limit: Optional[int] = None, offset: int = 0):
+    """
+    Get one page of projects for the project list, newest first
     
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+    Each row is (id, name, description, start_date, end_date, assigned_to,
+    assigned_name, task_count, subproject_count). Counts and the assignee
+    name come back with the projects in one query; the count subqueries are
+    index-only lookups and only run for the rows on the requested page.
+    """
+    return execute_query("""
+        SELECT 
+            p.id, p.name, p.description, p.start_date, p.end_date, p.assigned_to,
+            tm.first_name || ' ' || tm.last_name AS assigned_name,
+            (SELECT COUNT(*) FROM tasks t 
+             WHERE t.project_id = p.id AND t.sub_project_id IS NULL) AS task_count,
+            (SELECT COUNT(*) FROM sub_projects sp 
+             WHERE sp.project_id = p.id) AS subproject_count
+        FROM projects p
+        LEFT JOIN team_members tm ON tm.id = p.assigned_to
+        ORDER BY p.start_date DESC
+        LIMIT ? OFFSET ?
+    """, (-1 if limit is None else limit, offset))
+
+@cached('projects', 'sub_projects')
+def get_timeline_bounds():
+    """Get the earliest start and latest end date over all projects and sub-projects"""
+    bounds = execute_query("""
+        SELECT 
+            (SELECT MIN(start_date) FROM projects),
+            (SELECT MAX(end_date) FROM projects),
+            (SELECT MIN(start_date) FROM sub_projects),
+            (SELECT MAX(end_date) FROM sub_projects)
+    """)[0]
+    starts = [value for value in bounds[0::2] if value]
+    ends = [value for value in bounds[1::2] if value]
+    return (min(starts) if starts else None, max(ends) if ends else None)
+
+@cached('projects', 'sub_projects', 'team_members', 'schedule')
+def get_timeline(filter_start, filter_end):
+    """
+    Get the projects and sub-projects whose dates overlap a date range
     
-    if fetch_last_id:
-        cursor.execute("SELECT last_insert_rowid()")
-        result = cursor.fetchone()[0]
-    else:
-        result = cursor.fetchall()
+    Rows are (name, start_date, end_date, assigned_to, assigned_name,
+    deviation, projected_finish, slack_days), the last three from the
+    critical path schedule (None until it has been computed). The overlap
+    test (start <= filter_end AND end >= filter_start) runs against the
+    R*Tree interval indexes, so it stays fast on large timelines.
+    """
+    start_day = (filter_start - date(1970, 1, 1)).days
+    end_day = (filter_end - date(1970, 1, 1)).days
+    return execute_query("""
+        SELECT p.name, p.start_date, p.end_date, p.assigned_to, 
+               tm.first_name || ' ' || tm.last_name,
+               p.deviation, s.finish_date, s.slack_days
+        FROM projects_timeline r
+        JOIN projects p ON p.id = r.id
+        LEFT JOIN team_members tm ON tm.id = p.assigned_to
+        LEFT JOIN schedule s ON s.kind = 'project' AND s.id = p.id
+        WHERE r.start_day <= ? AND r.end_day >= ?
+        UNION ALL
+        SELECT sp.name, sp.start_date, sp.end_date, sp.assigned_to, 
+               tm.first_name || ' ' || tm.last_name,
+               sp.deviation, s.finish_date, s.slack_days
+        FROM sub_projects_timeline r
+        JOIN sub_projects sp ON sp.id = r.id
+        LEFT JOIN team_members tm ON tm.id = sp.assigned_to
+        LEFT JOIN schedule s ON s.kind = 'sub_project' AND s.id = sp.id
+        WHERE r.start_day <= ? AND r.end_day >= ?
+    """, (end_day, start_day, end_day, start_day))
+
+@cached('tasks')
+def get_task_status_counts():
+    """
+    Get the number of tasks per assignee and status
+    
+    Rows are (assigned_to, status, task_count), with None for unassigned
+    tasks and tasks without a status. They're read from task_status_counts,
+    which triggers on tasks keep current, so the cost doesn't grow with
+    the number of tasks.
+    """
+    return execute_query("""
+        SELECT NULLIF(member_id, 0), NULLIF(status, ''), task_count
+        FROM task_status_counts
+    """)
+
+@cached('tasks', 'projects', 'sub_projects', scope='session')
+def get_member_task_details(member_ids):
+    """
+    Get the dashboard task details of several team members at once
+    
+    Returns a DataFrame with columns assigned_to (Int64, <NA> when
+    unassigned), status (categorical over TASK_STATUSES) and the Arrow
+    strings task, project, sub_project, jira_ticket and description,
+    ordered open tasks first
+    and then by project and sub-project. Include None in member_ids to get
+    unassigned tasks. The frame is cached and shared: don't modify it.
+    """
+    ids = [member_id for member_id in member_ids if member_id is not None]
+    conditions = []
+    if ids:
+        conditions.append("t.assigned_to IN ({})".format(','.join(['?'] * len(ids))))
+    if len(ids) < len(member_ids):
+        conditions.append("t.assigned_to IS NULL")
+    if not conditions:
+        # Matches nothing, but still gives the frame its columns and types
+        conditions.append("0")
+    
+    return query_df("""
+        SELECT 
+            t.assigned_to,
+            t.name AS task,
+            p.name AS project,
+            sp.name AS sub_project,
+            t.status,
+            t.jira_ticket,
+            t.description
+        FROM tasks t
+        LEFT JOIN projects p ON t.project_id = p.id
+        LEFT JOIN sub_projects sp ON t.sub_project_id = sp.id
+        WHERE {}
+        ORDER BY 
+            t.assigned_to,
+            CASE 
+                WHEN t.status = 'completed' THEN 2
+                ELSE 1
+            END,
+            p.name, 
+            sp.name
+    """.format(' OR '.join(conditions)), ids, categories={'status': TASK_STATUSES},
+        dtypes={'assigned_to': 'Int64', **dict.fromkeys(
+            ['task', 'project', 'sub_project', 'jira_ticket', 'description'], 'string[pyarrow]')})
+
+@cached('teams', 'team_members', 'tasks')
+def get_team_rosters():
+    """
+    Get every team with its members and their assigned tasks
+    
+    Returns a list of ((team_id, name, description, location), members),
+    where members is a list of (id, first_name, last_name, email, team_id,
+    task_names) and task_names is a comma separated string or None. The
+    whole roster is one query; each member's task names are aggregated
+    through the assigned_to index.
+    """
+    rows = execute_query("""
+        SELECT 
+            t.id, t.name, t.description, t.location,
+            tm.id, tm.first_name, tm.last_name, tm.email, tm.team_id,
+            (SELECT GROUP_CONCAT(tk.name, ', ') FROM tasks tk 
+             WHERE tk.assigned_to = tm.id) AS task_names
+        FROM teams t
+        LEFT JOIN team_members tm ON tm.team_id = t.id
+        ORDER BY t.id, tm.id
+    """)
+    
+    rosters = []
+    for team_id, team_rows in groupby(rows, key=lambda row: row[0]):
+        team_rows = list(team_rows)
+        members = [row[4:] for row in team_rows if row[4] is not None]
+        rosters.append((team_rows[0][:4], members))
+    return rosters
+
+@cached('tasks', 'projects')
+def search_tasks(prefix: str = "", limit: int = 20):
+    """
+    Find tasks whose name starts with prefix, ignoring case
+    
+    Rows are (id, name, project_name), ordered by name. The prefix match is
+    a range scan of the NOCASE name index, so it stays cheap however many
+    tasks there are.
+    """
+    pattern = re.sub(r'([\\%_])', r'\\\1', prefix) + '%'
+    return execute_query("""
+        SELECT t.id, t.name, p.name
+        FROM tasks t
+        LEFT JOIN projects p ON p.id = t.project_id
+        WHERE t.name LIKE ? ESCAPE '\\'
+        ORDER BY t.name COLLATE NOCASE, t.id
+        LIMIT ?
+    """, (pattern, limit))
+
+def get_task_notes(task_id: int, after: Optional[tuple] = None, limit: int = 50):
+    """
+    Get one page of a task's notes, newest first
+    
+    Rows are (id, note, created_at). Pass the (created_at, id) of the last
+    note already shown as after to get the next page; the keyset seek
+    reads only the rows it returns, however deep the page is.
+    """
+    if after is None:
+        return execute_query("""
+            SELECT id, note, created_at FROM notes
+            WHERE task_id = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (task_id, limit))
+    return execute_query("""
+        SELECT id, note, created_at FROM notes
+        WHERE task_id = ? AND (created_at, id) < (?, ?)
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """, (task_id, after[0], after[1], limit))
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching every word, the last one as
+    a prefix so results show up while typing
+    
+    Words are quoted, so FTS5 syntax in the text is matched literally.
+    Returns None if the text has no words.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+# One ranked branch of search() per indexed source. Each yields (kind, id,
+# title, snippet, project_id, project_name, rank); snippets mark matches
+# with ** so they render bold as markdown.
+SEARCH_BRANCHES = [
+    """
+        SELECT 'Task', t.id, t.name,
+               snippet(tasks_fts, -1, '**', '**', '…', 12),
+               t.project_id, p.name, tasks_fts.rank
+        FROM tasks_fts
+        JOIN tasks t ON t.id = tasks_fts.rowid
+        LEFT JOIN projects p ON p.id = t.project_id
+        WHERE tasks_fts MATCH ?
+        ORDER BY tasks_fts.rank
+        LIMIT ?
+    """,
+    """
+        SELECT 'Note', n.id, t.name,
+               snippet(notes_fts, 0, '**', '**', '…', 12),
+               t.project_id, p.name, notes_fts.rank
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        LEFT JOIN tasks t ON t.id = n.task_id
+        LEFT JOIN projects p ON p.id = t.project_id
+        WHERE notes_fts MATCH ?
+        ORDER BY notes_fts.rank
+        LIMIT ?
+    """,
+    """
+        SELECT 'Reminder', r.id, t.name,
+               snippet(reminders_fts, 0, '**', '**', '…', 12),
+               t.project_id, p.name, reminders_fts.rank
+        FROM reminders_fts
+        JOIN reminders r ON r.id = reminders_fts.rowid
+        LEFT JOIN tasks t ON t.id = r.task_id
+        LEFT JOIN projects p ON p.id = t.project_id
+        WHERE reminders_fts MATCH ?
+        ORDER BY reminders_fts.rank
+        LIMIT ?
+    """,
+    """
+        SELECT 'Activity', a.id, a.entity_name,
+               snippet(activity_logs_fts, 0, '**', '**', '…', 12),
+               a.project_id, a.project_name, activity_logs_fts.rank
+        FROM activity_logs_fts
+        JOIN activity_logs a ON a.id = activity_logs_fts.rowid
+        WHERE activity_logs_fts MATCH ?
+        ORDER BY activity_logs_fts.rank
+        LIMIT ?
+    """,
+]
+
+@cached('tasks', 'notes', 'reminders', 'activity_logs', 'projects')
+def search(text: str, limit: int = 20):
+    """
+    Full-text search over tasks, notes, reminders and activity logs
+    
+    Rows are (kind, id, title, snippet, project_id, project_name), best
+    bm25 match first across all sources. Each source only contributes its
+    own top matches, so the cost depends on limit, not on table size.
+    """
+    match = fts_query(text)
+    if match is None:
+        return []
+    
+    query = " UNION ALL ".join(f"SELECT * FROM ({branch})" for branch in SEARCH_BRANCHES)
+    params = [match, limit] * len(SEARCH_BRANCHES)
+    rows = execute_query(f"SELECT * FROM ({query}) ORDER BY 7 LIMIT ?", params + [limit])
+    return [row[:6] for row in rows]
+
+def execute_query(query, params=None, fetch_last_id=False):
+    # Writes go through the writer thread so sessions never contend for the lock
+    if _is_write(query):
+        result = execute_write(query, params)
+        return result.lastrowid if fetch_last_id else result.rows
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        result = _execute(cursor, query, params)
+        
+        if fetch_last_id:
+            cursor.execute("SELECT last_insert_rowid()")
+            result = cursor.fetchone()[0]
     
-    conn.commit()
-    conn.close()
     return result
 
+class ActivityLogger:
+    """
+    Buffered, asynchronous activity log writer.
+
+    ``log`` only puts the entry on a bounded queue. A background thread
+    drains whatever has accumulated and inserts it with one executemany on
+    the writer thread, so a burst of edits costs a single transaction.
+    """
+
+    _STOP = object()
+
+    # The project's name is looked up as the entry is written; a deleted
+    # project is gone by then, but its own entries carry the name
+    INSERT = """INSERT INTO activity_logs 
+                (timestamp, user_id, action_type, entity_type, entity_id, entity_name, description, project_id,
+                 project_name)
+                VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8,
+                        COALESCE((SELECT name FROM projects WHERE id = ?8),
+                                 CASE WHEN ?4 = 'project' AND ?5 = ?8 THEN ?6 END))"""
+
+    def __init__(self, max_queue: int = ACTIVITY_LOG_QUEUE_SIZE, backpressure: str = ACTIVITY_LOG_BACKPRESSURE,
+                 block_timeout: float = ACTIVITY_LOG_BLOCK_TIMEOUT, batch_size: int = ACTIVITY_LOG_BATCH_SIZE):
+        if backpressure not in ('block', 'drop'):
+            raise ValueError("backpressure must be 'block' or 'drop'")
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the worker thread if it isn't running yet"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="projectforge-activity-log", daemon=True)
+                self._thread.start()
+
+    def log(self, row: tuple):
+        """Queue one activity_logs row, applying the backpressure policy when full"""
+        self.start()
+        try:
+            if self.backpressure == 'drop':
+                self._queue.put_nowait(row)
+            else:
+                self._queue.put(row, timeout=self.block_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Activity log queue is full, dropped entry: %s", row[6])
+
+    def flush(self):
+        """Wait until every queued entry has been written"""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+        if running:
+            self._queue.join()
+
+    def stop(self):
+        """Write out the queue and stop the worker thread"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                run_write(lambda cursor: _execute(cursor, self.INSERT, batch, many=True), ('activity_logs',))
+            except Exception:
+                logger.exception("Failed to write %d activity log entries", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+# Shared activity logger; registered after the writer so it flushes first at exit
+_activity_logger = ActivityLogger()
+atexit.register(_activity_logger.stop)
+
+def flush_activity_log():
+    """Wait until every logged activity has been written to the database"""
+    _activity_logger.flush()
+
 # Add a function to log activities
 def log_activity(action_type, entity_type, entity_id, entity_name, description, project_id=None, user_id=None):
     """
@@ -326,58 +1656,73 @@ def log_activity(action_type, entity_type, entity_id, entity_name, description,
     - description: Description of the activity
     - project_id: ID of the project this activity belongs to (can be None)
     - user_id: ID of the user who performed the action (can be None)
-    """
-    st.info(f"Logging activity: {action_type} for {entity_type} with ID {entity_id}")
-    print(f"Logging activity: {action_type} for {entity_type} with ID {entity_id}")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     
-    cursor.execute(
-        """INSERT INTO activity_logs 
-           (timestamp, user_id, action_type, entity_type, entity_id, entity_name, description, project_id)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+    The entry is queued and written in the background, see ActivityLogger.
+    """
+    _activity_logger.log(
         (datetime.now().isoformat(), user_id, action_type, entity_type, entity_id, entity_name, description, project_id)
     )
-    
-    conn.commit()
-    conn.close()
 
 # Function to get activity logs for a project
 def get_project_activity_logs(project_id, limit=50):
-    """Get recent activity logs for a specific project"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        """SELECT id, timestamp, action_type, entity_type, entity_id, entity_name, description
-           FROM activity_logs
-           WHERE project_id = ?
-           ORDER BY timestamp DESC
-           LIMIT ?""",
-        (project_id, limit)
-    )
-    
-    logs = cursor.fetchall()
-    conn.close()
+    """
+    Get recent activity logs for a specific project
+
+    Entries still on the ActivityLogger queue show up once they are written;
+    reads never wait for the queue.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        logs = _execute(
+            cursor,
+            """SELECT id, timestamp, action_type, entity_type, entity_id, entity_name, description
+               FROM activity_logs
+               WHERE project_id = ?
+               ORDER BY timestamp DESC
+               LIMIT ?""",
+            (project_id, limit)
+        )
     
     return logs
 
 # Function to get all recent activity logs
 def get_recent_activity_logs(limit=50):
-    """Get recent activity logs across all projects"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        """SELECT a.id, a.timestamp, a.action_type, a.entity_type, a.entity_id, a.entity_name, a.description, p.name
-           FROM activity_logs a
-           LEFT JOIN projects p ON a.project_id = p.id
-           ORDER BY a.timestamp DESC
-           LIMIT ?""",
-        (limit,)
-    )
+    """
+    Get recent activity logs across all projects
+
+    Entries still on the ActivityLogger queue show up once they are written.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        logs = _execute(
+            cursor,
+            """SELECT id, timestamp, action_type, entity_type, entity_id, entity_name, description, project_name
+               FROM activity_logs
+               ORDER BY timestamp DESC
+               LIMIT ?""",
+            (limit,)
+        )
     
-    logs = cursor.fetchall()
-    conn.close()
+    return logs
+
+@cached('activity_logs')
+def get_activity_trend(period: str = 'day', since: Optional[str] = None, project_id: Optional[int] = None):
+    """
+    Get the number of activity log entries per time bucket and entity type
     
-    return logs 
\ No newline at end of file
+    period is 'hour' or 'day'; buckets are ISO strings ('2024-05-31' or
+    '2024-05-31T14:00') and since is compared to them as text. Rows are
+    (bucket, entity_type, event_count) in time order, for one project or
+    all of them, read from activity_rollups: the cost depends on the range,
+    not on the size of the log or the number of projects.
+    """
+    if period not in ACTIVITY_ROLLUP_BUCKETS:
+        raise ValueError(f"period must be one of {', '.join(ACTIVITY_ROLLUP_BUCKETS)}")
+    return execute_query("""
+        SELECT bucket, entity_type, event_count
+        FROM activity_rollups
+        WHERE period = ? AND project_id = ? AND bucket >= ?
+        ORDER BY bucket, entity_type
+    """, (period, ACTIVITY_ROLLUP_ALL_PROJECTS if project_id is None else project_id, since or '')) 
\ No newline at end of file
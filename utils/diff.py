@@ -0,0 +1,45 @@
+import pandas as pd
+from collections import namedtuple
+from typing import List, Optional
+
+# Result of comparing a data editor's input and output frames:
+# - inserts: new rows (columns only)
+# - updates: changed existing rows (key followed by columns)
+# - deletes: keys of removed or ticked-for-deletion rows
+EditorChanges = namedtuple('EditorChanges', ['inserts', 'updates', 'deletes'])
+
+def diff_editor_frames(original: pd.DataFrame, edited: pd.DataFrame, key: str, columns: List[str],
+                       delete_column: Optional[str] = None) -> EditorChanges:
+    """
+    Compare the frame passed to st.data_editor with the frame it returned
+
+    Existing rows are matched on key, so the comparison doesn't depend on
+    row order. Rows without a key are inserts; rows removed in the editor or
+    with delete_column ticked are deletes; the remaining rows with any
+    value in columns changed are updates. All comparisons are vectorized.
+    """
+    before = original.set_index(key)[columns]
+
+    has_key = edited[key].notna()
+    inserts = edited.loc[~has_key, columns].reset_index(drop=True)
+
+    current = edited.loc[has_key].set_index(key)
+    current.index = current.index.astype(before.index.dtype)
+
+    deletes = before.index.difference(current.index)
+    if delete_column is not None:
+        ticked = current[delete_column].fillna(False).astype(bool)
+        deletes = deletes.union(current.index[ticked])
+
+    after = current.drop(index=deletes, errors='ignore')[columns]
+    previous = before.loc[after.index]
+    # NaN never equals NaN, so treat "missing before and after" as unchanged
+    changed = (after.ne(previous) & ~(after.isna() & previous.isna())).any(axis=1)
+    updates = after.loc[changed].reset_index()
+
+    return EditorChanges(inserts, updates, deletes.tolist())
+
+def frame_rows(frame: pd.DataFrame) -> List[tuple]:
+    """Convert a frame to a list of tuples of plain Python values, with NaN as None"""
+    values = frame.astype(object).where(frame.notna(), None)
+    return list(values.itertuples(index=False, name=None))
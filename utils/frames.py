@@ -0,0 +1,58 @@
+"""
+Vectorized helpers for the DataFrames pages display.
+
+Each works on whole columns: strings are handled by Arrow compute kernels
+(pyarrow comes with Streamlit) and statuses through their category codes,
+so the cost doesn't include a Python call per cell.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Iterable
+
+# Background of each task status in tables
+STATUS_COLORS: Dict[str, str] = {
+    'completed': '#e6ffe6',
+    'blocked': '#ffcccc',
+    'waiting': '#ffe6cc',
+    'in progress': '#e6f7ff',
+}
+
+def fill_missing(frame: pd.DataFrame, value: str = '-') -> pd.DataFrame:
+    """Return a copy of a frame with missing text and categorical values replaced by value"""
+    filled = {}
+    for column in frame.select_dtypes(include=['object', 'string', 'category']).columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) and value not in values.cat.categories:
+            values = values.cat.add_categories([value])
+        filled[column] = values.fillna(value)
+    return frame.assign(**filled)
+
+def truncate(values: pd.Series, length: int = 50, suffix: str = '...') -> pd.Series:
+    """
+    Shorten the strings of a column longer than length, keeping missing values
+
+    The result is Arrow-backed, which st.dataframe also sends without
+    converting it value by value.
+    """
+    text = pa.array(values.array, from_pandas=True)
+    if not pa.types.is_string(text.type) and not pa.types.is_large_string(text.type):
+        text = pc.cast(text, pa.string())
+    shortened = pc.binary_join_element_wise(
+        pc.utf8_slice_codeunits(text, 0, length), pa.scalar(suffix, text.type), pa.scalar('', text.type)
+    )
+    result = pc.if_else(pc.greater(pc.utf8_length(text), length), shortened, text)
+    return pd.Series(pd.arrays.ArrowExtensionArray(result), index=values.index, name=values.name)
+
+def status_styles(values: pd.Series) -> pd.Series:
+    """CSS for each cell of a status column, for Styler.apply"""
+    statuses = values.astype('category')
+    # One entry per category, plus '' for missing values (code -1)
+    css = np.array([f'background-color: {STATUS_COLORS[status]}' if status in STATUS_COLORS else ''
+                    for status in statuses.cat.categories] + [''], dtype=object)
+    return pd.Series(css[statuses.cat.codes.to_numpy()], index=values.index)
+
+def style_status(frame: pd.DataFrame, columns: Iterable[str] = ('Status',)):
+    """Color the status columns of a frame, one vectorized call per column"""
+    return frame.style.apply(status_styles, subset=list(columns))
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from requests.adapters import HTTPAdapter
+
+import utils.database as db
+
+logger = logging.getLogger(__name__)
+
+# Concurrent searches per sync, and pooled HTTP connections per client
+JIRA_SYNC_WORKERS = int(os.environ.get('PROJECTFORGE_JIRA_SYNC_WORKERS', '4'))
+
+# Issue keys per JQL "key in (...)" search
+JIRA_SYNC_CHUNK_SIZE = int(os.environ.get('PROJECTFORGE_JIRA_SYNC_CHUNK_SIZE', '100'))
+
+# Age after which a cached issue is fetched again (seconds)
+JIRA_SYNC_TTL = float(os.environ.get('PROJECTFORGE_JIRA_SYNC_TTL', '300'))
+
+# Timeout of a single Jira request (seconds)
+JIRA_TIMEOUT = float(os.environ.get('PROJECTFORGE_JIRA_TIMEOUT', '10'))
+
+# Wait after a failed background sync before starting another (seconds)
+JIRA_SYNC_RETRY_DELAY = float(os.environ.get('PROJECTFORGE_JIRA_SYNC_RETRY_DELAY', '60'))
+
+# Only well-formed keys are sent, which also keeps the JQL injection-free
+ISSUE_KEY_RE = re.compile(r'^[A-Z][A-Z0-9_]*-[1-9][0-9]*$')
+
+UPSERT_ISSUE = """
+    INSERT INTO jira_issues (issue_key, status, summary, updated, fetched_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (issue_key) DO UPDATE SET
+        status = excluded.status,
+        summary = excluded.summary,
+        updated = excluded.updated,
+        fetched_at = excluded.fetched_at
+"""
+
+# Clients by settings hash, so the handshake and connections are reused
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+@db.cached('connections')
+def load_settings() -> Dict[str, Any]:
+    """Get the saved Jira connection settings ({} if there are none)"""
+    rows = db.execute_query("SELECT settings FROM connections WHERE name = 'jira'")
+    if not rows or not rows[0][0]:
+        return {}
+    try:
+        return json.loads(rows[0][0])
+    except json.JSONDecodeError:
+        return {}
+
+def is_configured(settings: Dict[str, Any]) -> bool:
+    """Check that the settings enable Jira and have everything needed to connect"""
+    return bool(settings.get("enabled") and settings.get("url")
+                and settings.get("username") and settings.get("api_token"))
+
+def settings_hash(settings: Dict[str, Any]) -> str:
+    """Hash the settings that identify a client"""
+    identity = {name: settings.get(name) for name in ("url", "username", "api_token")}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+def get_client(settings: Dict[str, Any]):
+    """
+    Get the Jira client for some settings, creating it on first use
+
+    Clients are kept per settings hash and skip the server info handshake,
+    so repeated calls cost nothing. Each client's session pools enough
+    connections for the sync workers.
+    """
+    key = settings_hash(settings)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            from jira import JIRA
+
+            client = JIRA(
+                server=settings["url"],
+                basic_auth=(settings["username"], settings["api_token"]),
+                get_server_info=False,
+                timeout=JIRA_TIMEOUT,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=JIRA_SYNC_WORKERS)
+            client._session.mount("https://", adapter)
+            client._session.mount("http://", adapter)
+            _clients[key] = client
+        return client
+
+def normalize_key(value: Optional[str]) -> Optional[str]:
+    """Turn a jira_ticket value into an issue key, or None if it isn't one"""
+    if not value:
+        return None
+    key = value.strip().upper()
+    return key if ISSUE_KEY_RE.match(key) else None
+
+def normalize_keys(values: Iterable[Optional[str]]) -> List[str]:
+    """Get the distinct issue keys among jira_ticket values"""
+    return list(dict.fromkeys(key for key in map(normalize_key, values) if key))
+
+def _search_chunk(client, keys: List[str]) -> List[Tuple[str, str, str, str]]:
+    """Fetch (key, status, summary, updated) for some issue keys, following pages"""
+    jql = "key in ({})".format(", ".join(keys))
+    rows = []
+    start = 0
+    while True:
+        # POST keeps long key lists out of the URL; without validation
+        # unknown keys are skipped instead of failing the whole search
+        result = client.search_issues(
+            jql, startAt=start, maxResults=len(keys), validate_query=False,
+            fields="status,summary,updated", json_result=True, use_post=True,
+        )
+        issues = result.get("issues", [])
+        for issue in issues:
+            fields = issue.get("fields", {})
+            status = (fields.get("status") or {}).get("name")
+            rows.append((issue["key"], status, fields.get("summary"), fields.get("updated")))
+        start += len(issues)
+        if not issues or start >= result.get("total", 0):
+            return rows
+
+def _stale_keys(keys: List[str]) -> List[str]:
+    """Get the keys that aren't cached or were fetched more than JIRA_SYNC_TTL ago"""
+    fresh_after = (datetime.now() - timedelta(seconds=JIRA_SYNC_TTL)).isoformat()
+    fresh = {key for key, in db.execute_query(
+        "SELECT issue_key FROM jira_issues WHERE issue_key IN ({}) AND fetched_at >= ?".format(
+            ','.join(['?'] * len(keys))),
+        keys + [fresh_after]
+    )}
+    return [key for key in keys if key not in fresh]
+
+def sync_issues(values: Iterable[Optional[str]], settings: Optional[Dict[str, Any]] = None,
+                force: bool = False) -> int:
+    """
+    Refresh the cached issues for some jira_ticket values
+
+    Only keys that aren't cached or are older than JIRA_SYNC_TTL are
+    fetched (all of them with force), in chunks of JIRA_SYNC_CHUNK_SIZE
+    searched concurrently. Jira's search API sends no per-issue ETags, so
+    each issue's `updated` timestamp is stored as its version instead.
+    Returns the number of keys fetched; 0 if Jira isn't configured.
+    """
+    settings = load_settings() if settings is None else settings
+    keys = normalize_keys(values)
+    if not keys or not is_configured(settings):
+        return 0
+
+    if not force:
+        keys = _stale_keys(keys)
+        if not keys:
+            return 0
+
+    client = get_client(settings)
+    chunks = [keys[i:i + JIRA_SYNC_CHUNK_SIZE] for i in range(0, len(keys), JIRA_SYNC_CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=min(JIRA_SYNC_WORKERS, len(chunks)),
+                            thread_name_prefix="projectforge-jira") as pool:
+        found = [row for rows in pool.map(partial(_search_chunk, client), chunks) for row in rows]
+
+    # Keys Jira didn't return are stored without a status
+    fetched_at = datetime.now().isoformat()
+    returned = {row[0] for row in found}
+    rows = [row + (fetched_at,) for row in found]
+    rows += [(key, None, None, None, fetched_at) for key in keys if key not in returned]
+    db.execute_write(UPSERT_ISSUE, rows, many=True)
+    return len(keys)
+
+# Background syncs run one at a time, off the page render, for the keys
+# requested since the last one
+_sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="projectforge-jira-sync")
+_sync_lock = threading.Lock()
+_sync_future: Optional[Future] = None
+_sync_keys: set = set()
+_last_failure = float("-inf")
+
+def _sync_pending():
+    global _sync_keys, _last_failure
+    while True:
+        with _sync_lock:
+            keys, _sync_keys = _sync_keys, set()
+            if not keys:
+                return
+        try:
+            count = sync_issues(keys)
+            logger.info("Refreshed %s Jira issues", count)
+        except Exception:
+            logger.exception("Refreshing Jira issues failed")
+            with _sync_lock:
+                _last_failure = time.monotonic()
+                # Dropped: the next request after the retry delay asks again
+                _sync_keys = set()
+            return
+
+def sync_issues_in_background(values: Iterable[Optional[str]]) -> bool:
+    """
+    Refresh the cached issues for some jira_ticket values on a background thread
+
+    Returns immediately. Only stale keys are queued; keys asked for while
+    a sync is running are synced right after it. Nothing starts within
+    JIRA_SYNC_RETRY_DELAY of a failed sync, or if Jira isn't configured.
+    Returns whether some of the keys are being refreshed.
+    """
+    global _sync_future
+    keys = normalize_keys(values)
+    if not keys or not is_configured(load_settings()):
+        return False
+    with _sync_lock:
+        if time.monotonic() - _last_failure < JIRA_SYNC_RETRY_DELAY:
+            return False
+    keys = _stale_keys(keys)
+    if not keys:
+        return False
+    with _sync_lock:
+        _sync_keys.update(keys)
+        if _sync_future is None or _sync_future.done():
+            _sync_future = _sync_executor.submit(_sync_pending)
+        return True
+
+@db.cached('jira_issues')
+def get_issue_statuses(values: Iterable[Optional[str]]) -> Dict[str, Tuple[str, Optional[str], str]]:
+    """
+    Get {key: (status, updated, fetched_at)} from the cache for the known issues among jira_ticket values
+
+    fetched_at is when the status was read from Jira, so callers can show
+    how stale it is.
+    """
+    keys = normalize_keys(values)
+    if not keys:
+        return {}
+    rows = db.execute_query(
+        "SELECT issue_key, status, updated, fetched_at FROM jira_issues "
+        "WHERE issue_key IN ({}) AND status IS NOT NULL".format(','.join(['?'] * len(keys))),
+        keys
+    )
+    return {key: (status, updated, fetched_at) for key, status, updated, fetched_at in rows}
@@ -0,0 +1,444 @@
+"""
+Background upkeep of the database: backups, statistics, archiving and space.
+
+A MaintenanceService thread runs each task when its interval has passed
+since its last run (recorded in maintenance_runs, so restarts don't
+repeat them):
+
+- backup: online copy with the sqlite3 backup API, in small steps while
+  sessions keep writing, into BACKUP_DIR; the newest BACKUP_KEEP are kept
+- optimize / analyze: PRAGMA optimize hourly, a bounded ANALYZE daily,
+  so the query planner's statistics follow the data
+- archive: activity logs older than the retention period move into a
+  side database as zlib-compressed batches
+- vacuum: free pages are handed back with incremental_vacuum in steps
+
+Usage (from the repository root):
+
+    python -m utils.maintenance status
+    python -m utils.maintenance run backup|optimize|analyze|archive|vacuum
+    python -m utils.maintenance snapshot PATH      # compacted copy (VACUUM INTO)
+    python -m utils.maintenance compact            # full VACUUM; stop the app first
+"""
+import argparse
+import atexit
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import utils.database as db
+
+logger = logging.getLogger(__name__)
+
+# Set PROJECTFORGE_MAINTENANCE=0 to not run maintenance in the app process,
+# e.g. when it's scheduled externally with the CLI
+MAINTENANCE_ENABLED = os.environ.get('PROJECTFORGE_MAINTENANCE', '1') != '0'
+
+# Wait after startup before the first task runs, so it doesn't slow
+# startup down (seconds)
+MAINTENANCE_STARTUP_DELAY = float(os.environ.get('PROJECTFORGE_MAINTENANCE_STARTUP_DELAY', '60'))
+
+_DATA_DIR = os.path.dirname(db.DB_PATH) or '.'
+
+# Backups: where, how often (hours), how many are kept, and the pages
+# copied per step and pause between steps of the online backup
+BACKUP_DIR = os.environ.get('PROJECTFORGE_BACKUP_DIR', os.path.join(_DATA_DIR, 'backups'))
+BACKUP_INTERVAL_HOURS = float(os.environ.get('PROJECTFORGE_BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.environ.get('PROJECTFORGE_BACKUP_KEEP', '7'))
+BACKUP_PAGES_PER_STEP = int(os.environ.get('PROJECTFORGE_BACKUP_PAGES_PER_STEP', '1024'))
+BACKUP_STEP_SLEEP = float(os.environ.get('PROJECTFORGE_BACKUP_STEP_SLEEP', '0.005'))
+
+# Planner statistics: PRAGMA optimize and ANALYZE intervals (hours), and
+# the rows ANALYZE samples per index (0 reads everything)
+OPTIMIZE_INTERVAL_HOURS = float(os.environ.get('PROJECTFORGE_OPTIMIZE_INTERVAL_HOURS', '1'))
+ANALYZE_INTERVAL_HOURS = float(os.environ.get('PROJECTFORGE_ANALYZE_INTERVAL_HOURS', '24'))
+ANALYZE_LIMIT = int(os.environ.get('PROJECTFORGE_ANALYZE_LIMIT', '1000'))
+
+# Activity log archiving: age after which entries move to the archive
+# (days, 0 keeps everything), how often (hours) and rows per batch
+ACTIVITY_LOG_RETENTION_DAYS = float(os.environ.get('PROJECTFORGE_ACTIVITY_LOG_RETENTION_DAYS', '180'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('PROJECTFORGE_ARCHIVE_INTERVAL_HOURS', '24'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('PROJECTFORGE_ARCHIVE_BATCH_SIZE', '5000'))
+ARCHIVE_PATH = os.environ.get('PROJECTFORGE_ARCHIVE_PATH', os.path.join(_DATA_DIR, 'archive', 'activity_logs.db'))
+
+# Space: free pages tolerated before incremental_vacuum runs, and pages
+# freed per step (each step briefly holds the write lock)
+VACUUM_INTERVAL_HOURS = float(os.environ.get('PROJECTFORGE_VACUUM_INTERVAL_HOURS', '24'))
+VACUUM_MIN_FREE_PAGES = int(os.environ.get('PROJECTFORGE_VACUUM_MIN_FREE_PAGES', '1000'))
+VACUUM_PAGES_PER_STEP = int(os.environ.get('PROJECTFORGE_VACUUM_PAGES_PER_STEP', '256'))
+
+# Longest the service sleeps without looking at the clock (seconds)
+MAINTENANCE_MAX_SLEEP = 3600.0
+
+# Columns of archived activity log entries, in payload order
+ARCHIVE_COLUMNS = ['id', 'timestamp', 'user_id', 'action_type', 'entity_type', 'entity_id',
+                   'entity_name', 'description', 'project_id', 'project_name']
+
+# A maintenance task: name, interval in seconds and the function that runs
+# it and returns a short description of what it did
+MaintenanceTask = namedtuple('MaintenanceTask', ['name', 'interval', 'run'])
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    """Open a dedicated autocommit connection, outside the pool and the writer"""
+    conn = sqlite3.connect(path or db.DB_PATH, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {db.CONNECTION_PRAGMAS['busy_timeout']}")
+    return conn
+
+def database_stats() -> Dict[str, int]:
+    """Get the database's size, free space and auto_vacuum mode"""
+    with closing(_connect()) as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    wal_path = f"{db.DB_PATH}-wal"
+    return {
+        "size_bytes": page_size * page_count,
+        "free_bytes": page_size * free_pages,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "page_size": page_size,
+        "free_pages": free_pages,
+        "auto_vacuum": auto_vacuum,
+    }
+
+def backup(path: Optional[str] = None) -> str:
+    """
+    Copy the database with the online backup API
+
+    The source connection holds one read transaction for the whole copy,
+    so under WAL it's a consistent snapshot that writers never wait on, and
+    the backup doesn't restart when they commit. Pages are copied a step at
+    a time with a pause in between. Without a path, the copy goes to
+    BACKUP_DIR and older backups beyond BACKUP_KEEP are removed.
+    """
+    rotate = path is None
+    if rotate:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        path = os.path.join(BACKUP_DIR, f"projectforge-{datetime.now():%Y%m%d-%H%M%S}.db")
+    temp_path = f"{path}.tmp"
+    with closing(_connect()) as source, closing(sqlite3.connect(temp_path)) as target:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        finally:
+            source.execute("COMMIT")
+        # A backup is a standalone file: no WAL next to it
+        target.execute("PRAGMA journal_mode = DELETE")
+    os.replace(temp_path, path)
+
+    removed = 0
+    if rotate:
+        backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "projectforge-*.db")))
+        for old in backups[:max(0, len(backups) - BACKUP_KEEP)]:
+            os.remove(old)
+            removed += 1
+    return f"{path} ({os.path.getsize(path) // 1024} KB)" + (f", removed {removed} old" if removed else "")
+
+def snapshot(path: str) -> str:
+    """Write a compacted copy of the database with VACUUM INTO (incremental auto_vacuum enabled)"""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    with closing(_connect()) as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM INTO ?", (path,))
+    return f"{path} ({os.path.getsize(path) // 1024} KB)"
+
+def compact() -> str:
+    """
+    Rebuild the database in place with VACUUM, switching on incremental
+    auto_vacuum; this blocks every writer until it's done, so run it with
+    the app stopped
+    """
+    before = database_stats()["size_bytes"]
+    with closing(_connect()) as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    return f"{before // 1024} KB -> {database_stats()['size_bytes'] // 1024} KB"
+
+def optimize() -> str:
+    """Let SQLite refresh the statistics it considers stale"""
+    db.run_write(lambda cursor: cursor.execute("PRAGMA optimize").fetchall())
+    return "ok"
+
+def analyze() -> str:
+    """Refresh the planner statistics of every table and index, sampling at most ANALYZE_LIMIT rows per index"""
+    def job(cursor: sqlite3.Cursor):
+        cursor.execute(f"PRAGMA analysis_limit = {ANALYZE_LIMIT}")
+        cursor.execute("ANALYZE")
+    db.run_write(job)
+    return f"analysis_limit {ANALYZE_LIMIT}"
+
+def _archive_connection() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(ARCHIVE_PATH) or '.', exist_ok=True)
+    conn = _connect(ARCHIVE_PATH)
+    # deleted is set once the batch's rows are gone from the main database
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_log_batches (
+            id INTEGER PRIMARY KEY,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_timestamp TEXT,
+            last_timestamp TEXT,
+            row_count INTEGER NOT NULL,
+            columns TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    return conn
+
+def _delete_archived(archive: sqlite3.Connection, batch_id: int, ids: List[int]):
+    """Remove a batch's rows from the main database, then mark the batch done"""
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        db.execute_write(
+            "DELETE FROM activity_logs WHERE id IN ({})".format(','.join(['?'] * len(chunk))), chunk
+        )
+    archive.execute("UPDATE activity_log_batches SET deleted = 1 WHERE id = ?", (batch_id,))
+
+def archive_activity_logs(retention_days: float = None) -> str:
+    """
+    Move activity logs older than the retention period into the archive
+
+    Each batch is committed to the archive first and deleted from the main
+    database after, so a crash in between never loses entries: batches
+    not marked deleted are finished on the next run.
+    """
+    retention_days = ACTIVITY_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return "retention disabled"
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+    archived = 0
+    with closing(_archive_connection()) as archive:
+        # Finish batches an earlier run archived but didn't delete
+        for batch_id, payload in archive.execute(
+                "SELECT id, payload FROM activity_log_batches WHERE deleted = 0").fetchall():
+            _delete_archived(archive, batch_id, [row[0] for row in json.loads(zlib.decompress(payload))])
+
+        while True:
+            rows = db.execute_query(
+                f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM activity_logs WHERE timestamp < ? ORDER BY id LIMIT ?",
+                (cutoff, ARCHIVE_BATCH_SIZE)
+            )
+            if not rows:
+                break
+            timestamps = [row[1] for row in rows]
+            batch_id = archive.execute(
+                """INSERT INTO activity_log_batches
+                   (first_id, last_id, first_timestamp, last_timestamp, row_count, columns, payload)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (rows[0][0], rows[-1][0], min(timestamps), max(timestamps), len(rows),
+                 json.dumps(ARCHIVE_COLUMNS), zlib.compress(json.dumps(rows).encode(), 6))
+            ).lastrowid
+            _delete_archived(archive, batch_id, [row[0] for row in rows])
+            archived += len(rows)
+    return f"{archived} entries older than {cutoff[:10]}"
+
+def iter_archived_activity_logs(before: Optional[str] = None,
+                                after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream archived activity log entries as dicts, optionally within a timestamp range"""
+    if not os.path.exists(ARCHIVE_PATH):
+        return
+    with closing(_archive_connection()) as archive:
+        # Batches that can't overlap the range are skipped without decompressing
+        batches = archive.execute(
+            """SELECT columns, payload FROM activity_log_batches
+               WHERE (? IS NULL OR first_timestamp < ?) AND (? IS NULL OR last_timestamp >= ?)
+               ORDER BY first_id""",
+            (before, before, after, after)
+        )
+        for columns, payload in batches:
+            names = json.loads(columns)
+            for row in json.loads(zlib.decompress(payload)):
+                entry = dict(zip(names, row))
+                if (before is None or entry["timestamp"] < before) and (after is None or entry["timestamp"] >= after):
+                    yield entry
+
+def archive_stats() -> Dict[str, Any]:
+    """Get the number of archived entries and the archive's size"""
+    if not os.path.exists(ARCHIVE_PATH):
+        return {"entries": 0, "batches": 0, "size_bytes": 0}
+    with closing(_archive_connection()) as archive:
+        entries, batches, oldest, newest = archive.execute(
+            "SELECT COALESCE(SUM(row_count), 0), COUNT(*), MIN(first_timestamp), MAX(last_timestamp) "
+            "FROM activity_log_batches"
+        ).fetchone()
+    return {"entries": entries, "batches": batches, "oldest": oldest, "newest": newest,
+            "size_bytes": os.path.getsize(ARCHIVE_PATH)}
+
+def incremental_vacuum() -> str:
+    """
+    Hand free pages back to the file system, VACUUM_PAGES_PER_STEP at a time
+
+    Needs incremental auto_vacuum, which new databases get; older ones are
+    switched over by compact().
+    """
+    stats = database_stats()
+    if stats["auto_vacuum"] != 2:
+        if stats["free_pages"] >= VACUUM_MIN_FREE_PAGES:
+            logger.warning("%d free pages but auto_vacuum is off; run `python -m utils.maintenance compact` "
+                           "with the app stopped to reclaim them", stats["free_pages"])
+        return "auto_vacuum is off"
+    if stats["free_pages"] < VACUUM_MIN_FREE_PAGES:
+        return f"{stats['free_pages']} free pages"
+
+    freed = 0
+    with closing(_connect()) as conn:
+        while True:
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages:
+                break
+            # executescript steps the pragma to completion (execute would
+            # free one page); each step is its own short write transaction
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP});")
+            freed += free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            time.sleep(BACKUP_STEP_SLEEP)
+    return f"freed {freed} pages"
+
+TASKS: List[MaintenanceTask] = [
+    MaintenanceTask('optimize', OPTIMIZE_INTERVAL_HOURS * 3600, optimize),
+    MaintenanceTask('archive', ARCHIVE_INTERVAL_HOURS * 3600, archive_activity_logs),
+    MaintenanceTask('vacuum', VACUUM_INTERVAL_HOURS * 3600, incremental_vacuum),
+    MaintenanceTask('analyze', ANALYZE_INTERVAL_HOURS * 3600, analyze),
+    MaintenanceTask('backup', BACKUP_INTERVAL_HOURS * 3600, backup),
+]
+
+def last_runs() -> Dict[str, Dict[str, Any]]:
+    """Get the last run of each task: started_at, seconds, details, error"""
+    return {task: {"started_at": started_at, "seconds": seconds, "details": details, "error": error}
+            for task, started_at, seconds, details, error in db.execute_query(
+                "SELECT task, started_at, seconds, details, error FROM maintenance_runs")}
+
+def run_task(name: str) -> str:
+    """Run one task now and record the run; errors are recorded and re-raised"""
+    task = next((task for task in TASKS if task.name == name), None)
+    if task is None:
+        raise ValueError(f"Unknown maintenance task {name!r}; expected one of {', '.join(t.name for t in TASKS)}")
+    started_at = datetime.now()
+    start = time.perf_counter()
+    details, error = None, None
+    try:
+        details = task.run()
+        return details
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        db.execute_write(
+            """INSERT INTO maintenance_runs (task, started_at, seconds, details, error) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (task) DO UPDATE SET started_at = excluded.started_at, seconds = excluded.seconds,
+                   details = excluded.details, error = excluded.error""",
+            (name, started_at.isoformat(), time.perf_counter() - start, details, error)
+        )
+
+class MaintenanceService:
+    """
+    Runs the maintenance tasks in the background when they're due.
+
+    One thread works through TASKS in order, running each whose interval
+    has passed since its last recorded run, then sleeps until the next one
+    is due. Tasks do their writes through the writer thread or in short
+    steps of their own, so sessions keep reading and writing meanwhile.
+    """
+
+    def __init__(self, tasks: Optional[List[MaintenanceTask]] = None,
+                 startup_delay: float = MAINTENANCE_STARTUP_DELAY):
+        self.tasks = list(TASKS if tasks is None else tasks)
+        self.startup_delay = startup_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the service thread if it isn't running yet"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="projectforge-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the task that's running, if any"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_due(self, runs: Dict[str, Dict[str, Any]], task: MaintenanceTask) -> float:
+        """Seconds until a task is due (<= 0 when it is)"""
+        started_at = runs.get(task.name, {}).get("started_at")
+        if started_at is None:
+            return 0.0
+        try:
+            last = datetime.fromisoformat(started_at)
+        except ValueError:
+            return 0.0
+        return task.interval - (datetime.now() - last).total_seconds()
+
+    def _run(self):
+        if self._stop.wait(self.startup_delay):
+            return
+        while not self._stop.is_set():
+            try:
+                runs = last_runs()
+                for task in self.tasks:
+                    if self._stop.is_set():
+                        return
+                    if self._next_due(runs, task) <= 0:
+                        try:
+                            details = run_task(task.name)
+                            logger.info("Maintenance task %s: %s", task.name, details)
+                        except Exception:
+                            logger.exception("Maintenance task %s failed", task.name)
+                runs = last_runs()
+                sleep = min([self._next_due(runs, task) for task in self.tasks] + [MAINTENANCE_MAX_SLEEP])
+            except Exception:
+                logger.exception("Maintenance scheduling failed")
+                sleep = MAINTENANCE_MAX_SLEEP
+            # A task that failed is due again right away; don't spin on it
+            self._stop.wait(max(sleep, 60.0))
+
+# Maintenance shared by every session, started on first use
+_service = MaintenanceService()
+atexit.register(_service.stop)
+
+def get_service() -> MaintenanceService:
+    """Get the process-wide maintenance service, starting it if needed"""
+    _service.start()
+    return _service
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m utils.maintenance", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show database size and the last run of each task")
+    run = commands.add_parser("run", help="run a maintenance task now")
+    run.add_argument("task", choices=[task.name for task in TASKS])
+    snap = commands.add_parser("snapshot", help="write a compacted copy of the database (VACUUM INTO)")
+    snap.add_argument("path")
+    commands.add_parser("compact", help="VACUUM the database in place; stop the app first")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db.ensure_db()
+    if args.command == "run":
+        print(run_task(args.task))
+    elif args.command == "snapshot":
+        print(snapshot(args.path))
+    elif args.command == "compact":
+        print(compact())
+    else:
+        print(json.dumps({"database": database_stats(), "archive": archive_stats(), "runs": last_runs()},
+                         indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from typing import Optional, List, Dict, Any, Callable, Sequence, Tuple, Type, TypeVar, Union, get_args
 from datetime import date, datetime
+from copy import deepcopy
+from functools import lru_cache, partial
 import uuid
 
+# Workflow states a task can be in
+TASK_STATUSES = ["not started", "started", "in progress", "blocked", "waiting", "completed"]
+
 class TeamMember(BaseModel):
     """Model for team members"""
     id: Optional[int] = None
@@ -61,12 +66,14 @@ class Task(BaseModel):
     jira_ticket: Optional[str] = None
     status: str = "not started"
     assigned_to: Optional[int] = None
+    # Calendar days the task takes (weekends count); None uses the scheduler's default
+    duration_days: Optional[int] = Field(default=None, ge=0)
     
-    @validator('status')
+    @field_validator('status')
+    @classmethod
     def validate_status(cls, v):
-        valid_statuses = ["not started", "started", "in progress", "blocked", "waiting", "completed"]
-        if v not in valid_statuses:
-            raise ValueError(f"Status must be one of {valid_statuses}")
+        if v not in TASK_STATUSES:
+            raise ValueError(f"Status must be one of {TASK_STATUSES}")
         return v
     
     def to_dict(self) -> Dict[str, Any]:
@@ -79,7 +86,8 @@ class Task(BaseModel):
             "description": self.description,
             "jira_ticket": self.jira_ticket,
             "status": self.status,
-            "assigned_to": self.assigned_to
+            "assigned_to": self.assigned_to,
+            "duration_days": self.duration_days
         }
     
     @classmethod
@@ -98,9 +106,10 @@ class SubProject(BaseModel):
     deviation: int = 0
     assigned_to: Optional[int] = None
     
-    @validator('end_date')
-    def end_date_after_start_date(cls, v, values):
-        if 'start_date' in values and v < values['start_date']:
+    @field_validator('end_date')
+    @classmethod
+    def end_date_after_start_date(cls, v, info: ValidationInfo):
+        if 'start_date' in info.data and v < info.data['start_date']:
             raise ValueError('End date must be after start date')
         return v
     
@@ -137,9 +146,10 @@ class Project(BaseModel):
     deviation: int = 0
     assigned_to: Optional[int] = None
     
-    @validator('end_date')
-    def end_date_after_start_date(cls, v, values):
-        if 'start_date' in values and v < values['start_date']:
+    @field_validator('end_date')
+    @classmethod
+    def end_date_after_start_date(cls, v, info: ValidationInfo):
+        if 'start_date' in info.data and v < info.data['start_date']:
             raise ValueError('End date must be after start date')
         return v
     
@@ -196,6 +206,8 @@ class Reminder(BaseModel):
     reminder_date: date
     note: str
     followed_up: bool = False
+    # Set by the reminder scheduler; not written back by to_dict
+    announced_at: Optional[datetime] = None
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert model to dictionary for database storage"""
@@ -216,4 +228,101 @@ class Reminder(BaseModel):
         # Convert integer to boolean for followed_up
         if 'followed_up' in data and isinstance(data['followed_up'], int):
             data['followed_up'] = bool(data['followed_up'])
-        return cls(**data) 
\ No newline at end of file
+        return cls(**data)
+
+# Fast hydration of trusted rows read from our own database
+
+M = TypeVar('M', bound=BaseModel)
+
+def _parse_date(value):
+    """Parse a stored ISO date, ignoring any time part"""
+    return date.fromisoformat(value[:10]) if isinstance(value, str) else value
+
+def _parse_datetime(value):
+    """Parse a stored ISO datetime"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if isinstance(value, str) else value
+
+def _parse_bool(value):
+    """Parse a stored 0/1 flag"""
+    return bool(value) if value is not None else value
+
+# Converters from the stored representation, by field type
+_FIELD_PARSERS: Dict[type, Callable[[Any], Any]] = {
+    datetime: _parse_datetime,
+    date: _parse_date,
+    bool: _parse_bool,
+}
+
+@lru_cache(maxsize=None)
+def _row_parsers(model_class: Type[BaseModel], columns: Tuple[str, ...]) -> Tuple[Optional[Callable[[Any], Any]], ...]:
+    """Get the converter for each column of a row (None if it's stored as-is)"""
+    parsers = []
+    for column in columns:
+        field = model_class.model_fields.get(column)
+        annotation = field.annotation if field else None
+        # Unwrap Optional[X]
+        types = [arg for arg in get_args(annotation) if arg is not type(None)] or [annotation]
+        parsers.append(next((_FIELD_PARSERS[t] for t in types if t in _FIELD_PARSERS), None))
+    return tuple(parsers)
+
+# Defaults that are safe to share between instances
+_IMMUTABLE_DEFAULTS = (type(None), bool, int, float, str, bytes, date, datetime, tuple, frozenset)
+
+@lru_cache(maxsize=None)
+def _missing_defaults(model_class: Type[BaseModel], columns: Tuple[str, ...]) -> Tuple[Dict[str, Any], Dict[str, Callable[[], Any]]]:
+    """
+    Get the defaults of fields that aren't among the columns
+
+    Returns (values, factories): immutable defaults to share, and for the
+    rest a factory to call for each instance (default_factory, or a copy
+    of a mutable default), so nothing is computed once and reused.
+    """
+    values, factories = {}, {}
+    for name, field in model_class.model_fields.items():
+        if name in columns:
+            continue
+        if field.default_factory is not None:
+            factories[name] = field.default_factory
+        elif isinstance(field.default, _IMMUTABLE_DEFAULTS):
+            values[name] = field.default
+        else:
+            factories[name] = partial(deepcopy, field.default)
+    return values, factories
+
+def from_db_rows(model_class: Type[M], columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> List[M]:
+    """
+    Build models from rows that come straight from our own database
+
+    Rows written through the models are already valid, so this skips
+    pydantic validation entirely and only turns stored dates, datetimes
+    and 0/1 flags back into Python values. The instances are assembled
+    directly, which is what model_construct does minus its per-field
+    bookkeeping. Use from_dict for anything that comes from user input.
+    """
+    columns = tuple(columns)
+    parsers = _row_parsers(model_class, columns)
+    defaults, factories = _missing_defaults(model_class, columns)
+    fields_set = frozenset(columns).intersection(model_class.model_fields)
+    new = object.__new__
+    set_attr = object.__setattr__
+
+    # Only the columns that need converting are touched per row
+    converted = [(column, parser) for column, parser in zip(columns, parsers) if parser]
+
+    models = []
+    for row in rows:
+        values = dict(zip(columns, row))
+        for column, parser in converted:
+            values[column] = parser(values[column])
+        if defaults:
+            values.update(defaults)
+        for name, factory in factories.items():
+            values[name] = factory()
+        model = new(model_class)
+        set_attr(model, '__dict__', values)
+        # Each instance needs its own set: assignment adds to it
+        set_attr(model, '__pydantic_fields_set__', set(fields_set))
+        set_attr(model, '__pydantic_extra__', None)
+        set_attr(model, '__pydantic_private__', None)
+        models.append(model)
+    return models
@@ -0,0 +1,270 @@
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profiling is cheap (a timer and a dict update per query), so it's on by
+# default; set PROJECTFORGE_PROFILING=0 to turn it off entirely
+PROFILING_ENABLED = os.environ.get('PROJECTFORGE_PROFILING', '1') != '0'
+
+# Queries slower than this are counted as slow and sampled (milliseconds)
+SLOW_QUERY_MS = float(os.environ.get('PROJECTFORGE_SLOW_QUERY_MS', '50'))
+
+# Capture EXPLAIN QUERY PLAN the first time a read query is slow
+EXPLAIN_SLOW_QUERIES = os.environ.get('PROJECTFORGE_EXPLAIN_SLOW_QUERIES', '1') != '0'
+
+# Most recent slow queries kept with their details
+SLOW_QUERY_SAMPLES = int(os.environ.get('PROJECTFORGE_SLOW_QUERY_SAMPLES', '50'))
+
+# Optionally write the Prometheus export to a file every interval (seconds),
+# e.g. for node_exporter's textfile collector
+METRICS_FILE = os.environ.get('PROJECTFORGE_METRICS_FILE')
+METRICS_INTERVAL = float(os.environ.get('PROJECTFORGE_METRICS_INTERVAL', '15'))
+
+# Frames in these files are skipped when looking for a query's call site
+_INTERNAL_FILES = tuple(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ('database.py', 'cache.py', 'profiling.py')
+)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace, literals and IN lists so variants of a query aggregate together"""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+def query_id(normalized: str) -> str:
+    """Short stable identifier of a normalized query"""
+    return hashlib.sha1(normalized.encode()).hexdigest()[:10]
+
+@lru_cache(maxsize=4096)
+def _format_site(filename: str, lineno: int, function: str) -> str:
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    return f"{filename}:{lineno} ({function})"
+
+def _call_site() -> str:
+    """The first frame outside the database layer, as path:line (function)"""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename.startswith(_INTERNAL_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return _format_site(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+class _PageLocal(threading.local):
+    # Counters of the page being rendered on this thread, if any
+    page: Optional[Dict[str, Any]] = None
+
+class Profiler:
+    """
+    In-process query and page timing aggregates.
+
+    Queries are aggregated by normalized SQL; pages by name. The most recent
+    slow queries are kept with their parameters, call site and (for reads)
+    query plan. Everything is held in a few dicts behind one lock, so the
+    cost per query is a timer, a cached normalization and a dict update.
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, explain: bool = EXPLAIN_SLOW_QUERIES,
+                 samples: int = SLOW_QUERY_SAMPLES):
+        self.slow_seconds = slow_ms / 1000
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._queries: Dict[str, Dict[str, Any]] = {}
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._slow: deque = deque(maxlen=samples)
+        self._local = _PageLocal()
+
+    def record_query(self, sql: str, params, seconds: float, rows: int,
+                     conn: Optional[sqlite3.Connection] = None):
+        normalized = normalize_sql(sql)
+        site = _call_site()
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            stats = self._queries.get(normalized)
+            if stats is None:
+                stats = self._queries[normalized] = {
+                    "id": query_id(normalized), "sql": normalized, "calls": 0, "seconds": 0.0,
+                    "max_seconds": 0.0, "rows": 0, "slow": 0, "call_sites": {}, "plan": None,
+                }
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["rows"] += rows
+            # Bounded, so a query called from many places can't grow forever
+            if site in stats["call_sites"] or len(stats["call_sites"]) < 10:
+                stats["call_sites"][site] = stats["call_sites"].get(site, 0) + 1
+            if slow:
+                stats["slow"] += 1
+            want_plan = slow and self.explain and conn is not None and stats["plan"] is None \
+                and normalized.upper().startswith(("SELECT", "WITH"))
+        page = self._local.page
+        if page is not None:
+            page["queries"] += 1
+            page["query_seconds"] += seconds
+        if not slow:
+            return
+
+        plan = None
+        if want_plan:
+            try:
+                plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()]
+            except sqlite3.Error as e:
+                plan = [f"EXPLAIN failed: {e}"]
+        with self._lock:
+            if plan is not None:
+                stats["plan"] = plan
+            self._slow.append({
+                "time": time.time(), "id": stats["id"], "sql": normalized, "seconds": seconds, "rows": rows,
+                "params": repr(params)[:200] if params is not None else None, "call_site": site,
+                "plan": stats["plan"],
+            })
+
+    @contextmanager
+    def page_timer(self, name: str) -> Iterator[None]:
+        """Time a page render, counting the queries it runs on this thread"""
+        current = {"queries": 0, "query_seconds": 0.0}
+        self._local.page = current
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.page = None
+            with self._lock:
+                stats = self._pages.get(name)
+                if stats is None:
+                    stats = self._pages[name] = {
+                        "page": name, "renders": 0, "seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0,
+                        "queries": 0, "query_seconds": 0.0, "last_queries": 0,
+                    }
+                stats["renders"] += 1
+                stats["seconds"] += seconds
+                stats["max_seconds"] = max(stats["max_seconds"], seconds)
+                stats["last_seconds"] = seconds
+                stats["queries"] += current["queries"]
+                stats["query_seconds"] += current["query_seconds"]
+                stats["last_queries"] = current["queries"]
+
+    def query_stats(self) -> List[Dict[str, Any]]:
+        """Per-query aggregates, most total time first"""
+        with self._lock:
+            stats = [dict(entry, call_sites=dict(entry["call_sites"])) for entry in self._queries.values()]
+        return sorted(stats, key=lambda entry: entry["seconds"], reverse=True)
+
+    def page_stats(self) -> List[Dict[str, Any]]:
+        """Per-page render aggregates, most total time first"""
+        with self._lock:
+            stats = [dict(entry) for entry in self._pages.values()]
+        return sorted(stats, key=lambda entry: entry["seconds"], reverse=True)
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """The most recent slow queries, newest first"""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._queries.clear()
+            self._pages.clear()
+            self._slow.clear()
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def prometheus_text(profiler: Optional[Profiler] = None) -> str:
+    """Render the aggregates in the Prometheus text exposition format"""
+    profiler = profiler or _profiler
+    queries, pages = profiler.query_stats(), profiler.page_stats()
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    # SQL text goes on an info series only, so the other series stay short
+    metric("projectforge_query_info", "gauge", "Normalized SQL of each query id.",
+           [({"query": q["id"], "sql": q["sql"][:500]}, 1) for q in queries])
+    metric("projectforge_query_calls_total", "counter", "Queries executed.",
+           [({"query": q["id"]}, q["calls"]) for q in queries])
+    metric("projectforge_query_seconds_total", "counter", "Time spent executing and fetching queries.",
+           [({"query": q["id"]}, f"{q['seconds']:.6f}") for q in queries])
+    metric("projectforge_query_seconds_max", "gauge", "Slowest execution of each query.",
+           [({"query": q["id"]}, f"{q['max_seconds']:.6f}") for q in queries])
+    metric("projectforge_query_rows_total", "counter", "Rows returned or changed by queries.",
+           [({"query": q["id"]}, q["rows"]) for q in queries])
+    metric("projectforge_query_slow_total", "counter", "Queries slower than the slow query threshold.",
+           [({"query": q["id"]}, q["slow"]) for q in queries])
+    metric("projectforge_page_renders_total", "counter", "Page renders.",
+           [({"page": p["page"]}, p["renders"]) for p in pages])
+    metric("projectforge_page_render_seconds_total", "counter", "Time spent rendering pages.",
+           [({"page": p["page"]}, f"{p['seconds']:.6f}") for p in pages])
+    metric("projectforge_page_render_seconds_max", "gauge", "Slowest render of each page.",
+           [({"page": p["page"]}, f"{p['max_seconds']:.6f}") for p in pages])
+    metric("projectforge_page_queries_total", "counter", "Queries run while rendering pages.",
+           [({"page": p["page"]}, p["queries"]) for p in pages])
+    return "\n".join(lines) + "\n"
+
+class _NullProfiler(Profiler):
+    """Stand-in used when profiling is disabled"""
+
+    def record_query(self, sql, params, seconds, rows, conn=None):
+        pass
+
+    @contextmanager
+    def page_timer(self, name):
+        yield
+
+# Process-wide profiler
+_profiler: Profiler = Profiler() if PROFILING_ENABLED else _NullProfiler()
+
+record_query = _profiler.record_query
+page_timer = _profiler.page_timer
+query_stats = _profiler.query_stats
+page_stats = _profiler.page_stats
+slow_queries = _profiler.slow_queries
+reset = _profiler.reset
+
+def _write_metrics_file():
+    # Written aside and renamed, so scrapers never see a partial file
+    temp_path = f"{METRICS_FILE}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(temp_path, METRICS_FILE)
+
+def _metrics_file_loop(stop: threading.Event):
+    while not stop.wait(METRICS_INTERVAL):
+        try:
+            _write_metrics_file()
+        except OSError:
+            logger.exception("Writing metrics to %s failed", METRICS_FILE)
+
+if METRICS_FILE and PROFILING_ENABLED:
+    _metrics_stop = threading.Event()
+    threading.Thread(target=_metrics_file_loop, args=(_metrics_stop,),
+                     name="projectforge-metrics", daemon=True).start()
+    atexit.register(_metrics_stop.set)
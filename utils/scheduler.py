@@ -0,0 +1,312 @@
+import atexit
+import heapq
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time
+from email.message import EmailMessage
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+import utils.database as db
+
+logger = logging.getLogger(__name__)
+
+# Longest the scheduler sleeps without checking the clock again (seconds);
+# covers clock changes and suspend/resume
+REMINDER_MAX_SLEEP = float(os.environ.get('PROJECTFORGE_REMINDER_MAX_SLEEP', '3600'))
+
+# Wait before retrying after loading the reminders failed (seconds)
+REMINDER_RETRY_DELAY = float(os.environ.get('PROJECTFORGE_REMINDER_RETRY_DELAY', '30'))
+
+# Due reminders waiting to be delivered to the notifiers
+REMINDER_QUEUE_SIZE = int(os.environ.get('PROJECTFORGE_REMINDER_QUEUE_SIZE', '1000'))
+
+# Optional delivery targets for due reminders. Point them at local
+# stand-ins, e.g. a request bin for the webhook and
+# `python -m aiosmtpd -n -l localhost:1025` for SMTP.
+REMINDER_WEBHOOK_URL = os.environ.get('PROJECTFORGE_REMINDER_WEBHOOK_URL')
+REMINDER_SMTP_HOST = os.environ.get('PROJECTFORGE_REMINDER_SMTP_HOST')
+REMINDER_SMTP_PORT = int(os.environ.get('PROJECTFORGE_REMINDER_SMTP_PORT', '1025'))
+REMINDER_SMTP_FROM = os.environ.get('PROJECTFORGE_REMINDER_SMTP_FROM', 'projectforge@localhost')
+REMINDER_SMTP_TO = os.environ.get('PROJECTFORGE_REMINDER_SMTP_TO', '')
+
+# A reminder that hasn't been followed up yet
+PendingReminder = namedtuple('PendingReminder', ['id', 'task_id', 'task_name', 'reminder_date', 'note'])
+
+def reminder_payload(reminder: PendingReminder) -> Dict[str, object]:
+    """Get the JSON-friendly form of a reminder sent to notifiers"""
+    return {
+        "id": reminder.id,
+        "task_id": reminder.task_id,
+        "task_name": reminder.task_name,
+        "reminder_date": reminder.reminder_date.isoformat(),
+        "note": reminder.note,
+    }
+
+class LogNotifier:
+    """Write due reminders to the log"""
+
+    def __call__(self, reminder: PendingReminder):
+        logger.info("Reminder due for task '%s' on %s: %s",
+                    reminder.task_name, reminder.reminder_date, reminder.note)
+
+class WebhookNotifier:
+    """POST due reminders as JSON to a webhook"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def __call__(self, reminder: PendingReminder):
+        response = self.session.post(self.url, json=reminder_payload(reminder), timeout=self.timeout)
+        response.raise_for_status()
+
+class SmtpNotifier:
+    """Email due reminders through an SMTP server"""
+
+    def __init__(self, host: str, port: int, sender: str, recipients: List[str], timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.timeout = timeout
+
+    def __call__(self, reminder: PendingReminder):
+        message = EmailMessage()
+        message["Subject"] = f"Reminder: {reminder.task_name} ({reminder.reminder_date})"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(reminder.note or "")
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+def default_notifiers() -> List[Callable[[PendingReminder], None]]:
+    """Build the notifiers configured through the environment"""
+    notifiers: List[Callable[[PendingReminder], None]] = [LogNotifier()]
+    if REMINDER_WEBHOOK_URL:
+        notifiers.append(WebhookNotifier(REMINDER_WEBHOOK_URL))
+    recipients = [address.strip() for address in REMINDER_SMTP_TO.split(',') if address.strip()]
+    if REMINDER_SMTP_HOST and recipients:
+        notifiers.append(SmtpNotifier(REMINDER_SMTP_HOST, REMINDER_SMTP_PORT, REMINDER_SMTP_FROM, recipients))
+    return notifiers
+
+class ReminderScheduler:
+    """
+    Keeps the pending reminders in memory and announces them when they fall due.
+
+    Pending reminders sit in a min-heap keyed by reminder date. A background
+    thread sleeps until the earliest of them is due, moves every due one onto
+    the ``events`` queue, and a dispatcher thread hands each event to the
+    notifiers. Writes to reminders or tasks mark the in-memory state stale;
+    it's reloaded by the next reader or by the scheduler thread, which is
+    woken up for it. A due reminder is claimed by setting its announced_at
+    before it's queued, so it's announced once, across restarts and
+    processes, until it's moved or pending again.
+    """
+
+    _STOP = object()
+
+    def __init__(self, notifiers: Optional[Iterable[Callable[[PendingReminder], None]]] = None,
+                 max_sleep: float = REMINDER_MAX_SLEEP, queue_size: int = REMINDER_QUEUE_SIZE):
+        self.notifiers = list(default_notifiers() if notifiers is None else notifiers)
+        self.max_sleep = max_sleep
+        self.events: queue.Queue = queue.Queue(queue_size)
+        self._cond = threading.Condition()
+        self._load_lock = threading.Lock()
+        self._pending: Dict[int, PendingReminder] = {}
+        self._heap: List[tuple] = []
+        self._dirty = True
+        self._running = False
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the scheduler and dispatcher threads if they aren't running yet"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._dirty = True
+            if not self._threads:
+                # Only subscribe once, even if restarted after stop()
+                db.on_tables_changed(self._on_tables_changed)
+            self._threads = [
+                threading.Thread(target=self._run, name="projectforge-reminders", daemon=True),
+                threading.Thread(target=self._dispatch, name="projectforge-reminder-notify", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop scheduling, deliver the already queued events, then stop the threads"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._threads[0].join(timeout)
+        self.events.put(self._STOP)
+        self._threads[1].join(timeout)
+
+    def due(self) -> List[PendingReminder]:
+        """Get the reminders due today or earlier that haven't been followed up, oldest first"""
+        self._refresh()
+        today = date.today()
+        with self._cond:
+            due = [reminder for reminder in self._pending.values() if reminder.reminder_date <= today]
+        return sorted(due, key=lambda reminder: (reminder.reminder_date, reminder.id))
+
+    def pending_for_tasks(self, task_ids: Iterable[int]) -> List[PendingReminder]:
+        """Get the pending reminders of some tasks: today's first, then overdue, then upcoming"""
+        self._refresh()
+        task_ids = set(task_ids)
+        today = date.today()
+        with self._cond:
+            pending = [reminder for reminder in self._pending.values() if reminder.task_id in task_ids]
+        return sorted(pending, key=lambda reminder: (
+            0 if reminder.reminder_date == today else 1 if reminder.reminder_date < today else 2,
+            reminder.reminder_date,
+            reminder.id,
+        ))
+
+    def _on_tables_changed(self, tables: set):
+        # Called on the writer thread, so only flag and wake up
+        if 'reminders' in tables or 'tasks' in tables:
+            with self._cond:
+                self._dirty = True
+                self._cond.notify_all()
+
+    def _load(self) -> Tuple[List[PendingReminder], Set[int]]:
+        """Get the pending reminders and the ids of those already announced"""
+        rows = db.execute_query("""
+            SELECT r.id, r.task_id, t.name, r.reminder_date, r.note, r.announced_at
+            FROM reminders r
+            JOIN tasks t ON r.task_id = t.id
+            WHERE r.followed_up = 0
+        """)
+        reminders = []
+        announced = set()
+        for reminder_id, task_id, task_name, reminder_date, note, announced_at in rows:
+            try:
+                day = date.fromisoformat(reminder_date[:10])
+            except (TypeError, ValueError):
+                logger.warning("Skipping reminder %s with invalid date %r", reminder_id, reminder_date)
+                continue
+            reminders.append(PendingReminder(reminder_id, task_id, task_name, day, note))
+            if announced_at is not None:
+                announced.add(reminder_id)
+        return reminders, announced
+
+    def _refresh(self):
+        """Reload the pending reminders if they were written since the last load"""
+        with self._load_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                # Cleared first so a write landing during the load flags again
+                self._dirty = False
+            try:
+                reminders, announced = self._load()
+            except Exception:
+                with self._cond:
+                    self._dirty = True
+                raise
+            with self._cond:
+                self._pending = {reminder.id: reminder for reminder in reminders}
+                # Only reminders still to announce wait in the heap
+                self._heap = [(reminder.reminder_date, reminder.id) for reminder in reminders
+                              if reminder.id not in announced]
+                heapq.heapify(self._heap)
+                self._cond.notify_all()
+
+    def _pop_due(self) -> List[PendingReminder]:
+        """Take the newly due reminders off the heap (call with the lock held)"""
+        today = date.today()
+        due = []
+        while self._heap and self._heap[0][0] <= today:
+            _, reminder_id = heapq.heappop(self._heap)
+            reminder = self._pending.get(reminder_id)
+            if reminder is not None:
+                due.append(reminder)
+        return due
+
+    def _claim(self, reminders: List[PendingReminder]) -> List[PendingReminder]:
+        """
+        Mark due reminders announced, in one write, and return those this call claimed
+
+        Reminders followed up or announced (by another process) meanwhile
+        are left out.
+        """
+        if not reminders:
+            return []
+        claimed = {reminder_id for reminder_id, in db.execute_write("""
+            UPDATE reminders SET announced_at = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND announced_at IS NULL AND followed_up = 0
+            RETURNING id
+        """, (datetime.now().isoformat(timespec='seconds'),
+              json.dumps([reminder.id for reminder in reminders]))).rows}
+        return [reminder for reminder in reminders if reminder.id in claimed]
+
+    def _seconds_until_next(self) -> float:
+        """Time until the earliest reminder in the heap is due (call with the lock held)"""
+        if not self._heap:
+            return self.max_sleep
+        wake_at = datetime.combine(self._heap[0][0], time.min)
+        return max(0.0, min((wake_at - datetime.now()).total_seconds(), self.max_sleep))
+
+    def _run(self):
+        while True:
+            try:
+                self._refresh()
+                retry_in = None
+            except Exception:
+                logger.exception("Loading pending reminders failed")
+                retry_in = REMINDER_RETRY_DELAY
+            with self._cond:
+                if not self._running:
+                    return
+                due = self._pop_due()
+                if retry_in is not None:
+                    self._cond.wait(retry_in)
+                elif not due and not self._dirty:
+                    self._cond.wait(self._seconds_until_next())
+            try:
+                due = self._claim(due)
+            except Exception:
+                logger.exception("Claiming due reminders failed")
+                # They're still unannounced in the database: reload them later
+                with self._cond:
+                    self._dirty = True
+                    self._cond.wait(REMINDER_RETRY_DELAY)
+                due = []
+            for reminder in due:
+                try:
+                    self.events.put_nowait(reminder)
+                except queue.Full:
+                    logger.warning("Reminder queue is full, dropped reminder %s", reminder.id)
+
+    def _dispatch(self):
+        while True:
+            reminder = self.events.get()
+            if reminder is self._STOP:
+                return
+            for notify in self.notifiers:
+                try:
+                    notify(reminder)
+                except Exception:
+                    logger.exception("Delivering reminder %s with %s failed", reminder.id, type(notify).__name__)
+
+# Scheduler shared by every session, started on first use
+_scheduler = ReminderScheduler()
+atexit.register(_scheduler.stop)
+
+def get_scheduler() -> ReminderScheduler:
+    """Get the process-wide reminder scheduler, starting it if needed"""
+    _scheduler.start()
+    return _scheduler